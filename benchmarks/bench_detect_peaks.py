@@ -0,0 +1,40 @@
+"""
+Benchmark of minimum peak distance suppression in
+neurphys.pacemaking.detect_peaks: the O(k log k) _mpd_keep against the
+original quadratic loop (_mpd_keep_quadratic), on noisy traces of
+increasing length.
+
+Run with: python benchmarks/bench_detect_peaks.py
+"""
+
+import timeit
+import numpy as np
+from neurphys import pacemaking
+
+
+def main(lengths=(10**4, 10**5, 10**6), mpd=50, repeat=3):
+    rng = np.random.default_rng(0)
+    print('{0:>10} {1:>10} {2:>12} {3:>12} {4:>8}'.format(
+        'samples', 'peaks', 'quadratic s', 'k log k s', 'speedup'))
+    for length in lengths:
+        x = rng.normal(size=length)
+        x[::1000] += 10
+        # candidate peaks, as detect_peaks finds them before suppression
+        ind = pacemaking.detect_peaks(x)
+        heights = x[ind]
+
+        new = min(timeit.repeat(
+            lambda: pacemaking._mpd_keep(ind, heights, mpd),
+            number=1, repeat=repeat))
+        old = min(timeit.repeat(
+            lambda: pacemaking._mpd_keep_quadratic(ind, heights, mpd),
+            number=1, repeat=repeat))
+        assert np.array_equal(pacemaking._mpd_keep(ind, heights, mpd),
+                              pacemaking._mpd_keep_quadratic(ind, heights,
+                                                             mpd))
+        print('{0:>10} {1:>10} {2:>12.4f} {3:>12.4f} {4:>8.1f}'.format(
+            length, ind.size, old, new, old / new))
+
+
+if __name__ == '__main__':
+    main()
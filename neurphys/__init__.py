@@ -8,6 +8,9 @@ and calcium imaging data
 
 __version__ = '0.1.0'
 
+from . import cache
+from . import backend
+from . import bursts
 from . import calcium
 from . import membrane
 from . import nuplot
@@ -15,5 +18,8 @@ from . import oscillation
 from . import pacemaking
 from . import read_abf
 from . import read_pv
+from . import smoothing
+from . import spikes
+from . import sweeparray
 from . import synaptics
 from . import utilities
@@ -0,0 +1,33 @@
+"""
+Optional compiled backend for the innermost loops of the analyses.
+
+When numba is installed, pacemaking.detect_peaks (minimum peak distance),
+smoothing.running_mean (and so utilities.simple_smoothing) and the
+oscillation epoch functions run compiled loops; otherwise they run their
+NumPy code, which gives the same results. The backend is picked once, at
+import: BACKEND is 'numba' or 'numpy', and setting NEURPHYS_NUMBA=0 in the
+environment keeps the NumPy code even when numba is installed.
+"""
+
+import os
+
+try:
+    if os.environ.get('NEURPHYS_NUMBA', '1') == '0':
+        raise ImportError('numba disabled by NEURPHYS_NUMBA')
+    import numba
+except ImportError:
+    numba = None
+
+BACKEND = 'numpy' if numba is None else 'numba'
+
+
+def jit(func):
+    """
+    func compiled in nopython mode (on its first call, cached on disk), or
+    None without numba. Modules keep the plain Python function for the
+    NumPy backend and call the compiled one when BACKEND is 'numba'.
+    """
+    if numba is None:
+        return None
+
+    return numba.njit(cache=True, nogil=True)(func)
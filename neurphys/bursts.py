@@ -0,0 +1,212 @@
+""" Functions to detect bursts in spike trains """
+
+import numpy as np
+import pandas as pd
+from scipy.special import gammainc
+
+
+def _spike_train(spikes, by, time):
+    """
+    Spike times, True for the first spike of every train and the frame of
+    train keys (None for an array of times). Trains are runs of rows
+    with the same `by` values.
+    """
+    if isinstance(spikes, pd.DataFrame):
+        times = spikes[time].values.astype('float64')
+        by = [] if by is None else [by] if isinstance(by, str) else list(by)
+        keys = spikes[by].reset_index(drop=True)
+    else:
+        times = np.asarray(spikes, dtype='float64')
+        by, keys = [], None
+
+    first = np.zeros(times.size, dtype=bool)
+    first[:1] = True
+    for col in by:
+        values = keys[col].values
+        first[1:] |= values[1:] != values[:-1]
+
+    return times, first, keys
+
+
+def _runs(flags):
+    """ Start and stop (exclusive) positions of the runs of True """
+    edges = np.diff(np.hstack((0, flags.astype('int8'), 0)))
+
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def _burst_table(times, keys, start, last, extra=None):
+    """ Table of bursts spanning spikes start to last (inclusive) """
+    table = pd.DataFrame() if keys is None else \
+        keys.iloc[start].reset_index(drop=True)
+    table['onset'] = times[start]
+    table['offset'] = times[last]
+    table['duration'] = times[last] - times[start]
+    table['spikes'] = last - start + 1
+    with np.errstate(divide='ignore'):
+        table['freq'] = (last - start) / table['duration'].values
+    for key, values in (extra or {}).items():
+        table[key] = values
+
+    return table
+
+
+def isi_bursts(spikes, onset=0.08, offset=0.16, min_spikes=2, by='sweep',
+               time='time'):
+    """Bursts by inter-spike interval thresholds
+
+    A burst starts at the first interval shorter than onset and lasts as
+    long as the intervals stay no longer than offset, the criteria Grace and
+    Bunney (1984) used for dopaminergic neurons. Runs in O(n) over all
+    spikes of all trains at once.
+
+    Parameters
+    ----------
+    spikes: dataframe or 1D array
+        spike times of one or more trains, e.g. from
+        pacemaking.spike_table, or those of several cells joined with
+        pd.concat and a cell column. Rows should be ordered by train and
+        time; a train is a run of rows with the same `by` values.
+    onset: number (seconds), default = 0.08
+    offset: number (seconds), default = 0.16
+    min_spikes: int, default = 2
+        smallest number of spikes in a burst
+    by: str, list of str or None, default = 'sweep'
+        columns identifying the trains
+    time: str, default = 'time'
+        column holding the spike times
+
+    Return
+    ------
+    bursts: dataframe with one row per burst: the `by` columns, onset and
+        offset (times of the first and last spike), duration (seconds),
+        spikes (count) and freq (mean intra-burst frequency, Hz)
+    """
+    times, first, keys = _spike_train(spikes, by, time)
+    isi = np.diff(times)
+    # intervals between trains never join spikes
+    isi[first[1:]] = np.inf
+
+    within = isi <= offset
+    starts = np.cumsum(within & (isi < onset))
+    # onset intervals counted up to the last interval that ended a burst
+    before = np.maximum.accumulate(np.where(within, 0, starts))
+    run_start, run_stop = _runs(within & (starts > before))
+
+    keep = run_stop - run_start + 1 >= min_spikes
+    return _burst_table(times, keys, run_start[keep], run_stop[keep])
+
+
+def _surprise(times, rate, start, last):
+    """ Poisson surprise, -log10 P(at least n spikes), of spikes start-last """
+    n = last - start + 1
+    with np.errstate(divide='ignore'):
+        return -np.log10(gammainc(n, rate * (times[last] - times[start])))
+
+
+def _best_step(scores, num_steps, size, block=1024):
+    """
+    First step in range(num_steps) with the largest score, and that score,
+    for each of `size` bursts. scores(steps) gives the (bursts x steps)
+    matrix, built block by block to bound memory.
+    """
+    best = np.zeros(size, dtype=np.intp)
+    top = np.full(size, -np.inf)
+    rows = np.arange(size)
+    for first in range(0, num_steps, block):
+        steps = np.arange(first, min(first + block, num_steps))
+        block_scores = scores(steps)
+        i = block_scores.argmax(axis=1)
+        better = block_scores[rows, i] > top
+        best[better] = steps[i[better]]
+        top[better] = block_scores[rows, i][better]
+
+    return best, top
+
+
+def poisson_bursts(spikes, min_spikes=3, min_surprise=3., extend=None,
+                   by='sweep', time='time'):
+    """Bursts by Poisson surprise (Legendy and Salcman, 1985)
+
+    Runs of at least min_spikes spikes with intervals shorter than half the
+    mean interval of their train are burst candidates. Each candidate is
+    extended by the following spikes of its train, keeping the end with
+    the largest surprise, then shortened by leading spikes in the same
+    way. Surprise is -log10 of the probability of at least as many spikes
+    in the burst's duration for a Poisson train with the train's mean
+    rate. All candidates are handled at once, one block of steps at a
+    time, followed by one pass over the bursts to drop overlaps.
+
+    Parameters
+    ----------
+    spikes, by, time:
+        see isi_bursts
+    min_spikes: int, default = 3
+        smallest number of spikes in a burst
+    min_surprise: number, default = 3
+        smallest surprise of a burst
+    extend: int or None, default = None
+        largest number of spikes a candidate can grow or shrink by. None
+        searches up to the end of the train and down to min_spikes
+        spikes; an int bounds the search, and so the run time, at
+        O(n * extend).
+
+    Notes
+    -----
+    A burst overlapping an earlier burst (after extension) is dropped;
+    candidates below min_surprise don't count as earlier bursts.
+
+    Return
+    ------
+    bursts: dataframe, see isi_bursts, with an extra surprise column
+    """
+    times, first, keys = _spike_train(spikes, by, time)
+    train = np.cumsum(first) - 1
+    bounds = np.append(np.flatnonzero(first), times.size)
+    counts = np.diff(bounds)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rates = (counts - 1) / (times[bounds[1:] - 1] - times[bounds[:-1]])
+    rate = rates[train]
+
+    isi = np.diff(times)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        short = (isi < 0.5 / rate[:-1]) & ~first[1:]
+    start, stop = _runs(short)
+    keep = stop - start + 1 >= min_spikes
+    start, last = start[keep], stop[keep]
+
+    # candidate (bursts x steps) matrices of ends, then of starts
+    def end_scores(steps):
+        ends = np.minimum(last[:, None] + steps, times.size - 1)
+        valid = train[ends] == train[start][:, None]
+        return np.where(valid, _surprise(times, rate[start][:, None],
+                                         start[:, None], ends), -np.inf)
+
+    def start_scores(steps):
+        starts = np.minimum(start[:, None] + steps, last[:, None])
+        valid = last[:, None] - start[:, None] - steps + 1 >= min_spikes
+        return np.where(valid, _surprise(times, rate[start][:, None],
+                                         starts, last[:, None]), -np.inf)
+
+    if extend is None:
+        grow = (bounds[train[last] + 1] - 1 - last).max(initial=0)
+        shrink = (last - start + 1 - min_spikes).max(initial=0)
+    else:
+        grow = shrink = extend
+    steps, _ = _best_step(end_scores, grow + 1, last.size)
+    last = last + steps
+    steps, surprise = _best_step(start_scores, shrink + 1, start.size)
+    start = start + steps
+
+    # overlaps are resolved against the bursts kept so far only, so a
+    # candidate dropped for its surprise never hides a later one
+    keep = surprise >= min_surprise
+    previous = -1
+    for i in np.flatnonzero(keep):
+        if start[i] <= previous:
+            keep[i] = False
+        else:
+            previous = last[i]
+
+    return _burst_table(times, keys, start[keep], last[keep],
+                        {'surprise': surprise[keep]})
@@ -0,0 +1,303 @@
+"""
+Opt-in on-disk cache for parsed recordings.
+
+Parsed DataFrames are stored in a columnar binary layout (one
+(columns x rows) .npy array per dtype plus the index codes) so warm loads
+simply memory-map them back. Entries are keyed on the source paths and
+validated against their size, modification time and a content hash; stale
+entries are discarded and the cache directory is kept under a size cap by
+evicting the least recently used entries.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+import pandas as pd
+
+CACHE_DIR = os.environ.get('NEURPHYS_CACHE',
+                           os.path.join(os.path.expanduser('~'), '.cache',
+                                        'neurphys'))
+MAX_SIZE = 2 * 1024**3
+# bytes hashed at the start and end of each source file
+HASH_BYTES = 1 << 16
+
+
+def _content_hash(filepath):
+    """
+    Hashes the size, the first and the last HASH_BYTES of a file. Cheap
+    enough for multi-GB recordings while still catching rewritten files
+    whose size and mtime happen to match.
+    """
+    size = os.path.getsize(filepath)
+    h = hashlib.sha1(str(size).encode())
+    with open(filepath, 'rb') as f:
+        h.update(f.read(HASH_BYTES))
+        if size > HASH_BYTES:
+            f.seek(max(size - HASH_BYTES, HASH_BYTES))
+            h.update(f.read())
+
+    return h.hexdigest()
+
+
+def signature(sources):
+    """
+    Path, size, mtime and content hash of every source file, used to
+    decide whether a cache entry is still valid.
+    """
+    sig = []
+    for source in sorted(sources):
+        stat = os.stat(source)
+        sig.append([os.path.abspath(source), stat.st_size, stat.st_mtime_ns,
+                    _content_hash(source)])
+
+    return sig
+
+
+def _to_json(obj):
+    """ JSON fallback for numpy values stored in df.attrs """
+    if isinstance(obj, (np.ndarray, np.generic)):
+        return obj.tolist()
+    raise TypeError('{0!r} is not JSON serializable'.format(obj))
+
+
+def save_frame(directory, df, name='frame'):
+    """
+    Writes a DataFrame into `directory` in a columnar binary layout.
+
+    Columns are grouped by dtype into (columns x rows) arrays so a single
+    memory map per group can back the reloaded frame without copies. The
+    index is stored as per-level values plus integer codes.
+
+    Parameters
+    ----------
+    directory: str
+        Existing directory to write into.
+    df: DataFrame
+        Frame with numeric columns and any (Multi)Index.
+    name: str (default: 'frame')
+        Prefix of the written files, so several frames can share a
+        directory.
+    """
+    meta = {'columns': [str(col) for col in df.columns], 'blocks': []}
+
+    dtypes = df.dtypes
+    for i, dtype in enumerate(pd.unique(dtypes)):
+        cols = [col for col in df.columns if dtypes[col] == dtype]
+        block = np.empty((len(cols), len(df)), dtype=dtype)
+        for j, col in enumerate(cols):
+            block[j] = df[col].values
+        np.save(os.path.join(directory, '{0}.block{1}.npy'.format(name, i)),
+                block)
+        meta['blocks'].append([str(col) for col in cols])
+
+    index = df.index
+    if not isinstance(index, pd.MultiIndex):
+        index = pd.MultiIndex.from_arrays([index])
+    meta['index_names'] = list(index.names)
+    meta['levels'] = []
+    for i, level in enumerate(index.levels):
+        if level.dtype.kind in 'biuf':
+            np.save(os.path.join(directory,
+                                 '{0}.level{1}.npy'.format(name, i)),
+                    level.values)
+            meta['levels'].append(None)
+        else:
+            meta['levels'].append([str(val) for val in level])
+    np.save(os.path.join(directory, '{0}.codes.npy'.format(name)),
+            np.vstack([np.asarray(codes) for codes in index.codes]))
+    meta['multi'] = isinstance(df.index, pd.MultiIndex)
+    meta['attrs'] = df.attrs
+
+    with open(os.path.join(directory, '{0}.json'.format(name)), 'w') as f:
+        json.dump(meta, f, default=_to_json)
+
+
+def load_frame(directory, name='frame', mmap=True):
+    """
+    Reads a DataFrame written by save_frame.
+
+    Parameters
+    ----------
+    directory: str
+    name: str (default: 'frame')
+    mmap: bool (default: True)
+        Memory-map the column blocks (copy-on-write, so the frame can be
+        modified in place without touching the files) instead of reading
+        them into memory.
+
+    Return
+    ------
+    df: DataFrame
+    """
+    mmap_mode = 'c' if mmap else None
+    with open(os.path.join(directory, '{0}.json'.format(name))) as f:
+        meta = json.load(f)
+
+    codes = np.load(os.path.join(directory, '{0}.codes.npy'.format(name)))
+    levels = []
+    for i, level in enumerate(meta['levels']):
+        if level is None:
+            level = np.load(os.path.join(directory,
+                                         '{0}.level{1}.npy'.format(name, i)))
+        levels.append(level)
+    index = pd.MultiIndex(levels=levels, codes=list(codes),
+                          names=meta['index_names'])
+    if not meta['multi']:
+        index = index.get_level_values(0)
+
+    frames = []
+    for i, cols in enumerate(meta['blocks']):
+        block = np.load(os.path.join(directory,
+                                     '{0}.block{1}.npy'.format(name, i)),
+                        mmap_mode=mmap_mode)
+        frames.append(pd.DataFrame(block.T, index=index, columns=cols,
+                                   copy=False))
+    if len(frames) == 1:
+        df = frames[0]
+    else:
+        df = pd.concat(frames, axis=1)[meta['columns']]
+    df.attrs.update(meta.get('attrs', {}))
+
+    return df
+
+
+def _entry_dir(key, sources, cache_dir):
+    """
+    Directory of the cache entry for a reader key and its sources. Named
+    after the sorted source paths, so a changed source maps to the same,
+    now stale, entry while different sets of files from one folder get
+    entries of their own. Entries of renamed or deleted sources are left
+    to the LRU eviction.
+    """
+    h = hashlib.sha1(key.encode())
+    for source in sorted(os.path.abspath(source) for source in sources):
+        h.update(b'\0' + source.encode())
+
+    return os.path.join(cache_dir, h.hexdigest())
+
+
+def _entry_size(entry):
+    return sum(os.path.getsize(os.path.join(entry, f))
+               for f in os.listdir(entry))
+
+
+def lookup(key, sources, cache_dir=None):
+    """
+    Returns the cached frames for `sources`, or None if there is no valid
+    entry. Entries whose sources changed since they were written are
+    removed.
+
+    Parameters
+    ----------
+    key: str
+        Identifies the reader (and any reader options) that produced the
+        entry, e.g. 'read_abf:neo' or 'read_abf:mmap:notime'.
+    sources: list of str
+        Files the entry was parsed from.
+    cache_dir: str or None (default)
+        Defaults to CACHE_DIR.
+
+    Return
+    ------
+    frames: dict or None
+        Frame name: DataFrame (or None) pairs plus an 'extra' key holding
+        the JSON metadata passed to store.
+    """
+    cache_dir = CACHE_DIR if cache_dir is None else cache_dir
+    entry = _entry_dir(key, sources, cache_dir)
+    entry_file = os.path.join(entry, 'entry.json')
+    if not os.path.exists(entry_file):
+        return None
+
+    with open(entry_file) as f:
+        meta = json.load(f)
+    if meta['signature'] != signature(sources):
+        shutil.rmtree(entry, ignore_errors=True)
+        return None
+
+    # last use time drives the LRU eviction
+    os.utime(entry_file)
+    frames = {name: load_frame(entry, name) if stored else None
+              for name, stored in meta['frames'].items()}
+    frames['extra'] = meta['extra']
+
+    return frames
+
+
+def store(key, sources, frames, extra=None, cache_dir=None, max_size=None):
+    """
+    Writes frames parsed from `sources` into the cache, then evicts least
+    recently used entries until the cache is under `max_size` bytes.
+
+    Parameters
+    ----------
+    key: str
+        See lookup.
+    sources: list of str
+        Files the frames were parsed from.
+    frames: dict
+        Frame name: DataFrame (or None) pairs.
+    extra: JSON serializable (default: None)
+        Any metadata to return along with the frames.
+    cache_dir: str or None (default)
+        Defaults to CACHE_DIR.
+    max_size: int or None (default)
+        Defaults to MAX_SIZE.
+    """
+    cache_dir = CACHE_DIR if cache_dir is None else cache_dir
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    entry = _entry_dir(key, sources, cache_dir)
+
+    # write next to the final location and swap in, so readers never see
+    # a half-written entry
+    tmp = tempfile.mkdtemp(dir=cache_dir, prefix='.tmp')
+    try:
+        for name, df in frames.items():
+            if df is not None:
+                save_frame(tmp, df, name)
+        meta = {'key': key, 'signature': signature(sources), 'extra': extra,
+                'frames': {name: df is not None
+                           for name, df in frames.items()}}
+        with open(os.path.join(tmp, 'entry.json'), 'w') as f:
+            json.dump(meta, f)
+        shutil.rmtree(entry, ignore_errors=True)
+        os.rename(tmp, entry)
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+    evict(cache_dir, max_size)
+
+
+def evict(cache_dir=None, max_size=None):
+    """
+    Removes least recently used entries until the cache directory holds
+    at most `max_size` bytes.
+    """
+    cache_dir = CACHE_DIR if cache_dir is None else cache_dir
+    max_size = MAX_SIZE if max_size is None else max_size
+    entries = []
+    for name in os.listdir(cache_dir):
+        entry = os.path.join(cache_dir, name)
+        entry_file = os.path.join(entry, 'entry.json')
+        if os.path.exists(entry_file):
+            entries.append((os.path.getmtime(entry_file), _entry_size(entry),
+                            entry))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, entry in sorted(entries):
+        if total <= max_size:
+            break
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
+
+
+def clear(cache_dir=None):
+    """ Removes every entry from the cache directory """
+    cache_dir = CACHE_DIR if cache_dir is None else cache_dir
+    if os.path.isdir(cache_dir):
+        shutil.rmtree(cache_dir)
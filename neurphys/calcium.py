@@ -1,5 +1,8 @@
 """ Module for analyzing 2PLSM calcium imaging data """
 
+import numpy as np
+from .read_pv import Linescan
+
 
 def calc_ca_conc(df, profile_num, f0_start, f0_end, background,
                  kd, rf, rf_real):
@@ -8,12 +11,13 @@ def calc_ca_conc(df, profile_num, f0_start, f0_end, background,
 
     Parameters
     -----------
-    df: data as pandas dataframe
+    df: data as pandas dataframe or read_pv.Linescan
         Profiles are named with the convention Prof 1, Prof 2, etc. with
         corresponding Prof 1 time, Prof 2 time, etc. columns
-    profile_num: positive number
+    profile_num: positive number or None
         Profile number (1, 2, etc) that identifies which profile contains the
-        fluorescent values to be used to calculate calcium concentration
+        fluorescent values to be used to calculate calcium concentration.
+        With a Linescan, None calculates it for every profile at once.
     f0_start: positive number (seconds)
         designates beginning of the region over which to average to determine f0
     f0_end: positive number (seconds)
@@ -29,8 +33,24 @@ def calc_ca_conc(df, profile_num, f0_start, f0_end, background,
 
     Return
     ------
-    1D array of calcium concentration (nM) values
+    1D array of calcium concentration (nM) values. For a Linescan, a
+    (sweeps x samples) array, or (sweeps x profiles x samples) if
+    profile_num is None.
     """
+    if isinstance(df, Linescan):
+        if profile_num is None:
+            fluor = df.values - background
+            prof_times = np.broadcast_to(df.time, fluor.shape)
+        else:
+            fluor = df.profile(profile_num) - background
+            prof_times = df.profile_time(profile_num)
+        # one f0 per profile, averaged over the window of every sweep
+        f0_window = (prof_times >= f0_start) & (prof_times <= f0_end)
+        f0 = (np.where(f0_window, fluor, 0).sum(axis=(0, -1), keepdims=True)
+              / f0_window.sum(axis=(0, -1), keepdims=True))
+        fmax = f0 * (rf / rf_real)
+
+        return kd * ((1-fluor / fmax) / (fluor / fmax - (1/rf)))
 
     prof = "Prof " + str(profile_num)
     prof_time = prof + " time"
@@ -38,8 +58,14 @@ def calc_ca_conc(df, profile_num, f0_start, f0_end, background,
     ca_df = df[[prof, prof_time]].copy()
     ca_df[prof] -= background
 
-    f0 = ca_df[prof][(ca_df[prof_time] >= f0_start) &
-                     (ca_df[prof_time] <= f0_end)].mean()
+    prof_times = ca_df[prof_time].values
+    if ca_df.index.nlevels > 1:
+        f0_window = (prof_times >= f0_start) & (prof_times <= f0_end)
+    else:
+        # times of a single sweep are sorted, so use a binary search
+        f0_window = slice(np.searchsorted(prof_times, f0_start, 'left'),
+                          np.searchsorted(prof_times, f0_end, 'right'))
+    f0 = ca_df[prof].iloc[f0_window].mean()
     fmax = f0 * (rf / rf_real)
     ca_df[prof] = kd * ((1-ca_df[prof] / fmax) / (ca_df[prof] / fmax - (1/rf)))
 
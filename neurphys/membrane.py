@@ -1,6 +1,7 @@
 """ Functions for analyzing membrane properties of a cell """
 
 from scipy.integrate import trapz
+from . import sweeparray
 from . import utilities as util
 
 
@@ -11,7 +12,7 @@ def calc_mem_prop(df, bsl_start, bsl_end, pulse_start, pulse_dur, pulse_amp):
 
     Input Parameters
     -----------------
-    df: data as pandas dataframe
+    df: data as pandas dataframe or sweeparray.SweepArray
         should contain time and primary columns
     bsl_start: positive number (time, seconds)
         designates beginning of epoch to use to baseline data
@@ -37,6 +38,7 @@ def calc_mem_prop(df, bsl_start, bsl_end, pulse_start, pulse_dur, pulse_amp):
     pClamp 10: Data Acquisition and Analysis for Comprehensive
     Electrophysiology - User Guide, pages 163-166.
     """
+    df = sweeparray.as_frame(df)
     # have to make copy of df to not modify original df with calculation
     data = df.copy()
 
@@ -48,13 +50,14 @@ def calc_mem_prop(df, bsl_start, bsl_end, pulse_start, pulse_dur, pulse_amp):
     data = util.baseline(data, bsl_start, bsl_end)
 
     # i_baseline is defined as average current over baseline region
-    i_baseline = data.primary[(data.time >= bsl_start) &
-                              (data.time <= bsl_end)].mean()
+    i_baseline = data.primary.iloc[
+        util.time_window(data, bsl_start, bsl_end)].mean()
 
     # i_ss is the stead-state current during the pulse, taken between 70% and
     # 90% of pulse duration
-    i_ss = data.primary[(data.time >= pulse_start + pulse_dur*0.7) &
-                        (data.time <= pulse_start + pulse_dur*0.9)].mean()
+    i_ss = data.primary.iloc[
+        util.time_window(data, pulse_start + pulse_dur*0.7,
+                         pulse_start + pulse_dur*0.9)].mean()
 
     # calculate delta_i -- i.e. difference between baseline current amplitude
     # and steady-state current amplitude
@@ -77,7 +80,7 @@ def calc_mem_prop(df, bsl_start, bsl_end, pulse_start, pulse_dur, pulse_amp):
 
     # take integral of curve to get q1
     fit_sub = data.loc[ix1:ix2, :]
-    q1 = trapz(fit_sub.primary, fit_sub.time)
+    q1 = trapz(fit_sub.primary, util.time_values(fit_sub))
 
     # q2 is correction for charge from i_baseline to i_ss
     q2 = tau * delta_i
@@ -431,6 +431,39 @@ def nu_raster(ax, df, color='00000', **x_vline):
     return ras
 
 
+def nu_linescan(ax, ls, profile_num=1, sweeps=None, color=None):
+    """
+    Plots the traces of one linescan profile, one line per sweep, straight
+    from views onto the Linescan arrays.
+
+    Parameters
+    ----------
+    ax:
+        Matplotlib ax object.
+    ls: read_pv.Linescan
+        Linescan, e.g. from read_pv.import_folder(folder, compact=True).
+    profile_num: positive int (default: 1)
+        Profile to plot.
+    sweeps: list of str or None (default)
+        Sweeps to plot, all if None.
+    color: any valid matplotlib color or None (default)
+        Color of every line, matplotlib's color cycle if None.
+
+    Returns
+    -------
+    lines: list of matplotlib.lines.Line2D
+    """
+    if sweeps is None:
+        sweeps = range(len(ls)) if ls.sweeps is None else ls.sweeps
+
+    lines = []
+    for sweep in sweeps:
+        lines += ax.plot(ls.profile_time(profile_num, sweep),
+                         ls.profile(profile_num, sweep), color=color)
+    simple_axis(ax)
+    return lines
+
+
 def nu_violin(ax, df, cmap=False, color_list=False, no_x=False,
               outline_only=False, rug=False, **y_hline):
     """
@@ -3,10 +3,14 @@ Functions for analyzing oscillatory activity.
 """
 
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 from scipy.stats import gaussian_kde
 from scipy.signal import periodogram
 from scipy.signal import spectrogram
 import pandas as pd
+from . import backend
+from . import sweeparray
+from . import utilities as util
 
 
 def _create_epoch(df, window, step):
@@ -42,20 +46,25 @@ def _create_epoch(df, window, step):
 
     window, step = int(window), int(step)
     # if multiple sweeps, assuming all sweeps are exactly the same length
-    num_rows = df.index.levshape[1]
+    try:
+        num_rows = df.index.levshape[1]
+        sweeps = df.index.levels[0].values
+    except AttributeError:
+        # single sweep (e.g. a block from read_abf.iter_chunks)
+        num_rows = df.index.shape[0]
+        sweeps = [None]
     num_epochs = int(1 + (num_rows - window) / step)
     if num_epochs > 1000:
         raise ValueError(
             'Too many epochs. Change parameters to create <1000 epochs')
-    sweeps = df.index.levels[0].values
 
     for sweep in sweeps:
         # first index out a single sweep to prevent runover
-        sweep_df = df.loc[sweep]
+        sweep_df = df if sweep is None else df.loc[sweep]
         for epoch in range(num_epochs):  # faster than a while loop
             # have to add 0 to beginning so the first multiplication
             # has a real number result
-            data = sweep_df[(0 + step * epoch):(window + step * epoch)]
+            data = sweep_df.iloc[(0 + step * epoch):(window + step * epoch)]
             yield data
 
 
@@ -98,13 +107,84 @@ def _epoch_attr(df, window, step):
     return sweep_names, epoch_names
 
 
+def _epoch_array(df, window, step, channel):
+    """
+    The epochs _create_epoch yields, as a (sweeps x epochs x window) view
+    of one channel for the compiled epoch loops.
+    """
+    window, step = int(window), int(step)
+    sweep_names, epoch_names = _epoch_attr(df, window, step)
+    if len(epoch_names) > 1000:
+        raise ValueError(
+            'Too many epochs. Change parameters to create <1000 epochs')
+    names, values, _ = util.sweep_matrix(df, channel)
+    if isinstance(df.index, pd.MultiIndex):
+        rows = pd.Index(names).get_indexer(sweep_names)
+        if (rows < 0).any():
+            # sweeps left in the index levels but not in the rows, which
+            # _create_epoch can't select either
+            raise KeyError(list(np.asarray(sweep_names)[rows < 0]))
+        values = values[rows]
+    # float64 before taking the windows, which are then views into it
+    values = np.asarray(values, dtype='float64')
+
+    return sliding_window_view(values, window, axis=1)[
+        :, ::step][:, :len(epoch_names)]
+
+
+def _epoch_hist(epochs, edges, out):
+    """
+    np.histogram (equal bins between edges[0] and edges[-1]) of every
+    epoch, into out (sweeps x epochs x bins), following NumPy's binning
+    and rounding corrections. Compiled by numba when available, see
+    backend.
+    """
+    num_bins = edges.size - 1
+    first, last = edges[0], edges[-1]
+    for i in range(epochs.shape[0]):
+        for j in range(epochs.shape[1]):
+            for value in epochs[i, j]:
+                if not (value >= first and value <= last):
+                    continue
+                k = int((value - first) / (last - first) * num_bins)
+                if k == num_bins:
+                    k -= 1
+                if value < edges[k]:
+                    k -= 1
+                elif value >= edges[k + 1] and k != num_bins - 1:
+                    k += 1
+                out[i, j, k] += 1
+
+
+def _epoch_kde(epochs, x, out):
+    """
+    Gaussian KDE with Scott's bandwidth (as scipy.stats.gaussian_kde) of
+    every epoch, evaluated at x, into out (sweeps x epochs x len(x)).
+    Compiled by numba when available, see backend.
+    """
+    n = epochs.shape[2]
+    for i in range(epochs.shape[0]):
+        for j in range(epochs.shape[1]):
+            data = epochs[i, j]
+            mean = data.sum() / n
+            var = ((data - mean)**2).sum() / (n - 1) * n**(-2 / 5)
+            norm = 1 / np.sqrt(2 * np.pi * var) / n
+            for k in range(x.size):
+                out[i, j, k] = norm * np.exp(
+                    -0.5 * (x[k] - data)**2 / var).sum()
+
+
+_epoch_hist_jit = backend.jit(_epoch_hist)
+_epoch_kde_jit = backend.jit(_epoch_kde)
+
+
 def epoch_hist(df, window, step, channel, hist_min, hist_max, num_bins):
     """
     Create a 1D histogram for each epoch based on input parameters.
 
     Parameters
     ----------
-    df: DataFrame
+    df: DataFrame or sweeparray.SweepArray
         Pandas Dataframe from 'read_abf/pv' function.
     window: int
         Epoch size based on array index.
@@ -132,6 +212,7 @@ def epoch_hist(df, window, step, channel, hist_min, hist_max, num_bins):
     bins are truncated from original numpy function of (len(hist + 1)).
     Check numpy docs if confused.
     """
+    df = sweeparray.as_frame(df)
 
     # set up basic containers and inputs
     hist_arrays = []
@@ -144,11 +225,19 @@ def epoch_hist(df, window, step, channel, hist_min, hist_max, num_bins):
     arrays = [sweep_names, epoch_names, idx]
     index = pd.MultiIndex.from_product(arrays, names=['sweep', 'epoch', None])
 
-    for epoch in epochs:
-        hist, bins = np.histogram(epoch[channel],
-                                  bins=num_bins, range=(hist_min, hist_max))
-        hist_arrays.append(hist)
-        bin_arrays.append(bins[:-1])
+    if backend.BACKEND == 'numba':
+        values = _epoch_array(df, window, step, channel)
+        edges = np.linspace(hist_min, hist_max, num_bins + 1)
+        hist = np.zeros(values.shape[:2] + (num_bins,), dtype=np.intp)
+        _epoch_hist_jit(values, edges, hist)
+        hist_arrays = list(hist.reshape(-1, num_bins))
+        bin_arrays = [edges[:-1]] * len(hist_arrays)
+    else:
+        for epoch in epochs:
+            hist, bins = np.histogram(epoch[channel], bins=num_bins,
+                                      range=(hist_min, hist_max))
+            hist_arrays.append(hist)
+            bin_arrays.append(bins[:-1])
 
     # stitch the arrays together
     hist_concat = np.concatenate(hist_arrays, axis=0)
@@ -173,7 +262,7 @@ def epoch_kde(df, window, step, channel, range_min, range_max,
 
     Parameters
     ----------
-    df: DataFrame
+    df: DataFrame or sweeparray.SweepArray
         Pandas Dataframe from 'read_abf/pv' function.
     window: int
         Epoch size based on array index.
@@ -203,6 +292,7 @@ def epoch_kde(df, window, step, channel, range_min, range_max,
     [1] https://docs.scipy.org/doc/scipy-0.16.1/reference/generated/
     scipy.stats.gaussian_kde.html
     """
+    df = sweeparray.as_frame(df)
 
     # set up basic containers and inputs
     kde_arrays = []
@@ -221,11 +311,18 @@ def epoch_kde(df, window, step, channel, range_min, range_max,
     arrays = [sweep_names, epoch_names, idx]
     index = pd.MultiIndex.from_product(arrays, names=['sweep', 'epoch', None])
 
-    for epoch in epochs:
-        kde = gaussian_kde(epoch[channel])
-        kde_data = kde(x)
-        kde_arrays.append(kde_data)
-        x_arrays.append(x)
+    if backend.BACKEND == 'numba':
+        values = _epoch_array(df, window, step, channel)
+        kde = np.empty(values.shape[:2] + (x.size,))
+        _epoch_kde_jit(values, x, kde)
+        kde_arrays = list(kde.reshape(-1, x.size))
+        x_arrays = [x] * len(kde_arrays)
+    else:
+        for epoch in epochs:
+            kde = gaussian_kde(epoch[channel])
+            kde_data = kde(x)
+            kde_arrays.append(kde_data)
+            x_arrays.append(x)
 
     # stitch the arrays together
     kde_concat = np.concatenate(kde_arrays, axis=0)
@@ -248,7 +345,7 @@ def epoch_pgram(df, window, step, channel, fs=10e3):
 
     Parameters
     ----------
-    df: DataFrame
+    df: DataFrame or sweeparray.SweepArray
         Pandas Dataframe from 'read_abf/pv' function.
     window: int
         Epoch size based on array index.
@@ -272,6 +369,7 @@ def epoch_pgram(df, window, step, channel, fs=10e3):
     [1] https://docs.scipy.org/doc/scipy-0.16.1/reference/generated/
     scipy.signal.periodogram.html
     """
+    df = sweeparray.as_frame(df)
 
     # set up basic containers and inputs
     f_arrays = []
@@ -309,7 +407,7 @@ def nu_spectrogram(df, window, step, channel, fs=10e3, f_trim=(0,100)):
     """
     Parameters
     ----------
-    df: DataFrame
+    df: DataFrame or sweeparray.SweepArray
         Pandas Dataframe from 'read_abf/pv' function.
     window: int
         Epoch size based on array index.
@@ -329,6 +427,7 @@ def nu_spectrogram(df, window, step, channel, fs=10e3, f_trim=(0,100)):
         Spectrogram of DataFrame column labeled with frequencies added as row
         indicies and columns as segment times (left aligned).
     """
+    df = sweeparray.as_frame(df)
 
     # make sure necessary inputs are integers
     window, step, fs = int(window), int(step), int(fs)
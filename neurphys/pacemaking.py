@@ -1,6 +1,12 @@
 """ Functions to analyze pacemaking activity data """
 
 import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import as_strided, sliding_window_view
+from concurrent.futures import ProcessPoolExecutor
+from . import backend
+from . import smoothing
+from . import sweeparray
 from . import utilities as util
 from collections import OrderedDict
 
@@ -83,8 +89,8 @@ def detect_peaks(x, mph=None, mpd=1, threshold=0, edge='rising',
     # handle NaN's
     if ind.size and indnan.size:
         # NaN's and values close to NaN's cannot be peaks
-        ind = ind[np.in1d(ind, np.unique(np.hstack((indnan, indnan-1,
-                                                    indnan+1))), invert=True)]
+        ind = ind[np.isin(ind, np.unique(np.hstack((indnan, indnan-1,
+                                                   indnan+1))), invert=True)]
     # first and last values of x cannot be peaks
     if ind.size and ind[0] == 0:
         ind = ind[1:]
@@ -99,55 +105,257 @@ def detect_peaks(x, mph=None, mpd=1, threshold=0, edge='rising',
         ind = np.delete(ind, np.where(dx < threshold)[0])
     # detect small peaks closer than minimum peak distance
     if ind.size and mpd > 1:
-        ind = ind[np.argsort(x[ind])][::-1]  # sort ind by peak height
-        idel = np.zeros(ind.size, dtype=bool)
-        for i in range(ind.size):
-            if not idel[i]:
-                # keep peaks with the same height if kpsh is True
-                idel = idel | (ind >= ind[i] - mpd) & (ind <= ind[i] + mpd) \
-                    & (x[ind[i]] > x[ind] if kpsh else True)
-                idel[i] = 0  # Keep current peak
-        # remove the small peaks and sort back the indices by their occurrence
-        ind = np.sort(ind[~idel])
+        ind = ind[_mpd_keep(ind, x[ind], mpd, kpsh)]
 
     return ind
 
 
-def baseline_pacemaking(df, n=200):
+def _mpd_keep(ind, heights, mpd, kpsh=False):
+    """
+    Which of the (sorted) peak indices survive minimum peak distance
+    suppression, in O(k log k) for k peaks.
+
+    Peaks are visited from the highest down, later peaks first among equal
+    heights, as in the original quadratic loop (see _mpd_keep_quadratic). A
+    peak is kept unless a kept peak within mpd samples was visited before
+    it (with kpsh, unless a strictly higher one was). Kept peaks are
+    counted in a Fenwick tree over peak ranks, so each visit is two
+    prefix-sum queries and at most one update.
+    """
+    order = np.argsort(heights, kind='stable')[::-1]
+    # rank range [lo, hi) of the peaks within mpd of each peak
+    lo = np.searchsorted(ind, ind - mpd, 'left')
+    hi = np.searchsorted(ind, ind + mpd, 'right')
+    # peaks without neighbors within mpd are always kept and never
+    # suppress anything, so they need no visit
+    keep = hi - lo == 1
+    order = order[~keep[order]]
+
+    if backend.BACKEND == 'numba':
+        _mpd_visit_jit(order, lo, hi, heights, kpsh, keep,
+                       np.zeros(ind.size + 1, dtype=np.int64))
+    else:
+        # plain lists index faster than arrays in the Python loop
+        _mpd_visit(order.tolist(), lo.tolist(), hi.tolist(),
+                   heights.tolist(), kpsh, keep, [0] * (ind.size + 1))
+
+    return keep
+
+
+def _mpd_visit(order, lo, hi, heights, kpsh, keep, tree):
+    """
+    Fenwick tree loop of _mpd_keep: visits the peaks in order and sets
+    keep for those without a kept peak within mpd (between ranks lo and
+    hi). tree holds len(keep) + 1 zeros. Compiled by numba when available,
+    see backend.
+    """
+    size = len(tree) - 1
+    # with kpsh, kept peaks only suppress once all peaks of their height
+    # have been visited, i.e. from the position in order where the next
+    # height starts
+    start = 0
+    level = np.nan
+    for pos in range(len(order)):
+        i = order[pos]
+        if kpsh and heights[i] != level:
+            for j in order[start:pos]:
+                if keep[j]:
+                    j += 1
+                    while j <= size:
+                        tree[j] += 1
+                        j += j & -j
+            start = pos
+            level = heights[i]
+
+        count = 0
+        j = hi[i]
+        while j:
+            count += tree[j]
+            j &= j - 1
+        j = lo[i]
+        while j:
+            count -= tree[j]
+            j &= j - 1
+        if count:
+            continue
+
+        keep[i] = True
+        if not kpsh:
+            j = i + 1
+            while j <= size:
+                tree[j] += 1
+                j += j & -j
+
+
+_mpd_visit_jit = backend.jit(_mpd_visit)
+
+
+def _mpd_keep_quadratic(ind, heights, mpd, kpsh=False):
+    """
+    Original O(k**2) minimum peak distance suppression of detect_peaks,
+    kept as the reference _mpd_keep is tested and benchmarked against.
+    """
+    order = np.argsort(heights, kind='stable')[::-1]  # sort ind by height
+    ind, heights = ind[order], heights[order]
+    idel = np.zeros(ind.size, dtype=bool)
+    for i in range(ind.size):
+        if not idel[i]:
+            # keep peaks with the same height if kpsh is True
+            idel = idel | (ind >= ind[i] - mpd) & (ind <= ind[i] + mpd) \
+                & (heights[i] > heights if kpsh else True)
+            idel[i] = 0  # Keep current peak
+    keep = np.zeros(ind.size, dtype=bool)
+    keep[order[~idel]] = True
+
+    return keep
+
+
+class PeakDetector(object):
+    """
+    Resumable detect_peaks for a recording that arrives in chunks, e.g.
+    from read_abf.iter_chunks or a memory-mapped file.
+
+    Whether a sample is a peak candidate (edge, NaN, mph and threshold
+    rules) only depends on it and its two neighbors, so the last two
+    samples of every chunk are kept for the next one. Minimum peak
+    distance suppression only depends on the chain of candidates at most
+    mpd samples apart around a peak (its cluster), so candidates are held
+    back until no later sample can extend their cluster. Concatenating the
+    output of every update and of flush gives exactly what detect_peaks
+    returns for the whole recording.
+
+    Memory stays constant for any recording whose clusters are bounded,
+    which holds unless candidates keep following each other within mpd
+    samples for the whole recording.
+
+    Parameters
+    ----------
+    mph, mpd, threshold, edge, kpsh, valley:
+        see detect_peaks
+
+    Examples
+    --------
+    >>> detector = PeakDetector(mph=20, mpd=50)
+    >>> for df in read_abf.iter_chunks('cell.abf', 10):
+    ...     peaks = detector.update(df.primary.values)
+    >>> peaks = detector.flush()
+    """
+
+    def __init__(self, mph=None, mpd=1, threshold=0, edge='rising',
+                 kpsh=False, valley=False):
+        self.mph = mph
+        self.mpd = mpd
+        self.threshold = threshold
+        self.edge = edge
+        self.kpsh = kpsh
+        self.valley = valley
+        # number of samples received so far
+        self.received = 0
+        self._tail = np.array([])
+        # candidates of the cluster that is still open, and their heights
+        self._ind = np.array([], dtype=int)
+        self._heights = np.array([])
+
+    def update(self, chunk):
+        """
+        Adds a 1D chunk of samples and returns the (absolute) indices of
+        the peaks that are now final.
+        """
+        chunk = np.atleast_1d(chunk).astype('float64')
+        buffer = np.hstack((self._tail, chunk))
+        # absolute sample number of buffer[0]
+        start = self.received - self._tail.size
+        self.received += chunk.size
+        self._tail = buffer[-2:]
+
+        # candidates at buffer[1:-1], the samples between the last two of
+        # the previous chunk and the last of this one
+        ind = detect_peaks(buffer, mph=self.mph, threshold=self.threshold,
+                           edge=self.edge, valley=self.valley)
+        heights = -buffer[ind] if self.valley else buffer[ind]
+        ind = np.hstack((self._ind, start + ind))
+        heights = np.hstack((self._heights, heights))
+
+        # later candidates are at self.received - 1 or beyond; clusters
+        # ending before a gap of more than mpd can't grow anymore
+        gaps = np.flatnonzero(np.diff(np.hstack((ind, self.received - 1)))
+                              > self.mpd)
+        done = gaps[-1] + 1 if gaps.size else 0
+        self._ind, self._heights = ind[done:], heights[done:]
+
+        return self._select(ind[:done], heights[:done])
+
+    def flush(self):
+        """
+        Returns the peaks of the cluster still open at the end of the
+        recording. The last sample can't be a peak, as in detect_peaks.
+        """
+        ind = self._select(self._ind, self._heights)
+        self._ind, self._heights = self._ind[:0], self._heights[:0]
+
+        return ind
+
+    def _select(self, ind, heights):
+        if ind.size and self.mpd > 1:
+            ind = ind[_mpd_keep(ind, heights, self.mpd, self.kpsh)]
+        return ind
+
+
+def baseline_pacemaking(df, n=200, method='mean', centered=False):
     """Baseline a pacemaking (cell attached) trace by subtracting the running
     average of the trace from the trace
 
     Parameters
     ----------
-    df: data as pandas dataframe
+    df: data as pandas dataframe or sweeparray.SweepArray
         should contain time and primary columns
     n:  positive scalar, default = 200
         number of points to average for running average
+    method: string, default = 'mean'
+        running 'mean' or 'median' (less pulled by the spikes themselves),
+        see the smoothing module
+    centered: boolean, default = False
+        use a window centered on each point instead of the n points ending
+        at it
 
     Return
     ------
-    df: modified dataframe where primary column has been baselined
+    df: modified dataframe where primary column has been baselined, or a
+        new SweepArray for a SweepArray
 
     Notes
     -----
-    Simple_smoothing sets n-1 points to nan, which this function then sets to 0
-    before subtracting from the data column. What this means is that those n-1
-    values are not baselined. At the sampling frequencies normally used this
-    should not be a major concern, though.
+    The smoothing filters set the n-1 points without a complete window to
+    nan, which this function then sets to 0 before subtracting from the data
+    column. What this means is that those n-1 values are not baselined. At the sampling frequencies normally used this
+    should not be a major concern, though. A SweepArray is smoothed sweep
+    by sweep, so the n-1 points are those at the start of every sweep.
     """
-    smoothed = util.simple_smoothing(df.primary.values, n)
+    if method == 'mean':
+        running = smoothing.running_mean
+    elif method == 'median':
+        running = smoothing.running_median
+    else:
+        raise ValueError("method should be 'mean' or 'median'")
+
+    if isinstance(df, sweeparray.SweepArray):
+        values = df.channel('primary')
+        smoothed = running(values, n, centered)
+        return df._replace('primary', values - np.nan_to_num(smoothed))
+
+    smoothed = running(df.primary.values, n, centered)
     df.primary -= np.nan_to_num(smoothed)
 
     return df
 
 
 def calc_freq(df, mph, mpd, valley=False, hz=True,
-              ret_indices=False, ret_times=False):
+              ret_indices=False, ret_times=False, last_time=None):
     """Calculate instantaneous frequency of events exceeding a specific height
 
     Parameters
     ----------
-    df: data as pandas dataframe
+    df: data as pandas dataframe or sweeparray.SweepArray
         should contain time and Primary columns
     mph: number (pA or mV)
         designates minimum height of event (i.e. threshold of event)
@@ -159,6 +367,10 @@ def calc_freq(df, mph, mpd, valley=False, hz=True,
         return the indices for the detected events
     ret_times: boolean, default = False
         return the times for the detected events
+    last_time: number (seconds) or None (default)
+        time of the last event detected in the preceding part of the same
+        sweep, e.g. in the previous frame from read_abf.follow or
+        read_pv.follow, so the interval spanning the two frames is included
 
     Return
     ------
@@ -169,6 +381,7 @@ def calc_freq(df, mph, mpd, valley=False, hz=True,
     frequency array. indices and times are returned ordered in that
     order in list if both are desired (i.e. ret_vals[1] and ret_vals[2])
     """
+    df = sweeparray.as_frame(df)
 
     ret_vals = []
     if valley:
@@ -176,7 +389,9 @@ def calc_freq(df, mph, mpd, valley=False, hz=True,
                                valley=valley, mpd=mpd)
     else:
         indices = detect_peaks(df['primary'].values, mph=mph, mpd=mpd)
-    times = df.loc[indices, 'time'].values
+    times = util.time_values(df)[indices]
+    if last_time is not None:
+        times = np.hstack((last_time, times))
     times_dif = times[1:] - times[:-1]
 
     if hz:
@@ -192,6 +407,264 @@ def calc_freq(df, mph, mpd, valley=False, hz=True,
     return ret_vals[0] if len(ret_vals) == 1 else ret_vals
 
 
+def iter_freq(frames, mph, mpd, valley=False, hz=True):
+    """Streaming calc_freq over the frames of a long recording
+
+    Peaks are detected with a PeakDetector per sweep, so the events, their
+    times and the intervals between them (also across frame edges) are
+    exactly those calc_freq finds for the whole sweep at once, while only
+    one frame is in memory.
+
+    Parameters
+    ----------
+    frames: iterable of DataFrames
+        consecutive parts of one or more sweeps, e.g. from
+        read_abf.iter_chunks (leading rows repeated from the previous frame,
+        df.attrs['overlap'], are skipped), read_abf.follow or read_pv.follow.
+        Frames of a sweep should follow each other, the sweep being given
+        by df.attrs['sweep'].
+    mph, mpd, valley, hz:
+        see calc_freq
+
+    Yields
+    ------
+    sweep: str
+        df.attrs['sweep'], or None
+    freq: array
+        frequencies (Hz), or ISIs (seconds) if hz is False, of the events
+        that became final
+    indices: array
+        sample numbers (index labels) of those events within the sweep
+    times: array
+        times of those events
+
+    Notes
+    -----
+    Events are reported once no later sample can change them, so those of
+    a frame may come with the next one; the last of a sweep come when the
+    next sweep starts or the frames run out.
+    """
+    mph = abs(mph) if valley else mph
+    sweep = detector = None
+
+    def emit(indices):
+        nonlocal last_time
+        times = t0 + (first + indices) / rate
+        all_times = np.hstack((last_time, times))
+        if times.size:
+            last_time = times[-1]
+        isi = np.diff(all_times)[np.isfinite(all_times[:-1])]
+        return sweep, 1/isi if hz else isi, first + indices, times
+
+    for df in frames:
+        df = sweeparray.as_frame(df)
+        if detector is None or df.attrs.get('sweep') != sweep:
+            if detector is not None:
+                yield emit(detector.flush())
+            sweep = df.attrs.get('sweep')
+            detector = PeakDetector(mph=mph, mpd=mpd, valley=valley)
+            last_time = np.nan
+            # sample number of the first row and time axis of the sweep
+            first = df.index[df.attrs.get('overlap', 0)]
+            if 'sampling_rate' in df.attrs:
+                rate, t0 = util._time_axis(df)
+            else:
+                time = df['time'].values
+                rate = 1 / (time[1] - time[0])
+                t0 = time[0] - df.index[0] / rate
+
+        yield emit(detector.update(
+            df['primary'].values[df.attrs.get('overlap', 0):]))
+
+    if detector is not None:
+        yield emit(detector.flush())
+
+
+def _sweep_peaks(values, mph, mpd, valley):
+    """
+    Sweep (row) and sample numbers of the peaks of every row of a
+    (sweeps x samples) array, found with a single detect_peaks call.
+
+    The rows are laid end to end with mpd + 1 NaNs after each, so a row's
+    first and last samples can't be peaks and peaks of different rows are
+    never within mpd of each other, which gives the peaks detect_peaks
+    finds in each row on its own.
+    """
+    gap = max(mpd, 1) + 1
+    padded = np.full((values.shape[0], values.shape[1] + gap), np.nan)
+    padded[:, :values.shape[1]] = values
+    ind = detect_peaks(padded.ravel(), mph=mph, mpd=mpd, valley=valley)
+
+    return np.divmod(ind, padded.shape[1])
+
+
+def spike_table(df, mph, mpd, valley=False, column='primary', workers=None):
+    """Events of every sweep as one table, see calc_freq
+
+    Parameters
+    ----------
+    df: data as pandas dataframe or sweeparray.SweepArray
+        MultiIndex dataframe with sweeps as the first index level, or a
+        flat dataframe holding a single sweep
+    mph, mpd, valley:
+        see calc_freq
+    column: str (default: 'primary')
+    workers: int or None (default)
+        number of processes detecting events at the same time, each in a
+        contiguous run of sweeps; None or 1 detects in this process
+
+    Return
+    ------
+    spikes: dataframe with one row per event, ordered by sweep and time:
+        sweep (name), index (sample number within the sweep), time
+        (seconds), ISI (seconds since the previous event of the same
+        sweep) and freq (1/ISI, Hz); ISI and freq are nan for the first
+        event of each sweep
+    """
+    names, values, time = util.sweep_matrix(df, column)
+    mph = abs(mph) if valley else mph
+
+    if workers is not None and workers > 1 and len(names) > 1:
+        bounds = np.linspace(0, len(names), workers + 1).astype(int)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_sweep_peaks, values[first:stop],
+                                       mph, mpd, valley)
+                       for first, stop in zip(bounds[:-1], bounds[1:])]
+            results = [future.result() for future in futures]
+        sweeps = np.concatenate([first + sweeps for first, (sweeps, _)
+                                 in zip(bounds, results)])
+        indices = np.concatenate([indices for _, indices in results])
+    else:
+        sweeps, indices = _sweep_peaks(values, mph, mpd, valley)
+
+    times = time[indices]
+    isi = np.full(times.size, np.nan)
+    isi[1:] = np.diff(times)
+    isi[np.hstack((True, sweeps[1:] != sweeps[:-1]))[:times.size]] = np.nan
+
+    return pd.DataFrame({'sweep': np.asarray(names, dtype=object)[sweeps],
+                         'index': indices, 'time': times, 'ISI': isi,
+                         'freq': 1/isi})
+
+
+def event_waveforms(x, peaks, pre, post):
+    """Samples around every event as one (events x samples) array
+
+    Parameters
+    ----------
+    x: 1D array_like
+        trace, e.g. df.primary.values
+    peaks: 1D array of ints
+        event indices, e.g. from detect_peaks
+    pre, post: int
+        number of samples to take before and after each event
+
+    Notes
+    -----
+    Row i holds x[peaks[i] - pre:peaks[i] + post + 1]. Events at a fixed
+    spacing (e.g. evoked responses) give a read-only strided view onto x;
+    otherwise the rows are gathered from a sliding window view of x in a
+    single indexing step. Samples before the start or after the end of the
+    trace are nan, in which case the trace is copied once with nan padding.
+
+    Return
+    ------
+    waveforms: 2D array (events x pre + post + 1)
+    """
+    x = np.asarray(x, dtype='float64')
+    peaks = np.asarray(peaks, dtype=int)
+    width = pre + post + 1
+    if not peaks.size:
+        return np.empty((0, width))
+
+    starts = peaks - pre
+    if starts.min() < 0 or starts.max() + width > x.size:
+        x = np.hstack((np.full(pre, np.nan), x, np.full(post, np.nan)))
+        starts = starts + pre
+    elif peaks.size > 1 and np.all(np.diff(peaks) == peaks[1] - peaks[0]) \
+            and peaks[1] > peaks[0]:
+        step = x.strides[0]
+        return as_strided(x[starts[0]:], shape=(peaks.size, width),
+                          strides=((peaks[1] - peaks[0]) * step, step),
+                          writeable=False)
+
+    return sliding_window_view(x, width)[starts]
+
+
+def iei_waveforms(x, peaks, start=0., end=1.):
+    """Samples of a fraction of every inter-event interval as a masked array
+
+    Parameters
+    ----------
+    x: 1D array_like
+        trace, e.g. df.primary.values
+    peaks: ascending 1D array of ints
+        event indices, e.g. from detect_peaks
+    start, end: fractions (default: 0 and 1)
+        part of each interval to take; as in iei_arrays, positions are
+        peaks[i] + int(fraction * (peaks[i+1] - peaks[i]))
+
+    Return
+    ------
+    waveforms: 2D masked array (intervals x longest window)
+        row i holds the samples from the start position of interval i up
+        to (but not including) its end position; samples past the end of a
+        shorter window and nan samples are masked
+    """
+    x = np.asarray(x, dtype='float64')
+    peaks = np.asarray(peaks, dtype=int)
+    iei = np.diff(peaks)
+    first = peaks[:-1] + (iei*start).astype(int)
+    lengths = (iei*end).astype(int) - (iei*start).astype(int)
+    width = max(lengths.max() if lengths.size else 0, 0)
+    if not width:
+        return np.ma.masked_array(np.empty((lengths.size, 0)))
+
+    padded = np.hstack((x, np.full(width, np.nan)))
+    data = sliding_window_view(padded, width)[first]
+    mask = (np.arange(width) >= lengths[:, None]) | np.isnan(data)
+
+    return np.ma.masked_array(data, mask)
+
+
+def waveform_stats(waveforms, pre=0, axis=0):
+    """Mean, variance and count of event waveforms, ignoring nan and masks
+
+    Parameters
+    ----------
+    waveforms: 2D array or masked array
+        from event_waveforms or iei_waveforms
+    pre: int (default: 0)
+        samples before the event in each row, to label the samples with
+        their lag from the event
+    axis: 0 (default) or 1
+        0 averages the events sample by sample (the spike triggered
+        average), 1 summarizes each event
+
+    Return
+    ------
+    stats: dataframe with mean, var (with n - 1 degrees of freedom), sem and
+        n (number of valid samples), indexed by lag (samples from the
+        event) for axis=0 or by event for axis=1
+    """
+    data = np.ma.filled(np.ma.asarray(waveforms, dtype='float64'), np.nan)
+    valid = ~np.isnan(data)
+    n = valid.sum(axis=axis)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(valid, data, 0).sum(axis=axis) / n
+        dev = data - np.expand_dims(mean, axis)
+        var = np.where(valid, dev**2, 0).sum(axis=axis) / (n - 1)
+        sem = np.sqrt(var / n)
+
+    if axis == 0:
+        index = pd.RangeIndex(-pre, data.shape[1] - pre, name='lag')
+    else:
+        index = pd.RangeIndex(data.shape[0], name='event')
+
+    return pd.DataFrame({'mean': mean, 'var': var, 'sem': sem, 'n': n},
+                        index=index)
+
+
 def _fixed_shift(idx_array, shifts, false_array=False):
     """
     Create a series of arrays that shift the input array by a specified index
@@ -2,9 +2,21 @@
 Functions to import and manipulate Axon Binary Files.
 """
 
+import os
+import copy
+import warnings
+from time import monotonic, sleep
+from concurrent.futures import ProcessPoolExecutor
 from neo import io
+from neo.rawio import axonrawio
 import pandas as pd
 import numpy as np
+from . import cache as nucache
+from . import utilities as util
+from .sweeparray import SweepArray
+
+BLOCKSIZE = 512
+
 
 def _all_ints(ii):
     """ Determines if list or tuples contains only integers """
@@ -16,28 +28,304 @@ def _all_strs(ii):
     return all(isinstance(i, str) for i in ii)
 
 
-def read_abf(filepath):
+def _sweep_names(num_sweeps):
+    """ Standard 'sweepXXX' labels for a number of sweeps """
+    return ['sweep' + str(i + 1).zfill(3) for i in range(num_sweeps)]
+
+
+def _channel_names(num_channels):
+    """ Standard column labels for a number of recorded channels """
+    return ['primary'] + ['channel_{0}'.format(str(i + 1))
+                          for i in range(num_channels - 1)]
+
+
+def _abf_layout(filepath):
     """
-    Imports ABF file using neo io AxonIO, breaks it down by blocks
-    which are then processed into a multidimensional pandas dataframe
-    where each block corresponds to a sweep and columns represent time
-    and each recorded channel.
+    Parses the ABF header (v1 or v2) and returns everything needed to
+    address the raw data section directly: byte offset, sample dtype,
+    per-sweep sample ranges and per-channel gain/offset.
+
+    Gain and offset calculations mirror neo.rawio.AxonRawIO so both
+    engines give identical values.
+    """
+    info = axonrawio.parse_axon_soup(filepath)
+    if info is None:
+        raise IOError('{0} is not an Axon Binary File'.format(filepath))
+
+    version = info['fFileVersionNumber']
+    if info['nDataFormat'] == 0:
+        dtype = np.dtype('<i2')
+    else:
+        dtype = np.dtype('<f4')
+
+    if version < 2.0:
+        num_channels = int(info['nADCNumChannels'])
+        offset = (info['lDataSectionPtr'] * BLOCKSIZE +
+                  info['nNumPointsIgnored'] * dtype.itemsize)
+        total = int(info['lActualAcqLength'])
+        mode = info['nOperationMode']
+        num_synch = info['lSynchArraySize']
+        synch_offset = info['lSynchArrayPtr'] * BLOCKSIZE
+        episode = info['lNumSamplesPerEpisode']
+        sampling_rate = 1e6 / (info['fADCSampleInterval'] * num_channels)
+        synch_unit = info['fSynchTimeUnit']
+        adc_range = info['fADCRange']
+        adc_resolution = info['lADCResolution']
+        channel_ids = [i for i in info['nADCSamplingSeq'] if i >= 0]
+    else:
+        sections = info['sections']
+        protocol = info['protocol']
+        num_channels = int(sections['ADCSection']['llNumEntries'])
+        offset = sections['DataSection']['uBlockIndex'] * BLOCKSIZE
+        total = int(sections['DataSection']['llNumEntries'])
+        mode = protocol['nOperationMode']
+        num_synch = sections['SynchArraySection']['llNumEntries']
+        synch_offset = sections['SynchArraySection']['uBlockIndex'] * BLOCKSIZE
+        episode = protocol['lNumSamplesPerEpisode']
+        sampling_rate = 1e6 / protocol['fADCSequenceInterval']
+        synch_unit = protocol['fSynchTimeUnit']
+        adc_range = protocol['fADCRange']
+        adc_resolution = protocol['lADCResolution']
+        channel_ids = list(range(num_channels))
+
+    if num_synch > 0:
+        synch = np.fromfile(filepath, dtype=[('offset', '<i4'), ('len', '<i4')],
+                            count=num_synch, offset=synch_offset)
+    if num_synch > 0 and synch.size == num_synch:
+        starts = synch['offset'].astype('float64')
+        lengths = synch['len'].astype('float64')
+    elif num_synch > 0 and episode > 0:
+        # the synch array is written after the data, so a file still being
+        # acquired has none yet: assume back to back episodes
+        lengths = np.full(num_synch, episode, dtype='float64')
+        starts = np.arange(num_synch) * float(episode) / num_channels
+        synch_unit = 0
+    else:
+        starts = np.zeros(1)
+        lengths = np.array([total], dtype='float64')
+
+    # variable-length event-driven files store lengths in synch time units
+    if synch_unit != 0 and mode == 1:
+        lengths /= synch_unit
+    if synch_unit == 0:
+        t_starts = starts / sampling_rate
+    else:
+        t_starts = starts * synch_unit * 1e-6
+
+    lengths = lengths.astype('int64')
+    stops = np.cumsum(lengths)
+
+    names, units, gains, offsets = [], [], [], []
+    for chan_id in channel_ids:
+        if version < 2.0:
+            names.append(info['sADCChannelName'][chan_id])
+            units.append(info['sADCUnits'][chan_id])
+            adc = {key: info[key][chan_id] for key in
+                   ('fInstrumentScaleFactor', 'fSignalGain',
+                    'fADCProgrammableGain', 'nTelegraphEnable',
+                    'fTelegraphAdditGain', 'fInstrumentOffset',
+                    'fSignalOffset')}
+        else:
+            adc = info['listADCInfo'][chan_id]
+            names.append(adc['ADCChNames'])
+            units.append(adc['ADCChUnits'])
+
+        if info['nDataFormat'] == 0:
+            gain = (adc_range / adc['fInstrumentScaleFactor'] /
+                    adc['fSignalGain'] / adc['fADCProgrammableGain'] /
+                    adc_resolution)
+            if adc['nTelegraphEnable'] == 1:
+                gain /= adc['fTelegraphAdditGain']
+            gains.append(gain)
+            offsets.append(adc['fInstrumentOffset'] - adc['fSignalOffset'])
+        else:
+            gains.append(1.0)
+            offsets.append(0.0)
+
+    layout = {}
+    layout['version'] = version
+    layout['dtype'] = dtype
+    layout['offset'] = int(offset)
+    layout['total'] = total
+    layout['num_channels'] = num_channels
+    layout['sampling_rate'] = float(sampling_rate)
+    # sweep boundaries in samples per channel
+    layout['sweep_starts'] = (stops - lengths) // num_channels
+    layout['sweep_stops'] = stops // num_channels
+    layout['t_starts'] = t_starts
+    layout['names'] = [n.replace(b' ', b'').decode('latin-1') for n in names]
+    layout['units'] = [u.replace(b' ', b'').replace(b'\x00', b'')
+                       .decode('latin-1') for u in units]
+    layout['gains'] = np.array(gains, dtype='float64')
+    layout['offsets'] = np.array(offsets, dtype='float64')
+
+    return layout
+
+
+class AbfMap(object):
+    """
+    Memory-mapped view onto the data section of an Axon Binary File.
+
+    Nothing but the header is read when the map is created. Sweeps are
+    returned as views straight onto the file, so only the pages that are
+    actually touched become resident.
 
     Parameters
     ----------
-    filename: str
+    filepath: str
         Full filepath WITH '.abf' extension.
 
-    Return
-    ------
-    df: DataFrame
-        Pandas DataFrame broken down by sweep.
-
-    References
+    Attributes
     ----------
-    [1] https://neo.readthedocs.org/en/latest/index.html
+    num_sweeps: int
+    num_channels: int
+    sampling_rate: float (Hz)
+    channels: list of str
+        Column labels used by read_abf ('primary', 'channel_1', ...).
+    names, units: list of str
+        Channel names and units as stored in the file header.
+    gains, offsets: 1D arrays
+        Per-channel scaling, physical = raw * gain + offset.
+    t_starts: 1D array
+        Start time of each sweep (seconds) relative to the file start.
     """
 
+    def __init__(self, filepath):
+        layout = _abf_layout(filepath)
+        self.filepath = filepath
+        self.dtype = layout['dtype']
+        self.num_channels = layout['num_channels']
+        self.num_sweeps = len(layout['sweep_starts'])
+        self.sampling_rate = layout['sampling_rate']
+        self.channels = _channel_names(self.num_channels)
+        self.names = layout['names']
+        self.units = layout['units']
+        self.gains = layout['gains']
+        self.offsets = layout['offsets']
+        self.t_starts = layout['t_starts']
+        self.sweep_starts = layout['sweep_starts']
+        self.sweep_stops = layout['sweep_stops']
+        self._data = np.memmap(filepath, dtype=self.dtype, mode='r',
+                               offset=layout['offset'],
+                               shape=(self.sweep_stops[-1],
+                                      self.num_channels))
+        # rows of each sweep inside self._data
+        self._rows = {i: (start, stop) for i, (start, stop) in
+                      enumerate(zip(self.sweep_starts, self.sweep_stops))}
+
+    def __len__(self):
+        return self.num_sweeps
+
+    @property
+    def sweep_lengths(self):
+        """ Number of samples (per channel) in each sweep """
+        return self.sweep_stops - self.sweep_starts
+
+    @property
+    def is_scaled(self):
+        """ True if the stored samples already are in physical units """
+        return (self.dtype.kind == 'f' and np.all(self.gains == 1) and
+                np.all(self.offsets == 0))
+
+    def raw(self, sweep, channel=None):
+        """
+        Stored (unscaled) samples of a sweep as a view onto the file (or
+        onto the in-memory samples of a loaded map).
+
+        Parameters
+        ----------
+        sweep: int
+            Zero-based sweep position.
+        channel: int or None (default)
+            Zero-based channel position. If None, a (samples x channels)
+            view is returned.
+        """
+        start, stop = self._rows[sweep]
+        data = self._data[start:stop]
+        if channel is None:
+            return data
+        return data[:, channel]
+
+    def sweep(self, sweep, channel=None, out=None):
+        """
+        Samples of a sweep in physical units.
+
+        Float files without scaling come back as views onto the file,
+        integer files are scaled into a new (or the supplied `out`) array.
+
+        Parameters
+        ----------
+        sweep: int
+            Zero-based sweep position.
+        channel: int or None (default)
+            Zero-based channel position. If None, all channels are returned
+            as a (samples x channels) array.
+        out: array or None (default)
+            Float array of the right shape to scale into.
+        """
+        raw = self.raw(sweep, channel)
+        if channel is None:
+            gains, offsets = self.gains, self.offsets
+        else:
+            gains, offsets = self.gains[channel], self.offsets[channel]
+
+        if out is None and self.is_scaled:
+            return raw
+        out = np.multiply(raw, gains, out=out, dtype='float64')
+        out += offsets
+
+        return out
+
+    def time(self, sweep):
+        """ Time (seconds) of each sample in a sweep, starting at 0 """
+        return np.arange(self.sweep_lengths[sweep]) / self.sampling_rate
+
+    def load(self, sweeps=None):
+        """
+        Copy of the map with the stored samples of `sweeps` read into
+        memory. Samples stay in their stored int16 (or float32) format and
+        are only scaled when sweep is called, so a resident recording takes
+        a quarter (or half) of the memory of read_abf's float64 frame.
+
+        Parameters
+        ----------
+        sweeps: 1D array_like of ints or None (default)
+            Zero-based sweep positions to load, all sweeps if None. Other
+            sweeps are no longer accessible through the returned map.
+        """
+        if sweeps is None:
+            sweeps = range(self.num_sweeps)
+        sweeps = list(sweeps)
+        lengths = [self._rows[i][1] - self._rows[i][0] for i in sweeps]
+
+        loaded = copy.copy(self)
+        loaded._data = np.empty((sum(lengths), self.num_channels),
+                                dtype=self.dtype)
+        loaded._rows = {}
+        row = 0
+        for sweep, length in zip(sweeps, lengths):
+            loaded._data[row:row + length] = self.raw(sweep)
+            loaded._rows[sweep] = (row, row + length)
+            row += length
+
+        return loaded
+
+    @property
+    def nbytes(self):
+        """ Bytes of stored samples held by the map """
+        return self._data.nbytes
+
+    def close(self):
+        """
+        Drops the memory map. The file is released once no views returned
+        by raw or sweep remain.
+        """
+        if isinstance(self._data, np.memmap):
+            self._data = None
+
+
+def _read_abf_neo(filepath, time=True):
+    """ Builds the read_abf DataFrame through neo.io.AxonIO """
     r = io.AxonIO(filename=filepath)
     bl = r.read_block(lazy=False, cascade=True)
     num_channels = len(bl.segments[0].analogsignals)
@@ -45,30 +333,528 @@ def read_abf(filepath):
     sweep_list = []
 
     for seg_num, seg in enumerate(bl.segments):
-        channels = ['primary']+['channel_{0}'.format(str(i+1))
-                                for i in range(num_channels-1)]
+        channels = _channel_names(num_channels)
         signals = []
         for i in range(num_channels):
             data = np.array(bl.segments[seg_num].analogsignals[i].data)
             signals.append(data.T[0])
         data_dict = dict(zip(channels, signals))
-        time = seg.analogsignals[0].times - seg.analogsignals[0].times[0]
-        data_dict['time'] = time
+        if time:
+            data_dict['time'] = (seg.analogsignals[0].times -
+                                 seg.analogsignals[0].times[0])
         df = pd.DataFrame(data_dict)
         df_list.append(df)
         sweep_list.append('sweep' + str(seg_num + 1).zfill(3))
     df = pd.concat(df_list, keys=sweep_list, names=['sweep', 'index'])
+    _set_time_axis(df, float(bl.segments[0].analogsignals[0].sampling_rate
+                             .rescale('Hz')))
+    util.sweep_rows(df)
+
+    return df
+
+
+def _frame_from_map(abf, sweeps, time=True):
+    """
+    Builds the read_abf DataFrame for the given zero-based sweep positions
+    of an AbfMap. Every sweep is scaled once, straight into the final
+    column buffer, so no per-sweep frames or concatenation are needed.
+    """
+    sweeps = np.asarray(sweeps, dtype=int)
+    lengths = abf.sweep_lengths[sweeps]
+    num_rows = lengths.sum()
+    columns = abf.channels + (['time'] if time else [])
+
+    # (columns x rows) so each column is contiguous inside the frame
+    buffer = np.empty((len(columns), num_rows))
+    row = 0
+    for sweep, length in zip(sweeps, lengths):
+        abf.sweep(sweep, out=buffer[:abf.num_channels, row:row + length].T)
+        if time:
+            buffer[-1, row:row + length] = abf.time(sweep)
+        row += length
+
+    names = _sweep_names(abf.num_sweeps)
+    sweep_codes = np.repeat(np.arange(sweeps.size), lengths)
+    index_codes = np.arange(num_rows) - np.repeat(np.cumsum(lengths) - lengths,
+                                                  lengths)
+    index = pd.MultiIndex(levels=[[names[i] for i in sweeps],
+                                  np.arange(lengths.max())],
+                          codes=[sweep_codes, index_codes],
+                          names=['sweep', 'index'])
+
+    df = pd.DataFrame(buffer.T, index=index, columns=columns, copy=False)
+    _set_time_axis(df, abf.sampling_rate)
+    df.attrs['sweep_rows'] = util._sweep_bounds(lengths)
+
+    return df
+
+
+def _set_time_axis(df, sampling_rate, t0=0.):
+    """
+    Records the time axis of a frame in df.attrs so time does not have to
+    be stored as a column (see utilities.time_values).
+    """
+    df.attrs['sampling_rate'] = float(sampling_rate)
+    df.attrs['t0'] = float(t0)
+
+
+def _read_abf_mmap(filepath, time=True):
+    """ Builds the read_abf DataFrame from a memory map of the file """
+    abf = AbfMap(filepath)
+    df = _frame_from_map(abf, np.arange(abf.num_sweeps), time)
+    abf.close()
+
+    return df
+
+
+class SweepCollection(object):
+    """
+    Sweeps of an ABF file that are only read from disk when accessed.
+
+    The collection knows how many sweeps and channels the file holds and
+    its sampling rate from the header alone. keep_sweeps and drop_sweeps
+    only filter the list of sweeps, so no samples are read until a sweep
+    is indexed, iterated over or to_frame is called.
+
+    Parameters
+    ----------
+    abf: AbfMap
+        Memory map of the file.
+    sweeps: 1D array_like of ints or None (default)
+        Zero-based positions of the sweeps in the collection. All sweeps
+        in the file if None.
+
+    Examples
+    --------
+    >>> sweeps = read_abf('cell.abf', lazy=True)
+    >>> sweeps = keep_sweeps(sweeps, [1, 4, 6])
+    >>> sweeps['sweep004']      # only now is sweep004 read
+    >>> df = sweeps.to_frame()  # same layout as read_abf(lazy=False)
+    """
+
+    def __init__(self, abf, sweeps=None):
+        self.abf = abf
+        if sweeps is None:
+            sweeps = np.arange(abf.num_sweeps)
+        self.positions = np.asarray(sweeps, dtype=int)
+        self._all_names = _sweep_names(abf.num_sweeps)
+
+    def __len__(self):
+        return self.positions.size
+
+    def __repr__(self):
+        return '<SweepCollection: {0} of {1} sweeps, {2} channels, ' \
+               '{3:g} Hz>'.format(len(self), self.abf.num_sweeps,
+                                  self.num_channels, self.sampling_rate)
+
+    @property
+    def num_sweeps(self):
+        return len(self)
+
+    @property
+    def num_channels(self):
+        return self.abf.num_channels
+
+    @property
+    def channels(self):
+        return self.abf.channels
+
+    @property
+    def sampling_rate(self):
+        return self.abf.sampling_rate
+
+    @property
+    def units(self):
+        return self.abf.units
+
+    @property
+    def gains(self):
+        return self.abf.gains
+
+    @property
+    def offsets(self):
+        return self.abf.offsets
+
+    @property
+    def sweeps(self):
+        """ Names of the sweeps in the collection, in order """
+        return [self._all_names[i] for i in self.positions]
+
+    def _position(self, sweep):
+        """ Zero-based file position of a sweep name or sweep number """
+        if isinstance(sweep, str):
+            try:
+                position = self._all_names.index(sweep)
+            except ValueError:
+                raise KeyError(sweep)
+        else:
+            position = int(sweep) - 1
+        if position not in self.positions:
+            raise KeyError(sweep)
+
+        return position
+
+    def __getitem__(self, sweep):
+        """
+        Reads a single sweep, given either its name ('sweep004') or its
+        number (4), as a flat DataFrame with the read_abf columns.
+        """
+        position = self._position(sweep)
+        data = self.abf.sweep(position)
+        df = pd.DataFrame(data.copy() if self.abf.is_scaled else data,
+                          columns=self.channels)
+        df['time'] = self.abf.time(position)
+        _set_time_axis(df, self.sampling_rate)
+
+        return df
+
+    def raw(self, sweep):
+        """
+        Stored (unscaled) samples of a sweep, given its name or number, as
+        a (samples x channels) array; physical = raw * gains + offsets.
+        """
+        return self.abf.raw(self._position(sweep))
+
+    def load(self):
+        """
+        Reads the stored samples of the sweeps in the collection into
+        memory without scaling them (see AbfMap.load).
+        """
+        return SweepCollection(self.abf.load(self.positions), self.positions)
+
+    def __iter__(self):
+        """ Yields (sweep name, DataFrame) pairs, reading one at a time """
+        for name in self.sweeps:
+            yield name, self[name]
+
+    def select(self, sweeps, drop=False):
+        """
+        Returns a new collection keeping (or dropping) the given sweep
+        names, without reading any data. Order of the file is preserved
+        when dropping, order of `sweeps` when keeping.
+        """
+        positions = [self._position(sweep) for sweep in sweeps]
+        if drop:
+            keep = self.positions[~np.isin(self.positions, positions)]
+        else:
+            keep = positions
+
+        return SweepCollection(self.abf, keep)
+
+    def to_frame(self, time=True):
+        """ Reads the sweeps into the MultiIndex DataFrame of read_abf """
+        return _frame_from_map(self.abf, self.positions, time)
+
+    def to_array(self):
+        """
+        Reads the sweeps into a sweeparray.SweepArray, scaling each one
+        straight into its buffer (shorter sweeps padded with NaN)
+        """
+        lengths = self.abf.sweep_lengths[self.positions]
+        buffer = np.full((self.num_channels, len(self), lengths.max()),
+                         np.nan)
+        for i, (position, length) in enumerate(zip(self.positions, lengths)):
+            self.abf.sweep(position, out=buffer[:, i, :length].T)
+
+        return SweepArray._from_buffer(buffer, self.sampling_rate,
+                                       self.channels, self.sweeps,
+                                       self.units, lengths, 0.)
+
+
+def read_abf(filepath, engine='neo', lazy=False, raw=False, time=True,
+             cache=False):
+    """
+    Imports ABF file using neo io AxonIO, breaks it down by blocks
+    which are then processed into a multidimensional pandas dataframe
+    where each block corresponds to a sweep and columns represent time
+    and each recorded channel.
+
+    Parameters
+    ----------
+    filename: str
+        Full filepath WITH '.abf' extension.
+    engine: str, 'neo' (default) or 'mmap'
+        'neo' reads the file through neo.io.AxonIO. 'mmap' memory-maps the
+        data section and scales each sweep straight into the returned
+        frame, which avoids holding intermediate copies of every sweep.
+        Use AbfMap directly for views onto the file without any copy.
+    lazy: bool (default: False)
+        Return a SweepCollection that reads sweeps on demand (through a
+        memory map, whatever the engine) instead of a DataFrame.
+    raw: bool (default: False)
+        Read every sweep into memory as stored in the file (int16 or
+        float32) plus per-channel gains and offsets, and return it as a
+        SweepCollection. Samples are converted to physical units, and time
+        is generated, only when a sweep is accessed or to_frame is called.
+    time: bool (default: True)
+        Store time as a column. Either way the sampling rate and start
+        time of the sweeps are recorded in df.attrs, from which the
+        analysis functions derive time (see utilities.time_values), so
+        time=False saves a float64 column of memory.
+    cache: bool or str (default: False)
+        Keep the parsed frame in an on-disk cache (neurphys.cache) and
+        memory-map it back on later calls while the file is unchanged. A
+        string is used as the cache directory instead of cache.CACHE_DIR.
+
+    Return
+    ------
+    df: DataFrame
+        Pandas DataFrame broken down by sweep.
+        **if lazy == True: SweepCollection of all sweeps in the file
+        **if raw == True: SweepCollection holding the stored samples
+
+    References
+    ----------
+    [1] https://neo.readthedocs.org/en/latest/index.html
+    """
+
+    if engine not in ('neo', 'mmap'):
+        raise ValueError("engine should be either 'neo' or 'mmap'")
+
+    if lazy or raw:
+        sweeps = SweepCollection(AbfMap(filepath))
+        return sweeps.load() if raw else sweeps
+
+    if cache:
+        cache_dir = cache if isinstance(cache, str) else None
+        key = 'read_abf:{}'.format(engine) + ('' if time else ':notime')
+        cached = nucache.lookup(key, [filepath], cache_dir)
+        if cached is not None:
+            return cached['frame']
+
+    if engine == 'neo':
+        df = _read_abf_neo(filepath, time)
+    else:
+        df = _read_abf_mmap(filepath, time)
+
+    if cache:
+        nucache.store(key, [filepath], {'frame': df},
+                      cache_dir=cache_dir)
 
     return df
 
 
+def read_many(paths, workers=None, engine='neo', keys=None,
+              ret_failures=False):
+    """
+    Imports several ABF files in parallel into a single DataFrame indexed
+    by file, sweep and index.
+
+    Parameters
+    ----------
+    paths: list of str
+        Full filepaths WITH '.abf' extension.
+    workers: int or None (default)
+        Number of worker processes decoding files. Defaults to the number
+        of CPUs; 1 reads the files one after another in this process.
+    engine: str, 'neo' (default) or 'mmap'
+        Passed on to read_abf.
+    keys: list of str or None (default)
+        Labels for the 'file' index level. Defaults to `paths`.
+    ret_failures: bool (default: False)
+        Also return a dictionary of key: exception for files that could
+        not be read.
+
+    Return
+    ------
+    df: DataFrame
+        Frames of all readable files, in the order of `paths`, or None if
+        none of them could be read.
+    **if ret_failures == True: also return the failures dictionary
+
+    Notes
+    -----
+    A file that fails to import is skipped with a warning rather than
+    aborting the whole batch.
+    """
+    paths = list(paths)
+    keys = paths if keys is None else list(keys)
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    frames = []
+    frame_keys = []
+    failures = {}
+
+    def collect(key, read):
+        try:
+            frames.append(read())
+            frame_keys.append(key)
+        except Exception as err:
+            failures[key] = err
+            warnings.warn('Could not read {0}: {1!r}'.format(key, err))
+
+    if workers == 1 or len(paths) < 2:
+        for key, path in zip(keys, paths):
+            collect(key, lambda: read_abf(path, engine=engine))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(read_abf, path, engine=engine)
+                       for path in paths]
+            # collect in submission order so the output is deterministic
+            for key, future in zip(keys, futures):
+                collect(key, future.result)
+
+    if frames:
+        df = pd.concat(frames, keys=frame_keys,
+                       names=['file', 'sweep', 'index'])
+    else:
+        df = None
+
+    if ret_failures:
+        return df, failures
+    else:
+        return df
+
+
+def iter_chunks(filepath, chunk_seconds, overlap_seconds=0):
+    """
+    Reads an ABF file in fixed-size blocks, so recordings far larger than
+    memory (e.g. hours of gap-free pacemaking) can be analyzed chunk by
+    chunk. Only one block is ever scaled into memory.
+
+    Parameters
+    ----------
+    filepath: str
+        Full filepath WITH '.abf' extension.
+    chunk_seconds: positive number (seconds)
+        Duration of each block.
+    overlap_seconds: positive number (seconds), default = 0
+        Duration of data from the end of the previous block repeated at
+        the start of the next one, e.g. a smoothing window or the minimum
+        peak distance, so windowed analyses see across block edges.
+
+    Yields
+    ------
+    df: DataFrame
+        Block with the read_abf columns, where 'time' is absolute time
+        from the start of the recording and the index is the sample number
+        within the sweep. df.attrs holds 'sweep' (name of the sweep the
+        block comes from), 'sampling_rate', 't0' (absolute time of the
+        first sample of that sweep) and 'overlap' (number of leading
+        samples repeated from the previous block). Blocks never span two
+        sweeps.
+    """
+    abf = AbfMap(filepath)
+    chunk = int(round(chunk_seconds * abf.sampling_rate))
+    overlap = int(round(overlap_seconds * abf.sampling_rate))
+    if chunk <= overlap:
+        raise ValueError('chunk_seconds should be larger than overlap_seconds')
+    names = _sweep_names(abf.num_sweeps)
+
+    for sweep in range(abf.num_sweeps):
+        raw = abf.raw(sweep)
+        for start in range(0, raw.shape[0], chunk):
+            first = max(start - overlap, 0)
+            stop = min(start + chunk, raw.shape[0])
+            data = raw[first:stop] * abf.gains + abf.offsets
+            df = pd.DataFrame(data, columns=abf.channels,
+                              index=pd.RangeIndex(first, stop), copy=False)
+            df['time'] = abf.t_starts[sweep] + df.index / abf.sampling_rate
+            _set_time_axis(df, abf.sampling_rate, abf.t_starts[sweep])
+            df.attrs['sweep'] = names[sweep]
+            df.attrs['overlap'] = start - first
+            yield df
+
+
+def follow(filepath, poll_seconds=1., timeout=None, time=True):
+    """
+    Tails an ABF file that is still being acquired, yielding the samples
+    appended since the last poll as they reach the disk.
+
+    The number of samples already yielded is tracked per sweep, so every
+    poll only reads the new part of the file. New sweeps and sweeps that
+    keep growing (gap-free recordings) are both picked up.
+
+    Parameters
+    ----------
+    filepath: str
+        Full filepath WITH '.abf' extension.
+    poll_seconds: positive number (seconds), default = 1
+        Time between checks for new data.
+    timeout: positive number (seconds) or None (default)
+        Stop once no new data has arrived for this long. Follow forever if
+        None.
+    time: bool (default: True)
+        Store time as a column (see read_abf).
+
+    Yields
+    ------
+    df: DataFrame
+        New samples of a single sweep with the read_abf columns, where
+        'time' is the time from the start of the sweep and the index is
+        the sample number within the sweep. df.attrs holds 'sweep' (name
+        of the sweep), 'sampling_rate' and 't0'. Frames of one sweep can
+        be joined with pd.concat, e.g. to run membrane.calc_mem_prop once
+        a test pulse has been recorded; pacemaking.calc_freq accepts the
+        frames as they come (see its last_time parameter).
+    """
+    # samples (per channel) already yielded for each sweep
+    done = {}
+    last_change = monotonic()
+
+    while True:
+        changed = False
+        try:
+            layout = _abf_layout(filepath)
+        except Exception:
+            # header not (completely) written yet
+            layout = None
+
+        if layout is not None:
+            num_channels = layout['num_channels']
+            frame_bytes = layout['dtype'].itemsize * num_channels
+            available = (os.path.getsize(filepath) -
+                         layout['offset']) // frame_bytes
+            names = _sweep_names(len(layout['sweep_starts']))
+            bounds = zip(layout['sweep_starts'], layout['sweep_stops'])
+            for sweep, (start, stop) in enumerate(bounds):
+                first = done.get(sweep, 0)
+                last = min(stop, available) - start
+                if last <= first:
+                    continue
+
+                raw = np.fromfile(filepath, dtype=layout['dtype'],
+                                  count=(last - first) * num_channels,
+                                  offset=(layout['offset'] +
+                                          (start + first) * frame_bytes))
+                data = (raw.reshape(-1, num_channels) * layout['gains'] +
+                        layout['offsets'])
+                df = pd.DataFrame(data, columns=_channel_names(num_channels),
+                                  index=pd.RangeIndex(first, last), copy=False)
+                if time:
+                    df['time'] = df.index / layout['sampling_rate']
+                _set_time_axis(df, layout['sampling_rate'])
+                df.attrs['sweep'] = names[sweep]
+                done[sweep] = last
+                changed = True
+                yield df
+
+        if changed:
+            last_change = monotonic()
+        elif timeout is not None and monotonic() - last_change >= timeout:
+            return
+        sleep(poll_seconds)
+
+
+def _sweep_keys(sweep_list):
+    """ Converts a list of sweep numbers or sweep names to sweep names """
+    if _all_ints(sweep_list):
+        return [('sweep'+str(i).zfill(3)) for i in sweep_list]
+    elif _all_strs(sweep_list):
+        return list(sweep_list)
+    else:
+        raise TypeError(
+        'List should either be appropriate sweep names or integers')
+
+
 def keep_sweeps(df, sweep_list):
     """
     Keeps specified sweeps from your DataFrame.
 
     Parameters
     ----------
-    df: Pandas DataFrame
+    df: Pandas DataFrame or SweepCollection
         Dataframe created using one of the functions from Neurphys.
     sweep_list: 1D array_like of ints or properly formatted strings
         List containing numbers of the sweeps you'd like dropped from the
@@ -77,7 +863,8 @@ def keep_sweeps(df, sweep_list):
     Return
     ------
     keep_df: Pandas Dataframe
-        Dataframe containing only the sweeps you want to keep.
+        Dataframe containing only the sweeps you want to keep. A
+        SweepCollection is filtered without reading any data.
 
     Notes
     -----
@@ -85,14 +872,10 @@ def keep_sweeps(df, sweep_list):
     potential inputs, so read the docs if you're having trouble.
     """
 
-    if _all_ints(sweep_list):
-        keep_sweeps = [('sweep'+str(i).zfill(3)) for i in sweep_list]
-    elif _all_strs(sweep_list):
-        keep_sweeps = sweep_list
-    else:
-        raise TypeError(
-        'List should either be appropriate sweep names or integers')
-    keep_df = df.loc[keep_sweeps]
+    keep_sweeps = _sweep_keys(sweep_list)
+    if isinstance(df, SweepCollection):
+        return df.select(keep_sweeps)
+    keep_df = util.take_sweeps(df, keep_sweeps)
 
     return keep_df
 
@@ -103,7 +886,7 @@ def drop_sweeps(df, sweep_list):
 
     Parameters
     ----------
-    df: Pandas DataFrame
+    df: Pandas DataFrame or SweepCollection
         Dataframe created using one of the functions from Neurphys. It must
         be multiindexed for the function to work properly.
     sweep_list: 1D array_like of ints or properly formatted strings
@@ -113,30 +896,29 @@ def drop_sweeps(df, sweep_list):
     Return
     ------
     drop_df: Pandas Dataframe
-        Dataframe containing only the sweeps you want to keep.
+        Dataframe containing only the sweeps you want to keep. A
+        SweepCollection is filtered without reading any data.
 
     Notes
     -----
     Making the grand assumption that the df.index.level[0]=='sweeps'
     """
 
-    if _all_ints(sweep_list):
-        drop_sweeps = [('sweep'+str(i).zfill(3)) for i in sweep_list]
-    elif _all_strs(sweep_list):
-        drop_sweeps = sweep_list
-    else:
-        raise TypeError(
-        'List should either be appropriate sweep names or integers')
+    drop_sweeps = _sweep_keys(sweep_list)
+    if isinstance(df, SweepCollection):
+        return df.select(drop_sweeps, drop=True)
 
-    all_sweeps = df.index.levels[0].values
+    # a reordered frame lists a sweep once per row range
+    all_sweeps = list(dict.fromkeys(util.sweep_rows(df)[0]))
 
-    if drop_sweeps[0] in all_sweeps:
+    if set(drop_sweeps).issubset(all_sweeps):
         pass
     else:
         raise KeyError('Cannot index a multi-index axis with these keys')
 
-    # keep_sweeps = list(set(all_sweeps).difference(drop_sweeps))
-    keep_sweeps = list(set(all_sweeps) ^ set(drop_sweeps))
-    drop_df = df.loc[keep_sweeps]
+    # keeps the remaining sweeps in their original order
+    drop_set = set(drop_sweeps)
+    keep_sweeps = [sweep for sweep in all_sweeps if sweep not in drop_set]
+    drop_df = util.take_sweeps(df, keep_sweeps)
 
     return drop_df
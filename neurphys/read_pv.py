@@ -1,10 +1,21 @@
 
 """ Module for importing PraireView5.0+ generated .csv files."""
 
+import io
 import os
+import copy
+import json
+import numpy as np
 import pandas as pd
 from lxml import etree
 from glob import glob
+from time import monotonic, sleep
+from concurrent.futures import ThreadPoolExecutor
+from . import cache as nucache
+from . import utilities as util
+
+# subfolder of a data folder holding its binary conversion
+BINARY_DIR = '.neurphys'
 
 
 def _get_ephys_vals(element):
@@ -26,43 +37,93 @@ def _get_ephys_vals(element):
         return unit, divisor
 
 
-def parse_xml(filename):
-    """Parses VoltageRecording .xml file to get experiment metadata"""
+# tags holding single metadata values, read from their first occurrence
+_SCALAR_TAGS = ('Rate', 'AcquisitionTime', 'DataFile',
+                'AssociatedLinescanProfileFile')
+
+# per folder: {xml file name: (mtime, size, file attributes)}
+_xml_cache = {}
+
 
-    tree = etree.parse(filename)
-    # find all elements associated with enabled channels
-    enabled_ch = tree.xpath('.//Enabled[text()="true"]')
+def _stream_xml(filename):
+    """
+    Streams through a VoltageRecording XML file collecting the elements of
+    enabled channels and the text of the _SCALAR_TAGS. Parsing stops as
+    soon as the list of channels has been closed and every scalar tag has
+    been seen, so the rest of the document is never read.
+    """
+    channels = []
+    scalars = {}
+    signal_list = None
+    signals_done = False
+
+    for _, elem in etree.iterparse(filename, events=('end',)):
+        tag = elem.tag
+        if tag in _SCALAR_TAGS:
+            scalars.setdefault(tag, elem.text)
+        elif elem is signal_list:
+            signals_done = True
+        elif tag != 'Enabled':
+            enabled = elem.find('Enabled')
+            if enabled is not None and enabled.text == 'true':
+                channels.append(elem)
+                signal_list = elem.getparent()
+
+        if signals_done and len(scalars) == len(_SCALAR_TAGS):
+            break
+
+    return channels, scalars
+
+
+def parse_xml(filename, use_cache=True):
+    """Parses VoltageRecording .xml file to get experiment metadata
+
+    The file is streamed and parsing stops once all metadata has been
+    found. Results are kept in a per-folder cache and reused while the
+    file's size and modification time are unchanged, unless use_cache is
+    False (see clear_xml_cache).
+    """
+    if use_cache:
+        stat = os.stat(filename)
+        folder_cache = _xml_cache.setdefault(
+            os.path.dirname(os.path.abspath(filename)), {})
+        name = os.path.basename(filename)
+        entry = folder_cache.get(name)
+        if entry is not None and entry[:2] == (stat.st_mtime_ns,
+                                               stat.st_size):
+            return copy.deepcopy(entry[2])
+
+    enabled_ch, scalars = _stream_xml(filename)
 
     file_attr = {}
     ch_names = []
     divisors = {}
     units = {}
-    for ch in enabled_ch:
-        parent = ch.getparent()
+    for parent in enabled_ch:
         if parent.find('.//Type').text == 'Physical':
             clamp_device = parent.find('.//PatchclampDevice').text
-            name = parent.find('.//Name').text.lower()
-            ch_names.append(name)
+            channel = parent.find('.//Name').text.lower()
+            ch_names.append(channel)
 
             if clamp_device is not None:
                 unit, divisor = _get_ephys_vals(parent)
-                divisors[name] = divisor
-                units[name] = unit
+                divisors[channel] = divisor
+                units[channel] = unit
             else:
-                units[name] = 'V'
+                units[channel] = 'V'
 
     file_attr['channels'] = ch_names
     file_attr['divisors'] = divisors
     file_attr['units'] = units
     # gets sampling rate
-    file_attr['sampling'] = int((tree.find('.//Rate')).text)
+    file_attr['sampling'] = int(scalars['Rate'])
     # gets recording time, converts to sec
-    file_attr['duration'] = (int((tree.find('.//AcquisitionTime')).text))/1000
+    file_attr['duration'] = (int(scalars['AcquisitionTime']))/1000
 
     # finds the voltage recording csv file name
-    datafile = (tree.find('.//DataFile')).text
+    datafile = scalars['DataFile']
     # finds the linescan profile file name (if doesn't exist, will be None)
-    ls_file = (tree.find('.//AssociatedLinescanProfileFile')).text
+    ls_file = scalars['AssociatedLinescanProfileFile']
 
     # If ls_file is none this could mean that there is no linescan associated
     # with that voltage recording file or that the file passed to parse_vr is
@@ -80,34 +141,243 @@ def parse_xml(filename):
     file_attr['voltage recording file'] = vo_file
     file_attr['linescan file'] = ls_file
 
+    if use_cache:
+        folder_cache[name] = (stat.st_mtime_ns, stat.st_size,
+                              copy.deepcopy(file_attr))
+
     return file_attr
 
 
-def import_vr_csv(filename, col_names, divisors):
+def clear_xml_cache(folder=None):
+    """Forget cached parse_xml results, for one folder or all of them"""
+    if folder is None:
+        _xml_cache.clear()
+    else:
+        _xml_cache.pop(os.path.abspath(folder), None)
+
+
+def import_vr_csv(filename, col_names, divisors, sampling=None, time=True,
+                  dtype=None, usecols=None):
     """
     Reads voltage recording .csv file into a pandas dataframe.
     Will convert primary and secondary channels to appropriate values if those
     channels are in the file.
 
+    If the sampling rate (Hz) is given it is recorded, with t0 = 0, in
+    df.attrs. time=False then skips parsing the time column altogether (see
+    utilities.time_values).
+
+    dtype (e.g. 'float32') is used for the channel columns as they are
+    parsed, and usecols (list of channel names) limits parsing to those
+    channels.
+
     Returns a dataframe
     """
+    channels = col_names if usecols is None else \
+        [ch for ch in col_names if ch in usecols]
     col_names = ['time'] + col_names
-    df = pd.read_csv(filename, names=col_names, skiprows=1)
-    df.time /= 1000
+    parse_time = time or sampling is None
+    dtypes = None if dtype is None else {ch: dtype for ch in channels}
+    df = pd.read_csv(filename, names=col_names, skiprows=1, dtype=dtypes,
+                     usecols=(['time'] if parse_time else []) + channels)
+    if parse_time:
+        df.time /= 1000
 
     for ch, divisor in divisors.items():
-        df[ch] /= divisor
+        if ch in channels:
+            df[ch] /= divisor
+
+    if sampling is not None:
+        df.attrs['sampling_rate'] = float(sampling)
+        df.attrs['t0'] = 0.
+        if not time and 'time' in df.columns:
+            del df['time']
 
     return df
 
 
-def import_ls_csv(filename):
+def _compact_time(time):
+    """
+    Smallest array broadcastable to a (sweeps x profiles x samples) time
+    array: (samples,) if every profile of every sweep shares one time
+    vector, (sweeps, 1, samples) if the profiles of each sweep share one,
+    otherwise the full array.
+    """
+    def same(a, b):
+        return bool(np.all((a == b) | (np.isnan(a) & np.isnan(b))))
+
+    if time.ndim < 3:
+        return time
+    if same(time, time[:, :1]):
+        if same(time[:, 0], time[:1, 0]):
+            return time[0, 0].copy()
+        return time[:, :1].copy()
+
+    return time
+
+
+class Linescan(object):
+    """
+    Linescan profiles of one or more sweeps held in a single contiguous
+    (sweeps x profiles x samples) array.
+
+    Profile times are stored once when they are shared by all profiles
+    (see time), so the container needs about half the memory of the wide
+    "Prof N time"/"Prof N" dataframe, and profile and time accessors
+    return views. to_frame gives back the dataframe layout.
+
+    Parameters
+    ----------
+    values: 3D array_like (sweeps x profiles x samples)
+        Profile fluorescence values. Sweeps shorter than the longest are
+        padded with NaN.
+    time: array_like (seconds)
+        Profile times, of the same shape as values or of any shape that
+        broadcasts to it. Compacted on construction.
+    sweeps: list of str or None (default)
+        Sweep names, None for a single unnamed sweep (e.g. from
+        import_ls_csv).
+    lengths: 1D array_like of ints or None (default)
+        Number of samples recorded in each sweep, all samples if None.
+    """
+
+    def __init__(self, values, time, sweeps=None, lengths=None):
+        self.values = np.ascontiguousarray(values, dtype=float)
+        self.time = _compact_time(np.asarray(time, dtype=float))
+        self.sweeps = sweeps
+        if lengths is None:
+            lengths = np.full(self.values.shape[0], self.values.shape[2])
+        self.lengths = np.asarray(lengths, dtype=int)
+
+    def __len__(self):
+        return self.values.shape[0]
+
+    def __repr__(self):
+        return '<Linescan: {0} sweeps, {1} profiles, {2} samples>'.format(
+            *self.values.shape)
+
+    @property
+    def num_sweeps(self):
+        return self.values.shape[0]
+
+    @property
+    def num_profiles(self):
+        return self.values.shape[1]
+
+    @property
+    def num_samples(self):
+        return self.values.shape[2]
+
+    @property
+    def profiles(self):
+        """ Profile column names, as used by import_ls_csv """
+        return ['Prof {0}'.format(i + 1) for i in range(self.num_profiles)]
+
+    def _position(self, sweep):
+        """ Position of a sweep name or zero-based sweep position """
+        if isinstance(sweep, str):
+            if self.sweeps is None or sweep not in self.sweeps:
+                raise KeyError(sweep)
+            return self.sweeps.index(sweep)
+
+        return int(sweep)
+
+    def profile(self, profile_num, sweep=None):
+        """
+        View of the values of one profile (numbered from 1): a
+        (sweeps x samples) array, or the recorded samples of one sweep.
+        """
+        if sweep is None:
+            return self.values[:, profile_num - 1]
+        i = self._position(sweep)
+
+        return self.values[i, profile_num - 1, :self.lengths[i]]
+
+    def profile_time(self, profile_num, sweep=None):
+        """ Times (s) matching profile(profile_num, sweep), as a view """
+        time = np.broadcast_to(self.time, self.values.shape)
+        if sweep is None:
+            return time[:, profile_num - 1]
+        i = self._position(sweep)
+
+        return time[i, profile_num - 1, :self.lengths[i]]
+
+    def to_frame(self):
+        """
+        Wide dataframe with interleaved "Prof N time" and "Prof N" columns,
+        as returned by import_ls_csv and import_folder.
+        """
+        time = np.broadcast_to(self.time, self.values.shape)
+        columns = []
+        for prof in self.profiles:
+            columns += [prof + ' time', prof]
+        frames = []
+        for i, length in enumerate(self.lengths):
+            block = np.empty((length, 2 * self.num_profiles))
+            block[:, ::2] = time[i, :, :length].T
+            block[:, 1::2] = self.values[i, :, :length].T
+            frames.append(pd.DataFrame(block, columns=columns))
+
+        if self.sweeps is None:
+            return frames[0]
+        df = pd.concat(frames, keys=self.sweeps, names=['sweep', 'index'])
+        df.attrs['sweep_rows'] = util._sweep_bounds(self.lengths)
+
+        return df
+
+    @classmethod
+    def from_frame(cls, df):
+        """ Linescan from a wide import_ls_csv or import_folder dataframe """
+        profiles = [col for col in df.columns if not col.endswith(' time')]
+        if isinstance(df.index, pd.MultiIndex):
+            sweeps, rows = util.sweep_rows(df)
+            sweeps = list(sweeps)
+        else:
+            sweeps, rows = None, np.array([[0, len(df)]])
+        lengths = rows[:, 1] - rows[:, 0]
+
+        shape = (len(rows), len(profiles), lengths.max())
+        values = np.full(shape, np.nan)
+        time = np.full(shape, np.nan)
+        for i, (start, stop) in enumerate(rows):
+            sub = df.iloc[start:stop]
+            values[i, :, :stop - start] = sub[profiles].values.T
+            time[i, :, :stop - start] = \
+                sub[[prof + ' time' for prof in profiles]].values.T
+
+        return cls(values, time, sweeps, lengths)
+
+    @classmethod
+    def concat(cls, scans, sweeps):
+        """ Stacks single or multi-sweep Linescans along the sweep axis """
+        lengths = np.concatenate([scan.lengths for scan in scans])
+        num_profiles = scans[0].num_profiles
+        shape = (lengths.size, num_profiles, lengths.max())
+        values = np.full(shape, np.nan)
+        time = np.full(shape, np.nan)
+        first = 0
+        for scan in scans:
+            stop = first + scan.num_sweeps
+            values[first:stop, :, :scan.num_samples] = scan.values
+            time[first:stop, :, :scan.num_samples] = scan.time
+            first = stop
+
+        return cls(values, time, sweeps, lengths)
+
+
+def import_ls_csv(filename, compact=False):
     """
     Reads linescan profile .csv file into pandas dataframe.
-    Returns a dataframe
+    Returns a dataframe, or a single sweep Linescan if compact is True
     """
 
     df = pd.read_csv(filename, skipinitialspace=True)
+    if compact:
+        data = df.values
+        # time columns occur as every other column, starting with column 0
+        return Linescan(data[:, 1::2].T[np.newaxis],
+                        data[:, ::2].T[np.newaxis] / 1000)
+
     df.rename(columns=lambda header: header.strip('(ms)'), inplace=True)
     # time columns occur as every other column, starting with column 0
     df.loc[:, ::2] /= 1000
@@ -115,7 +385,174 @@ def import_ls_csv(filename):
     return df
 
 
-def import_folder(folder):
+def _folder_sources(folder):
+    """ Files of a data folder that parsed results depend on """
+    return sorted(glob(os.path.join(folder, '*.xml')) +
+                  glob(os.path.join(folder, '*.csv')))
+
+
+def convert_folder(folder, dtype='float32', usecols=None):
+    """Parse a data folder once and store it in a typed binary layout
+
+    The voltage recording (as `dtype` columns without a time column), the
+    linescan and the parsed XML metadata are written into a BINARY_DIR
+    subfolder. As long as none of the XML or csv files change, later
+    import_folder calls memory-map these instead of parsing text.
+
+    Parameters
+    ----------
+    folder: string
+        Full path to data folder.
+    dtype: str (default: 'float32')
+        Data type of the stored voltage recording channels.
+    usecols: list of str or None (default)
+        Voltage recording channels to store, all if None.
+
+    Return
+    ------
+    output: dictionary
+        same as import_folder
+    """
+    output = import_folder(folder, time=False, dtype=dtype, usecols=usecols,
+                           binary=False)
+    if output["file attributes"] is None:
+        return output
+
+    binary_dir = os.path.join(folder, BINARY_DIR)
+    if not os.path.isdir(binary_dir):
+        os.makedirs(binary_dir)
+    frames = {name: output[name] for name in ("voltage recording",
+                                              "linescan")}
+    for name, df in frames.items():
+        if df is not None:
+            nucache.save_frame(binary_dir, df, name)
+
+    meta = {'signature': nucache.signature(_folder_sources(folder)),
+            'frames': {name: df is not None for name, df in frames.items()},
+            'usecols': None if usecols is None else list(usecols),
+            'file attributes': output["file attributes"]}
+    with open(os.path.join(binary_dir, 'folder.json'), 'w') as f:
+        json.dump(meta, f)
+
+    return output
+
+
+def _import_binary(folder, time, dtype, usecols):
+    """ import_folder output from an up to date convert_folder layout """
+    meta_file = os.path.join(folder, BINARY_DIR, 'folder.json')
+    if not os.path.exists(meta_file):
+        return None
+    with open(meta_file) as f:
+        meta = json.load(f)
+    if meta['signature'] != nucache.signature(_folder_sources(folder)):
+        return None
+    # a layout holding only some of the channels can't serve requests for
+    # the others (layouts without the usecols entry are from older versions)
+    if 'usecols' not in meta:
+        return None
+    stored = meta['usecols']
+    if stored is not None and (usecols is None or
+                               not set(usecols).issubset(stored)):
+        return None
+
+    output = {name: nucache.load_frame(os.path.join(folder, BINARY_DIR),
+                                       name) if stored else None
+              for name, stored in meta['frames'].items()}
+    output["file attributes"] = meta['file attributes']
+
+    df = output["voltage recording"]
+    if df is not None:
+        if usecols is not None:
+            if not set(usecols).issubset(df.columns):
+                return None
+            df = df[[ch for ch in df.columns if ch in usecols]]
+        if dtype is not None and any(df.dtypes != dtype):
+            df = df.astype(dtype)
+        if time:
+            df.insert(0, 'time', util.time_values(df))
+        output["voltage recording"] = df
+
+    return output
+
+
+def _import_xml(file, time=True, dtype=None, usecols=None, compact=False):
+    """
+    Parses one VoltageRecording XML file and the voltage recording and
+    linescan csv files it points to.
+
+    Returns file attributes, voltage recording dataframe and linescan
+    dataframe or Linescan (None for files not present)
+    """
+    folder = os.path.dirname(file)
+    file_vals = parse_xml(file)
+    file_vals['xml file'] = os.path.basename(file)
+    df_vr = None
+    df_ls = None
+
+    if file_vals['voltage recording file'] is not None:
+        vr_filename = os.path.join(folder,
+                                   (file_vals['voltage recording file']
+                                    + '.csv'))
+
+        df_vr = import_vr_csv(vr_filename,
+                              file_vals['channels'],
+                              file_vals['divisors'],
+                              file_vals['sampling'], time,
+                              dtype, usecols)
+
+    if file_vals['linescan file'] is not None:
+        ls_filename = os.path.join(folder,
+                                   (file_vals['linescan file']))
+
+        df_ls = import_ls_csv(ls_filename, compact)
+
+    return file_vals, df_vr, df_ls
+
+
+def _append_sweeps(df, frames, sweeps):
+    """
+    Concatenates per-sweep frames under a sweep index level and appends
+    them to an existing multi-sweep frame (or None), recording the sweep
+    rows of the result.
+    """
+    if not frames:
+        return df
+
+    new = pd.concat(frames, keys=sweeps, names=['sweep', 'index'])
+    lengths = [len(frame) for frame in frames]
+    attrs = dict(frames[0].attrs)
+    if df is not None:
+        _, rows = util.sweep_rows(df)
+        lengths = list(rows[:, 1] - rows[:, 0]) + lengths
+        attrs = dict(df.attrs)
+        new = pd.concat([df, new])
+    new.attrs = attrs
+    new.attrs['sweep_rows'] = util._sweep_bounds(lengths)
+
+    return new
+
+
+def _append_linescans(scan, scans, sweeps):
+    """ Linescan counterpart of _append_sweeps """
+    if not scans:
+        return scan
+    if scan is not None:
+        sweeps = scan.sweeps + sweeps
+        scans = [scan] + scans
+
+    return Linescan.concat(scans, sweeps)
+
+
+def _compact_output(output, compact):
+    """ Converts the linescan dataframe of an output to a Linescan """
+    if compact and isinstance(output["linescan"], pd.DataFrame):
+        output["linescan"] = Linescan.from_frame(output["linescan"])
+
+    return output
+
+
+def import_folder(folder, time=True, dtype=None, usecols=None, binary=True,
+                  cache=False, workers=None, previous=None, compact=False):
     """Collapse entire data folder into multidimensional dataframe
 
     Parameters
@@ -123,6 +560,33 @@ def import_folder(folder):
     folder: string
         Full path to data folder. Folder must contain, at a minimum
         a single VoltageRecording XML file and associated csv file
+    time: bool (default: True)
+        Store voltage recording time as a column. The sampling rate is
+        recorded in the dataframe's attrs either way (see
+        utilities.time_values).
+    dtype: str or None (default)
+        Data type of the voltage recording channels, e.g. 'float32'.
+    usecols: list of str or None (default)
+        Voltage recording channels to import, all if None.
+    binary: bool (default: True)
+        Memory-map the layout written by convert_folder, if there is one
+        and it is up to date, instead of parsing the csv files.
+    cache: bool or str (default: False)
+        Keep the parsed frames in an on-disk cache (neurphys.cache) and
+        memory-map them back on later calls while no XML or csv file in
+        the folder has changed. A string is used as the cache directory
+        instead of cache.CACHE_DIR.
+    workers: int or None (default)
+        Number of threads parsing XML and csv files at the same time. None
+        or 1 parses the files one after another.
+    previous: dictionary or None (default)
+        Output of an earlier import_folder call on the same folder. Only
+        XML files not listed in its file attributes are read, and their
+        sweeps are appended to the earlier dataframes. Useful on folders
+        acquisition is still writing to.
+    compact: bool (default: False)
+        Return the linescan as a Linescan, holding all profiles in one
+        (sweeps x profiles x samples) array, instead of a dataframe.
 
     Return
     ------
@@ -136,49 +600,89 @@ def import_folder(folder):
     """
     vr_xmls = sorted(glob(os.path.join(folder, '*_VoltageRecording_*.xml')))
 
+    if previous is not None and previous["file attributes"]:
+        done = set(vals['xml file']
+                   for vals in previous["file attributes"].values())
+        vr_xmls = [file for file in vr_xmls
+                   if os.path.basename(file) not in done]
+    else:
+        previous = None
+
+    if binary and previous is None and any(vr_xmls):
+        output = _import_binary(folder, time, dtype, usecols)
+        if output is not None:
+            return _compact_output(output, compact)
+
+    if cache and previous is None and any(vr_xmls):
+        cache_dir = cache if isinstance(cache, str) else None
+        sources = _folder_sources(folder)
+        key = 'import_folder:{0}:{1}:{2}'.format(time, dtype, usecols)
+        cached = nucache.lookup(key, sources, cache_dir)
+        if cached is not None:
+            return _compact_output(
+                {"voltage recording": cached["voltage recording"],
+                 "linescan": cached["linescan"],
+                 "file attributes": cached["extra"]}, compact)
+
+        output = import_folder(folder, time, dtype, usecols, binary=False,
+                               workers=workers)
+        nucache.store(key, sources,
+                      {"voltage recording": output["voltage recording"],
+                       "linescan": output["linescan"]},
+                      extra=output["file attributes"], cache_dir=cache_dir)
+
+        return _compact_output(output, compact)
+
+    if previous is not None and not vr_xmls:
+        if compact and isinstance(previous["linescan"], pd.DataFrame):
+            return _compact_output(dict(previous), compact)
+        return previous
+
     if any(vr_xmls):
+        def parse(file):
+            return _import_xml(file, time, dtype, usecols, compact)
+
+        if workers is not None and workers > 1 and len(vr_xmls) > 1:
+            # pandas' csv parser and lxml release the GIL for much of
+            # their work, so threads overlap the parsing of several files
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                parsed = list(executor.map(parse, vr_xmls))
+        else:
+            parsed = [parse(file) for file in vr_xmls]
+
         data_vr = []
         data_ls = []
-        sweep_list = []
-        file_attr = {}
-        output = {}
-
-        for i, file in enumerate(vr_xmls):
+        vr_sweeps = []
+        ls_sweeps = []
+        if previous is None:
+            file_attr = {}
+            df_vr, df_ls = None, None
+        else:
+            file_attr = dict(previous["file attributes"])
+            df_vr, df_ls = previous["voltage recording"], previous["linescan"]
+        first = len(file_attr)
+
+        for i, (file_vals, vr, ls) in enumerate(parsed, first):
             sweep = 'sweep' + str(i+1).zfill(3)
-            sweep_list.append(sweep)
-            file_vals = parse_xml(file)
-
-            if file_vals['voltage recording file'] is not None:
-                vr_filename = os.path.join(folder,
-                                           (file_vals['voltage recording file']
-                                            + '.csv'))
-
-                df_vr = import_vr_csv(vr_filename,
-                                      file_vals['channels'],
-                                      file_vals['divisors'])
-
-                data_vr.append(df_vr)
-
-            if file_vals['linescan file'] is not None:
-                ls_filename = os.path.join(folder,
-                                           (file_vals['linescan file']))
-
-                df_ls = import_ls_csv(ls_filename)
-
-                data_ls.append(df_ls)
-
+            if vr is not None:
+                data_vr.append(vr)
+                vr_sweeps.append(sweep)
+            if ls is not None:
+                data_ls.append(ls)
+                ls_sweeps.append(sweep)
             file_attr['File'+str(i+1)] = file_vals
 
-        if data_vr:
-            output["voltage recording"] = pd.concat(data_vr, keys=sweep_list,
-                                                    names=['sweep', 'index'])
-        elif not data_vr:
-            output["voltage recording"] = None
-        if data_ls:
-            output["linescan"] = pd.concat(data_ls, keys=sweep_list,
-                                           names=['sweep', 'index'])
-        elif not data_ls:
-            output["linescan"] = None
+        output = {}
+        output["voltage recording"] = _append_sweeps(df_vr, data_vr,
+                                                     vr_sweeps)
+        if compact:
+            if isinstance(df_ls, pd.DataFrame):
+                df_ls = Linescan.from_frame(df_ls)
+            output["linescan"] = _append_linescans(df_ls, data_ls, ls_sweeps)
+        else:
+            if isinstance(df_ls, Linescan):
+                df_ls = df_ls.to_frame()
+            output["linescan"] = _append_sweeps(df_ls, data_ls, ls_sweeps)
         output["file attributes"] = file_attr
 
     else:
@@ -186,3 +690,91 @@ def import_folder(folder):
                   "file attributes": None}
 
     return output
+
+
+def follow(folder, poll_seconds=1., timeout=None, time=True, dtype=None,
+           usecols=None):
+    """Tail a data folder PrairieView is still writing to
+
+    Yields the voltage recording rows appended since the last poll, for
+    new sweeps as well as for csv files that are still growing. The byte
+    offset reached in every csv file is tracked, so each poll only parses
+    the new rows.
+
+    Parameters
+    ----------
+    folder: string
+        Full path to data folder.
+    poll_seconds: positive number (seconds), default = 1
+        Time between checks for new data.
+    timeout: positive number (seconds) or None (default)
+        Stop once no new data has arrived for this long. Follow forever if
+        None.
+    time, dtype, usecols:
+        See import_folder.
+
+    Yields
+    ------
+    df: dataframe
+        New rows of a single sweep's voltage recording, indexed by row
+        number within the sweep. df.attrs holds 'sweep' (named as in
+        import_folder), 'sampling_rate' and 't0'. Frames of one sweep can
+        be joined with pd.concat, e.g. to run membrane.calc_mem_prop;
+        pacemaking.calc_freq accepts the frames as they come (see its
+        last_time parameter).
+    """
+    # per xml file: [sweep name, file attributes, csv header, byte offset,
+    # rows read], in order of appearance
+    tracked = {}
+    last_change = monotonic()
+
+    while True:
+        changed = False
+        for file in sorted(glob(os.path.join(folder,
+                                             '*_VoltageRecording_*.xml'))):
+            if file not in tracked:
+                try:
+                    file_vals = parse_xml(file, use_cache=False)
+                except (etree.XMLSyntaxError, OSError, KeyError, TypeError):
+                    # xml not (completely) written yet
+                    continue
+                sweep = 'sweep' + str(len(tracked) + 1).zfill(3)
+                tracked[file] = [sweep, file_vals, None, 0, 0]
+
+            sweep, file_vals, header, offset, rows = tracked[file]
+            if file_vals['voltage recording file'] is None:
+                continue
+            csv = os.path.join(folder,
+                               file_vals['voltage recording file'] + '.csv')
+            if not os.path.exists(csv):
+                continue
+
+            with open(csv, 'rb') as f:
+                f.seek(offset)
+                new = f.read()
+            # only parse complete lines
+            new = new[:new.rfind(b'\n') + 1]
+            if header is None:
+                end = new.find(b'\n') + 1
+                if not end:
+                    continue
+                header, new = new[:end], new[end:]
+                offset += end
+            if not new:
+                tracked[file][2:4] = header, offset
+                continue
+
+            df = import_vr_csv(io.BytesIO(header + new),
+                               file_vals['channels'], file_vals['divisors'],
+                               file_vals['sampling'], time, dtype, usecols)
+            df.index = pd.RangeIndex(rows, rows + len(df))
+            df.attrs['sweep'] = sweep
+            tracked[file][2:] = header, offset + len(new), rows + len(df)
+            changed = True
+            yield df
+
+        if changed:
+            last_change = monotonic()
+        elif timeout is not None and monotonic() - last_change >= timeout:
+            return
+        sleep(poll_seconds)
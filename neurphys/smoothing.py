@@ -0,0 +1,269 @@
+"""
+Sliding-window smoothing filters for long recordings.
+
+Every filter works along one axis of 1D or 2D input, can write into a
+preallocated `out` array and marks samples without a complete window (the
+edges, and any window holding a NaN) as NaN. Because of that, a recording
+smoothed chunk by chunk with a Smoother gives the same values as smoothing
+the whole array at once (the running mean up to floating point rounding of
+its running sums).
+"""
+
+import numpy as np
+import pandas as pd
+from scipy.ndimage import correlate1d
+from scipy.signal import savgol_coeffs
+from . import backend
+
+
+def _first_output(n, centered):
+    """
+    Position of the output for the first complete window x[0:n]: its last
+    sample for causal filters, its middle sample (n // 2) for centered ones.
+    """
+    return n // 2 if centered else n - 1
+
+
+def _window_nans(x, n):
+    """ True for every complete window x[..., j:j+n] holding a NaN """
+    counts = np.zeros(x.shape[:-1] + (x.shape[-1] + 1,), dtype='int64')
+    np.cumsum(np.isnan(x), axis=-1, out=counts[..., 1:])
+
+    return (counts[..., n:] - counts[..., :-n]) > 0
+
+
+def _apply(kernel, data, n, centered, axis, out):
+    """
+    Runs a window kernel along `axis` and places its values for complete
+    windows, padding the edges with NaN. kernel(x) receives the data with
+    the smoothing axis last and NaN replaced by 0, and returns one value
+    per complete window.
+    """
+    if n < 1:
+        raise ValueError('window length should be a positive integer')
+    data = np.asarray(data, dtype='float64')
+    if out is None:
+        out = np.empty_like(data)
+    x = np.moveaxis(data, axis, -1)
+    o = np.moveaxis(out, axis, -1)
+
+    length = x.shape[-1]
+    if length < n:
+        o[...] = np.nan
+        return out
+    first = _first_output(n, centered)
+    stop = first + length - n + 1
+
+    nans = np.isnan(x)
+    values = kernel(np.where(nans, 0, x) if nans.any() else x)
+    if nans.any():
+        values = np.where(_window_nans(x, n), np.nan, values)
+    o[..., :first] = np.nan
+    o[..., first:stop] = values
+    o[..., stop:] = np.nan
+
+    return out
+
+
+def running_mean(data, n, centered=False, axis=-1, out=None):
+    """Running average of n data points in O(len(data))
+
+    Parameters
+    ----------
+    data: 1D or 2D array
+    n: positive int
+        window length (samples)
+    centered: boolean, default = False
+        average the window centered on each sample (samples i - n//2 to
+        i - n//2 + n - 1) instead of the n samples ending at it
+    axis: int, default = -1
+        axis to smooth along
+    out: array or None (default)
+        float64 array of the same shape to write the result into
+
+    Return
+    ------
+    array of the same shape as data, NaN where the window is incomplete or
+    holds a NaN
+    """
+    def kernel(x):
+        if backend.BACKEND == 'numba':
+            rows = x.reshape(-1, x.shape[-1])
+            sums = np.empty((rows.shape[0], rows.shape[1] - n + 1))
+            _window_sums_jit(rows, n, sums)
+            return sums.reshape(x.shape[:-1] + (-1,)) / n
+        sums = np.zeros(x.shape[:-1] + (x.shape[-1] + 1,))
+        np.cumsum(x, axis=-1, out=sums[..., 1:])
+        return (sums[..., n:] - sums[..., :-n]) / n
+
+    return _apply(kernel, data, n, centered, axis, out)
+
+
+def _window_sums(x, n, out):
+    """
+    Sums of every complete window of n samples along the rows of x, in a
+    single pass without the cumulative sum running_mean builds. Compiled
+    by numba when available, see backend.
+    """
+    for row in range(x.shape[0]):
+        total = 0.
+        for j in range(n):
+            total += x[row, j]
+        out[row, 0] = total
+        for j in range(n, x.shape[1]):
+            total += x[row, j] - x[row, j - n]
+            out[row, j - n + 1] = total
+
+
+_window_sums_jit = backend.jit(_window_sums)
+
+
+def running_median(data, n, centered=False, axis=-1, out=None):
+    """Running median of n data points in O(len(data) log n)
+
+    Parameters
+    ----------
+    data, n, centered, axis, out:
+        see running_mean
+
+    Return
+    ------
+    array of the same shape as data, NaN where the window is incomplete or
+    holds a NaN
+    """
+    def kernel(x):
+        # pandas' skip list based rolling median, one column per row of x
+        rows = x.reshape(-1, x.shape[-1])
+        medians = pd.DataFrame(rows.T).rolling(n).median().values
+        return medians[n - 1:].T.reshape(x.shape[:-1] + (-1,))
+
+    return _apply(kernel, data, n, centered, axis, out)
+
+
+def savgol(data, n, polyorder=2, deriv=0, delta=1.0, centered=True, axis=-1,
+           out=None):
+    """Savitzky-Golay filter: least squares polynomial fit over n points
+
+    Parameters
+    ----------
+    data, n, axis, out:
+        see running_mean
+    polyorder: int, default = 2
+        order of the fitted polynomial, smaller than n
+    deriv: int, default = 0
+        order of the derivative to return
+    delta: number, default = 1.0
+        sample spacing, used when deriv > 0
+    centered: boolean, default = True
+        evaluate the polynomial at the middle of the window; if False at
+        its last sample, which gives a causal filter
+
+    Notes
+    -----
+    Costs O(len(data) * n), with a small, fixed window that is effectively
+    linear in the length of the recording.
+
+    Return
+    ------
+    array of the same shape as data, NaN where the window is incomplete or
+    holds a NaN
+    """
+    pos = n // 2 if centered else n - 1
+    coeffs = savgol_coeffs(n, polyorder, deriv=deriv, delta=delta, pos=pos,
+                           use='dot')
+
+    def kernel(x):
+        corr = correlate1d(x, coeffs, axis=-1, mode='constant')
+        return corr[..., n // 2:n // 2 + x.shape[-1] - n + 1]
+
+    return _apply(kernel, data, n, centered, axis, out)
+
+
+_FILTERS = {'mean': running_mean, 'median': running_median,
+            'savgol': savgol}
+
+
+class Smoother(object):
+    """
+    Resumable smoothing of a recording that arrives in chunks, e.g. from
+    read_abf.iter_chunks or read_abf.follow.
+
+    Only the last n - 1 samples are kept between chunks, so memory does
+    not grow with the recording. Concatenating the output of every update
+    and of flush gives what the filter returns for the whole recording in
+    one call. Centered filters finalize a sample only once
+    the n // 2 samples after it have arrived, so their output lags behind
+    the input by that many samples.
+
+    Parameters
+    ----------
+    method: str (default: 'mean')
+        'mean', 'median' or 'savgol'
+    n: positive int
+        window length (samples)
+    centered: boolean, default = False
+        see running_mean (savgol also accepts it)
+    axis: int, default = -1
+        axis of the chunks holding samples
+    **kwargs:
+        passed on to the filter, e.g. polyorder for savgol
+
+    Examples
+    --------
+    >>> smoother = Smoother('median', 51)
+    >>> for df in read_abf.iter_chunks('cell.abf', 10):
+    ...     smoothed = smoother.update(df.primary.values)
+    >>> rest = smoother.flush()
+    """
+
+    def __init__(self, method='mean', n=200, centered=False, axis=-1,
+                 **kwargs):
+        self.filter = _FILTERS[method]
+        self.n = n
+        self.centered = centered
+        self.axis = axis
+        self.kwargs = kwargs
+        # number of samples received and of samples smoothed so far
+        self.received = 0
+        self.emitted = 0
+        self._tail = None
+
+    def update(self, chunk):
+        """
+        Adds a chunk of samples and returns the smoothed values of every
+        sample that can now be finalized, starting at sample self.emitted
+        (before the call).
+        """
+        chunk = np.moveaxis(np.asarray(chunk, dtype='float64'), self.axis, -1)
+        buffer = chunk if self._tail is None else \
+            np.concatenate([self._tail, chunk], axis=-1)
+        # absolute sample number of buffer[..., 0]
+        start = self.received - (0 if self._tail is None
+                                 else self._tail.shape[-1])
+        self.received += chunk.shape[-1]
+
+        lag = self.n - 1 - _first_output(self.n, self.centered)
+        stop = max(self.received - lag, self.emitted)
+        smoothed = self.filter(buffer, self.n, centered=self.centered,
+                               **self.kwargs)
+        result = smoothed[..., self.emitted - start:stop - start]
+        self.emitted = stop
+
+        # keep the inputs of every window that is still to be completed
+        keep = self.received - max(self.emitted -
+                                   _first_output(self.n, self.centered), 0)
+        self._tail = buffer[..., buffer.shape[-1] - min(keep,
+                                                        buffer.shape[-1]):]
+
+        return np.moveaxis(result, -1, self.axis)
+
+    def flush(self):
+        """
+        Returns the values of the samples still pending at the end of the
+        recording (NaN, as their windows are incomplete)
+        """
+        shape = (() if self._tail is None else self._tail.shape[:-1])
+        result = np.full(shape + (self.received - self.emitted,), np.nan)
+        self.emitted = self.received
+
+        return np.moveaxis(result, -1, self.axis)
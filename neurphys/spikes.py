@@ -0,0 +1,139 @@
+""" Functions to measure the shape of action potentials """
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from . import pacemaking
+from . import utilities as util
+
+
+def _features(w, pre, dt, dvdt, limit):
+    """
+    Features of a block of spike waveforms (spikes x samples, peak at
+    column pre), see ap_features. limit holds the number of samples after
+    each peak that belong to it.
+    """
+    events = np.arange(w.shape[0])
+    cols = np.arange(w.shape[1])
+    valid = ~np.isnan(w)
+    # slope[:, j] from sample j to j + 1, in mV/ms (V/s)
+    with np.errstate(invalid='ignore'):
+        slope = np.diff(w, axis=1) / (dt * 1e3)
+    peak = w[:, pre]
+
+    # threshold: first sample of the last run of slopes at or above dvdt
+    # before the peak, which needn't last up to the peak itself
+    above = slope[:, :pre] >= dvdt
+    found = above.any(axis=1)
+    last = pre - 1 - np.argmax(above[:, ::-1], axis=1)
+    below = ~above & (cols[:pre] < last[:, None])
+    start = np.where(below.any(axis=1),
+                     pre - np.argmax(below[:, ::-1], axis=1), 0)
+    start = np.where(found, start, pre)
+    thr = np.where(found, w[events, start], np.nan)
+    amp = peak - thr
+    half = thr + amp / 2
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # linear interpolation of the crossings of half amplitude: last
+        # sample below it before the peak and first one after the peak
+        rising = w[:, :pre] < half[:, None]
+        r = pre - 1 - np.argmax(rising[:, ::-1], axis=1)
+        r_time = r + (half - w[events, r]) / (w[events, r + 1] -
+                                              w[events, r])
+        falling = w[:, pre + 1:] < half[:, None]
+        f = pre + 1 + np.argmax(falling, axis=1)
+        f_time = f - 1 + (w[events, f - 1] - half) / (w[events, f - 1] -
+                                                      w[events, f])
+        half_width = np.where(found & falling.any(axis=1),
+                              (f_time - r_time) * dt, np.nan)
+
+        rise = (cols[:pre] >= start[:, None]) & valid[:, 1:pre + 1]
+        max_rise = np.where(rise, slope[:, :pre], -np.inf).max(axis=1)
+        max_rise[~found] = np.nan
+
+        # decay and after-hyperpolarization up to the next spike
+        after = (cols > pre) & (cols <= pre + limit[:, None]) & valid
+        decay = after[:, 1:] & valid[:, :-1]
+        max_decay = np.where(decay, slope, np.inf).min(axis=1)
+        max_decay[~decay.any(axis=1)] = np.nan
+        trough = np.where(after, w, np.inf).argmin(axis=1)
+        has_trough = after.any(axis=1)
+        ahp = np.where(has_trough, thr - w[events, trough], np.nan)
+        ahp_latency = np.where(has_trough, (trough - pre) * dt, np.nan)
+
+    return {'threshold': thr, 'threshold_time': (start - pre) * dt,
+            'peak': peak, 'amplitude': amp, 'half_width': half_width,
+            'max_rise': max_rise, 'max_decay': max_decay, 'ahp': ahp,
+            'ahp_latency': ahp_latency}
+
+
+def ap_features(df, mph, mpd, pre=0.003, post=0.01, dvdt=20.,
+                column='primary', workers=None, block=10000):
+    """Shape of every action potential of every sweep
+
+    Spikes are found with pacemaking.spike_table, then measured on a window
+    around each peak, all spikes of a block at once.
+
+    Parameters
+    ----------
+    df: data as pandas dataframe or sweeparray.SweepArray
+        membrane potential (mV), MultiIndex dataframe with sweeps as the
+        first index level, or a flat dataframe holding a single sweep
+    mph, mpd:
+        see pacemaking.calc_freq
+    pre: number (seconds), default = 0.003
+        time before each peak to search for the threshold
+    post: number (seconds), default = 0.01
+        time after each peak to search for the after-hyperpolarization,
+        which never extends past the next spike
+    dvdt: number (mV/ms, i.e. V/s), default = 20
+        threshold criterion: the threshold is the first sample of the last
+        run of samples rising at least as fast as dvdt before the peak, nan
+        if no sample does
+    column: str (default: 'primary')
+    workers: int or None (default)
+        see pacemaking.spike_table
+    block: int (default: 10000)
+        number of spikes measured at once, which bounds memory use
+
+    Return
+    ------
+    features: dataframe with one row per spike, the spike_table columns
+        (sweep, index, time, ISI, freq) followed by threshold (mV),
+        threshold_time (seconds, relative to the peak), peak (mV),
+        amplitude (peak - threshold, mV), half_width (seconds, width at
+        half amplitude), max_rise and max_decay (mV/ms), ahp (depth of the
+        trough after the spike below threshold, mV) and ahp_latency
+        (seconds from the peak to the trough). Features that can't be
+        measured within the window are nan.
+    """
+    spikes = pacemaking.spike_table(df, mph, mpd, column=column,
+                                    workers=workers)
+    names, values, time = util.sweep_matrix(df, column)
+    dt = time[1] - time[0]
+    pre, post = int(round(pre / dt)), int(round(post / dt))
+    width = pre + post + 1
+
+    # window starting at column i of padded is centered on sample i
+    padded = np.full((values.shape[0], values.shape[1] + width - 1), np.nan)
+    padded[:, pre:pre + values.shape[1]] = values
+    windows = sliding_window_view(padded, width, axis=1)
+
+    rows = pd.Index(names).get_indexer(spikes['sweep'].values)
+    index = spikes['index'].values
+    # samples after each peak before the next spike of the same sweep
+    limit = np.full(index.size, post)
+    same = rows[1:] == rows[:-1]
+    limit[:-1][same] = np.minimum(np.diff(index)[same] - 1, post)
+
+    blocks = [_features(windows[rows[first:first + block],
+                                index[first:first + block]],
+                        pre, dt, dvdt, limit[first:first + block])
+              for first in range(0, index.size, block)]
+    for key in ['threshold', 'threshold_time', 'peak', 'amplitude',
+                'half_width', 'max_rise', 'max_decay', 'ahp', 'ahp_latency']:
+        spikes[key] = np.concatenate([b[key] for b in blocks]) if blocks \
+            else np.array([])
+
+    return spikes
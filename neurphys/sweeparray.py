@@ -0,0 +1,236 @@
+"""
+SweepArray: the samples of a recording as one contiguous NumPy buffer.
+"""
+
+import numpy as np
+import pandas as pd
+from . import utilities as util
+
+
+class SweepArray(object):
+    """
+    Recording held as a single (sweeps x channels x samples) array, with
+    its sampling rate, channel units and sweep names.
+
+    The buffer is stored channel by channel, so every channel is one
+    contiguous (sweeps x samples) block that analyses can reduce across
+    sweeps at once, and the read_abf DataFrame layout (one column per
+    channel, sweep after sweep) can be built on top of it without copying.
+    `values` is a (sweeps x channels x samples) view of the same buffer.
+
+    Parameters
+    ----------
+    data: 3D array_like (sweeps x channels x samples) or SweepArray buffer
+        Samples in physical units; sweeps shorter than the longest padded
+        with NaN.
+    sampling_rate: number (Hz)
+    channels: list of str or None (default)
+        Channel (column) names, 'primary', 'channel_1', ... if None.
+    sweeps: list of str or None (default)
+        Sweep names, 'sweep001', 'sweep002', ... if None.
+    units: list of str or None (default)
+    lengths: 1D array_like of ints or None (default)
+        Samples recorded in each sweep, all samples if None.
+    t0: number (seconds), default = 0
+        Time of the first sample of every sweep.
+    """
+
+    def __init__(self, data, sampling_rate, channels=None, sweeps=None,
+                 units=None, lengths=None, t0=0.):
+        data = np.asarray(data, dtype='float64')
+        # channels x sweeps x samples, one contiguous block per channel
+        self._buffer = np.ascontiguousarray(data.transpose(1, 0, 2))
+        num_sweeps, num_channels, num_samples = data.shape
+        self.sampling_rate = float(sampling_rate)
+        self.t0 = float(t0)
+        if channels is None:
+            channels = ['primary'] + ['channel_{0}'.format(i)
+                                      for i in range(1, num_channels)]
+        self.channels = list(channels)
+        if sweeps is None:
+            sweeps = ['sweep' + str(i + 1).zfill(3)
+                      for i in range(num_sweeps)]
+        self.sweeps = list(sweeps)
+        self.units = units
+        if lengths is None:
+            lengths = np.full(num_sweeps, num_samples)
+        self.lengths = np.asarray(lengths, dtype='int64')
+
+    @classmethod
+    def _from_buffer(cls, buffer, sampling_rate, channels, sweeps, units,
+                     lengths, t0):
+        """ Wraps a (channels x sweeps x samples) buffer without copying """
+        arr = cls.__new__(cls)
+        arr._buffer = buffer
+        arr.sampling_rate = float(sampling_rate)
+        arr.t0 = float(t0)
+        arr.channels = list(channels)
+        arr.sweeps = list(sweeps)
+        arr.units = units
+        arr.lengths = np.asarray(lengths, dtype='int64')
+
+        return arr
+
+    def __len__(self):
+        return self._buffer.shape[1]
+
+    def __repr__(self):
+        return '<SweepArray: {0} sweeps, {1} channels, {2} samples, ' \
+               '{3:g} Hz>'.format(self.num_sweeps, self.num_channels,
+                                  self.num_samples, self.sampling_rate)
+
+    @property
+    def values(self):
+        """ (sweeps x channels x samples) view of the buffer """
+        return self._buffer.transpose(1, 0, 2)
+
+    @property
+    def num_sweeps(self):
+        return self._buffer.shape[1]
+
+    @property
+    def num_channels(self):
+        return self._buffer.shape[0]
+
+    @property
+    def num_samples(self):
+        return self._buffer.shape[2]
+
+    @property
+    def time(self):
+        """ Time (seconds) of each sample from the start of its sweep """
+        return self.t0 + np.arange(self.num_samples) / self.sampling_rate
+
+    def channel(self, channel='primary'):
+        """ Contiguous (sweeps x samples) view of one channel """
+        return self._buffer[self.channels.index(channel)]
+
+    def sweep(self, sweep):
+        """ (channels x samples) view of one sweep, by name or position """
+        i = self.sweeps.index(sweep) if isinstance(sweep, str) else sweep
+
+        return self._buffer[:, i, :self.lengths[i]]
+
+    def select(self, sweeps):
+        """ New SweepArray with the given sweep names, in that order """
+        picks = [self.sweeps.index(sweep) for sweep in sweeps]
+
+        return SweepArray._from_buffer(self._buffer[:, picks],
+                                       self.sampling_rate, self.channels,
+                                       sweeps, self.units,
+                                       self.lengths[picks], self.t0)
+
+    def _replace(self, channel, values):
+        """ New SweepArray with the (sweeps x samples) block of a channel
+        replaced by values """
+        buffer = self._buffer.copy()
+        buffer[self.channels.index(channel)] = values
+
+        return SweepArray._from_buffer(buffer, self.sampling_rate,
+                                       self.channels, self.sweeps,
+                                       self.units, self.lengths, self.t0)
+
+    def to_frame(self, time=False):
+        """DataFrame in the read_abf layout over the same buffer
+
+        A recording with a single sweep gives a flat frame indexed by
+        sample number, more sweeps a MultiIndex ('sweep', 'index') frame.
+        Time is recorded implicitly in df.attrs (see
+        utilities.time_values); time=True adds a time column, which is the
+        only part that is copied. Sweeps shorter than the longest keep
+        their NaN padding.
+        """
+        num_sweeps, num_samples = self.num_sweeps, self.num_samples
+        block = self._buffer.reshape(self.num_channels, -1)
+        if num_sweeps == 1:
+            index = pd.RangeIndex(num_samples)
+        else:
+            index = pd.MultiIndex(
+                levels=[self.sweeps, np.arange(num_samples)],
+                codes=[np.repeat(np.arange(num_sweeps), num_samples),
+                       np.tile(np.arange(num_samples), num_sweeps)],
+                names=['sweep', 'index'])
+
+        df = pd.DataFrame(block.T, index=index, columns=self.channels,
+                          copy=False)
+        if time:
+            df['time'] = np.tile(self.time, num_sweeps)
+        df.attrs['sampling_rate'] = self.sampling_rate
+        df.attrs['t0'] = self.t0
+        if num_sweeps > 1:
+            df.attrs['sweep_rows'] = util._sweep_bounds(
+                np.full(num_sweeps, num_samples))
+
+        return df
+
+    @classmethod
+    def from_frame(cls, df, channels=None, units=None):
+        """SweepArray from a read_abf or read_pv style DataFrame
+
+        When every sweep has the same length and the channel columns share
+        one block (as in frames from read_abf(engine='mmap') or to_frame),
+        the array is a view onto the frame's data; otherwise the samples
+        are copied, shorter sweeps padded with NaN.
+
+        Parameters
+        ----------
+        df: DataFrame
+            MultiIndex (sweep, index) frame or a flat single sweep frame,
+            with a time column or an implicit time axis.
+        channels: list of str or None (default)
+            Columns to take, every column but 'time' if None.
+        units: list of str or None (default)
+        """
+        if channels is None:
+            channels = [col for col in df.columns if col != 'time']
+        if isinstance(df.index, pd.MultiIndex):
+            sweeps, rows = util.sweep_rows(df)
+        else:
+            sweeps = [df.attrs.get('sweep', 'sweep001')]
+            rows = np.array([[0, len(df)]])
+        lengths = rows[:, 1] - rows[:, 0]
+        times = util.time_values(df.iloc[:1])
+        t0 = times[0] if len(times) else 0.
+        if 'sampling_rate' in df.attrs:
+            rate = df.attrs['sampling_rate']
+        else:
+            time = df['time'].values
+            rate = 1 / (time[1] - time[0])
+
+        uniform = (np.all(lengths == lengths[0]) and
+                   np.array_equal(rows[:, 0],
+                                  np.arange(len(rows)) * lengths[0]))
+        positions = [df.columns.get_loc(ch) for ch in channels]
+        consecutive = positions == list(range(positions[0],
+                                              positions[0] + len(positions)))
+        if uniform and consecutive:
+            # (columns x rows) view when the frame is backed by one block
+            block = df.values.T[positions[0]:positions[-1] + 1]
+            if block.dtype == np.float64:
+                buffer = block.reshape(len(channels), len(rows), lengths[0])
+                return cls._from_buffer(buffer, rate, channels, sweeps,
+                                        units, lengths, t0)
+
+        buffer = np.full((len(channels), len(rows), lengths.max()), np.nan)
+        for i, ch in enumerate(channels):
+            data = df[ch].values
+            for j, (start, stop) in enumerate(rows):
+                buffer[i, j, :stop - start] = data[start:stop]
+
+        return cls._from_buffer(buffer, rate, channels, sweeps, units,
+                                lengths, t0)
+
+
+def as_frame(data):
+    """
+    DataFrame for a SweepArray (see SweepArray.to_frame), else data. This
+    is a conversion shim: the analysis functions that only read a
+    recording call it and run their DataFrame code on the zero-copy frame
+    view. Functions returning a modified recording (utilities.baseline,
+    pacemaking.baseline_pacemaking) work on the buffer instead and return
+    a SweepArray.
+    """
+    if isinstance(data, SweepArray):
+        return data.to_frame()
+
+    return data
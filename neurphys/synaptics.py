@@ -1,6 +1,7 @@
 """ Functions to analyze synaptic events """
 
 import pandas as pd
+from . import sweeparray
 from . import utilities as util
 
 
@@ -10,7 +11,7 @@ def analyze_current(df, bsl_start, bsl_end, start_time, end_time, sign="min",
 
     Parameters
     -----------
-    df: data as pandas dataframe
+    df: data as pandas dataframe or sweeparray.SweepArray
         should contain time and primary columns
     bsl_start: positive number (seconds)
         designates beginning of epoch to use to baseline data
@@ -39,6 +40,7 @@ def analyze_current(df, bsl_start, bsl_end, start_time, end_time, sign="min",
     ***Note that if tau_plot is True, weighted tau will be returned even if
     calc_tau hasn't been set to True
     """
+    df = sweeparray.as_frame(df)
     df_bsl = util.baseline(df, bsl_start, bsl_end)
     peak_df = util.find_peak(df_bsl, start_time, end_time, sign=sign)
 
@@ -65,7 +67,7 @@ def calc_ppr(df, bsl_start, bsl_end, start_time, end_time, stim_interval,
 
     Input Parameters
     -----------------
-    df: data as pandas dataframe
+    df: data as pandas dataframe or sweeparray.SweepArray
         should contain time and primary columns
     bsl_start: positive number (seconds)
         designates beginning of epoch to use to baseline data
@@ -84,6 +86,7 @@ def calc_ppr(df, bsl_start, bsl_end, start_time, end_time, stim_interval,
     ------
     ppr_df: dataframe containing Peak 1 ampltiude, Peak 2 amplitude, and PPR
     """
+    df = sweeparray.as_frame(df)
     first_end = start_time + stim_interval
 
     df_bsl = util.baseline(df, bsl_start, bsl_end)
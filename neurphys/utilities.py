@@ -1,39 +1,446 @@
 """ Useful functions for performing ephys data analysis """
 
+import os
+import struct
 import numpy as np
 import pandas as pd
-from scipy.optimize import curve_fit
+from scipy.optimize import curve_fit, least_squares
+from concurrent.futures import ProcessPoolExecutor
+from . import smoothing
+from . import sweeparray
 
 
-def baseline(df, start_time, end_time):
+def time_values(df):
+    """Time (seconds) of every row of a dataframe
+
+    Parameters
+    ----------
+    df: data as pandas dataframe
+        should contain a time column, or record its time axis implicitly
+        in df.attrs['sampling_rate'] and df.attrs['t0'] (see Notes)
+
+    Notes
+    -----
+    Loaders called with time=False don't store a time column. The time of
+    a row is then t0 + sample number / sampling_rate, where the sample
+    number is the row's index label (the 'index' level for sweeps).
+
+    Return
+    ------
+    1D array of times
+    """
+    if 'time' in df.columns:
+        return df['time'].values
+
+    rate, t0 = _time_axis(df)
+    if isinstance(df.index, pd.MultiIndex):
+        samples = df.index.get_level_values(-1).values
+    else:
+        samples = df.index.values
+
+    return t0 + samples / rate
+
+
+def _time_axis(df):
+    """ Sampling rate and t0 recorded for a dataframe without time column """
+    try:
+        return df.attrs['sampling_rate'], df.attrs.get('t0', 0.)
+    except KeyError:
+        raise KeyError('DataFrame has neither a time column nor a '
+                       'sampling rate in df.attrs')
+
+
+def _window(df, rows, start_time, end_time):
+    """
+    Positions (relative to rows.start) of the rows of a single sweep,
+    df.iloc[rows], whose time lies between start and end times, as a slice
+    """
+    if 'time' in df.columns:
+        time = df['time'].values[rows]
+        return slice(np.searchsorted(time, start_time, 'left'),
+                     np.searchsorted(time, end_time, 'right'))
+
+    rate, t0 = _time_axis(df)
+    num_rows = rows.stop - rows.start
+    if not num_rows:
+        return slice(0, 0)
+    if isinstance(df.index, pd.MultiIndex):
+        codes = df.index.codes[-1][rows]
+        level = df.index.levels[-1]
+        first_sample, last_sample = level[codes[0]], level[codes[-1]]
+    else:
+        first_sample, last_sample = df.index[rows.start], \
+            df.index[rows.stop - 1]
+    contiguous = last_sample - first_sample == num_rows - 1
+    if contiguous:
+        low, high = first_sample, last_sample
+    else:
+        samples = level.values[codes] if isinstance(df.index, pd.MultiIndex) \
+            else df.index.values[rows]
+        low, high = samples.min(), samples.max()
+
+    # sample numbers at the window edges; the tolerance keeps edges that
+    # fall exactly on a sample inside the window despite rounding
+    bounds = np.clip([(start_time - t0) * rate - 1e-6,
+                      (end_time - t0) * rate + 1e-6], low - 1, high + 1)
+    first, last = int(np.ceil(bounds[0])), int(np.floor(bounds[1]))
+
+    if contiguous:
+        # contiguous sample numbers: position = sample - first sample
+        start = min(max(first - first_sample, 0), num_rows)
+        stop = min(max(last + 1 - first_sample, 0), num_rows)
+        return slice(start, max(start, stop))
+
+    return slice(np.searchsorted(samples, first, 'left'),
+                 np.searchsorted(samples, last, 'right'))
+
+
+def time_window(df, start_time, end_time):
+    """Rows of a dataframe whose time lies between start and end times
+    (inclusive), for use with df.iloc or array indexing
+
+    Parameters
+    -----------
+    df: data as pandas dataframe
+        should contain time column, or record time implicitly (see
+        time_values)
+    start_time: number (seconds)
+        designates beginning of the window
+    end_time: number (seconds)
+        designates end of the window
+
+    Notes
+    -----
+    With an implicit time axis the window is resolved by arithmetic on the
+    sampling rate, with a time column by binary search on it. Frames with
+    several sweeps (MultiIndex) are resolved sweep by sweep over the row
+    ranges from sweep_rows, so no row outside the window is visited.
+
+    Return
+    ------
+    window: slice (or 1D int array of row positions for multi-sweep
+        frames, selecting the window in every sweep at once)
+    """
+    if not isinstance(df.index, pd.MultiIndex):
+        return _window(df, slice(0, len(df)), start_time, end_time)
+
+    _, rows = sweep_rows(df)
+    positions = []
+    for start, stop in rows:
+        window = _window(df, slice(start, stop), start_time, end_time)
+        positions.append(np.arange(start + window.start,
+                                   start + window.stop))
+
+    return np.concatenate(positions) if positions else \
+        np.array([], dtype=int)
+
+
+def sweep_rows(df):
+    """Row range of every sweep in a multi-sweep dataframe
+
+    Parameters
+    ----------
+    df: MultiIndex dataframe with sweeps as the first index level
+
+    Notes
+    -----
+    Loaders store the sweep boundaries (a tuple of the first row of every
+    sweep followed by the number of rows) in df.attrs['sweep_rows'] when
+    the data is read. They are checked against the index codes before use
+    and rebuilt from them if the frame was reordered or filtered since.
+    The rows of a sweep are one range in frames from the loaders; in a
+    reordered frame (e.g. sorted by sample or shuffled) a sweep can span
+    several ranges, and then appears once per range.
+
+    Return
+    ------
+    names: list of sweep names, in the order they appear in df
+    rows: 2D int array (ranges x 2) of [start, stop) row positions
+    """
+    codes = np.asarray(df.index.codes[0])
+    levels = df.index.levels[0]
+
+    bounds = df.attrs.get('sweep_rows')
+    if bounds is not None:
+        bounds = np.asarray(bounds, dtype='int64')
+        starts, stops = bounds[:-1], bounds[1:]
+        if (starts.size and bounds[0] == 0 and bounds[-1] == len(df) and
+                np.all(stops > starts) and
+                np.array_equal(codes, np.repeat(codes[starts],
+                                                stops - starts))):
+            return (list(levels[codes[starts]]),
+                    np.column_stack([starts, stops]))
+
+    starts = np.flatnonzero(np.diff(codes)) + 1
+    starts = np.concatenate([[0], starts]) if len(codes) else starts
+    stops = np.append(starts[1:], len(codes))
+    df.attrs['sweep_rows'] = _sweep_bounds(stops - starts)
+
+    return list(levels[codes[starts]]), np.column_stack([starts, stops])
+
+
+def _sweep_bounds(lengths):
+    """ df.attrs['sweep_rows'] entry for consecutive sweep lengths """
+    return tuple(int(i) for i in np.concatenate([[0], np.cumsum(lengths)]))
+
+
+def take_sweeps(df, names):
+    """Selects sweeps by name with a single positional gather over the
+    rows of the dataframe, in the order given
+
+    Sweeps spanning several row ranges (see sweep_rows) are gathered from
+    the index codes instead, keeping the order of their rows in df.
+
+    Parameters
+    ----------
+    df: MultiIndex dataframe with sweeps as the first index level
+    names: list of sweep names
+
+    Return
+    ------
+    df: dataframe of the selected sweeps, with its sweep rows recorded
+    """
+    all_names, rows = sweep_rows(df)
+    lookup = {name: i for i, name in enumerate(all_names)}
+    missing = [name for name in names if name not in lookup]
+    if missing:
+        raise KeyError('Cannot index a multi-index axis with these keys: '
+                       '{0}'.format(missing))
+    if len(lookup) < len(all_names):
+        return _gather_sweeps(df, names)
+
+    picks = rows[[lookup[name] for name in names]]
+
+    lengths = picks[:, 1] - picks[:, 0]
+    stops = np.cumsum(lengths)
+    if len(picks) == 1 or np.array_equal(picks[1:, 0], picks[:-1, 1]):
+        # consecutive sweeps are a plain slice
+        sub = df.iloc[picks[0, 0]:picks[-1, 1]] if len(picks) else df.iloc[:0]
+    else:
+        positions = (np.arange(stops[-1]) +
+                     np.repeat(picks[:, 0] - (stops - lengths), lengths))
+        sub = df.take(positions)
+    sub.attrs['sweep_rows'] = _sweep_bounds(lengths)
+
+    return sub
+
+
+def _gather_sweeps(df, names):
+    """
+    take_sweeps for frames whose sweeps span several row ranges: the rows
+    of every sweep, grouped by a stable sort of the sweep codes
+    """
+    codes = np.asarray(df.index.codes[0])
+    order = np.argsort(codes, kind='stable')
+    offsets = np.concatenate(
+        [[0], np.cumsum(np.bincount(codes,
+                                    minlength=len(df.index.levels[0])))])
+    picks = df.index.levels[0].get_indexer(names)
+    positions = [order[offsets[i]:offsets[i + 1]] for i in picks]
+    sub = df.take(np.concatenate(positions) if positions else
+                  np.array([], dtype=int))
+    sub.attrs['sweep_rows'] = _sweep_bounds([p.size for p in positions])
+
+    return sub
+
+
+def sweep_matrix(df, column='primary'):
+    """A column of every sweep as one (sweeps x samples) array
+
+    Parameters
+    ----------
+    df: data as pandas dataframe or sweeparray.SweepArray
+        MultiIndex dataframe with sweeps as the first index level, or a
+        flat dataframe holding a single sweep
+    column: str (default: 'primary')
+
+    Notes
+    -----
+    The array is a view onto the column when all sweeps have the same
+    length and are stored in order, otherwise a copy with shorter sweeps
+    padded with NaN. Sweeps are assumed to share their time axis (time from
+    the start of each sweep, as read_abf and read_pv produce), which is
+    returned as the times of the longest sweep.
+
+    Return
+    ------
+    names: list of sweep names
+    values: 2D array (sweeps x samples)
+    time: 1D array of times (seconds) of the samples
+    """
+    if isinstance(df, sweeparray.SweepArray):
+        return list(df.sweeps), df.channel(column), df.time
+
+    if isinstance(df.index, pd.MultiIndex):
+        names, rows = sweep_rows(df)
+    else:
+        names, rows = [df.attrs.get('sweep', 'sweep001')], \
+            np.array([[0, len(df)]])
+    lengths = rows[:, 1] - rows[:, 0]
+    longest = np.argmax(lengths)
+    data = df[column].values
+
+    if np.all(lengths == lengths[0]) and \
+            np.array_equal(rows[:, 0], np.arange(len(rows)) * lengths[0]):
+        values = data[:rows[-1, 1]].reshape(len(rows), lengths[0])
+    else:
+        values = np.full((len(rows), lengths.max()), np.nan)
+        for i, (start, stop) in enumerate(rows):
+            values[i, :stop - start] = data[start:stop]
+    time = time_values(df.iloc[rows[longest, 0]:rows[longest, 1]])
+
+    return names, values, time
+
+
+def _row_means(sub):
+    """ Mean of every row ignoring NaN padding, NaN for empty rows """
+    counts = np.sum(~np.isnan(sub), axis=1)
+    means = np.full(sub.shape[0], np.nan)
+    valid = counts > 0
+    means[valid] = np.nansum(sub, axis=1)[valid] / counts[valid]
+
+    return means
+
+
+def _window_slices(time, windows):
+    """ Column slices of a sorted time axis for (start, end) windows """
+    time = np.asarray(time)
+    return [slice(np.searchsorted(time, start, 'left'),
+                  np.searchsorted(time, end, 'right'))
+            for start, end in windows]
+
+
+def measure_windows(df, windows, sign='min', column='primary',
+                    bsl_window=None):
+    """Mean and peak of every sweep in every time window
+
+    Each window is resolved to a column range of the (sweeps x samples)
+    array from sweep_matrix once, and measured across all sweeps with a
+    single reduction.
+
+    Parameters
+    ----------
+    df: data as pandas dataframe or sweeparray.SweepArray
+        MultiIndex dataframe with sweeps as the first index level, or a
+        flat single sweep dataframe (see sweep_matrix)
+    windows: dict or list
+        name: (start_time, end_time) pairs (seconds), or a list of
+        (start_time, end_time) pairs named by their position
+    sign: string (either 'min' or 'max', default 'min')
+        direction of the peaks (see find_peak)
+    column: str (default: 'primary')
+    bsl_window: (start_time, end_time) or None (default)
+        if given, the mean of each sweep over this window is reported as
+        'Baseline' and subtracted from its means and peaks (see baseline)
+
+    Return
+    ------
+    table: dataframe with one row per sweep and window, and columns
+        sweep, window, Mean, Peak Amp and Peak time (plus Baseline)
+    """
+    if isinstance(windows, dict):
+        window_names = list(windows.keys())
+        windows = list(windows.values())
+    else:
+        window_names = list(range(len(windows)))
+    names, values, time = sweep_matrix(df, column)
+    num_sweeps, num_windows = values.shape[0], len(windows)
+
+    means = np.full((num_windows, num_sweeps), np.nan)
+    peaks = np.full((num_windows, num_sweeps), np.nan)
+    peak_times = np.full((num_windows, num_sweeps), np.nan)
+    # NaN (padding) never wins the peak search
+    fill = np.inf if sign == 'min' else -np.inf
+    for i, window in enumerate(_window_slices(time, windows)):
+        sub = values[:, window]
+        if not sub.shape[1]:
+            continue
+        means[i] = _row_means(sub)
+        valid = ~np.isnan(means[i])
+        filled = np.where(np.isnan(sub), fill, sub)
+        idx = filled.argmin(axis=1) if sign == 'min' else \
+            filled.argmax(axis=1)
+        peaks[i, valid] = sub[np.arange(num_sweeps), idx][valid]
+        peak_times[i, valid] = time[window][idx][valid]
+
+    table = pd.DataFrame({'sweep': np.tile(np.asarray(names, dtype=object),
+                                           num_windows),
+                          'window': np.repeat(np.asarray(window_names,
+                                                         dtype=object),
+                                              num_sweeps)})
+    if bsl_window is not None:
+        bsl = _row_means(values[:, _window_slices(time, [bsl_window])[0]])
+        means -= bsl
+        peaks -= bsl
+        table['Baseline'] = np.tile(bsl, num_windows)
+    table['Mean'] = means.ravel()
+    table['Peak Amp'] = peaks.ravel()
+    table['Peak time'] = peak_times.ravel()
+
+    return table
+
+
+def baseline(df, start_time, end_time, per_sweep=False):
     """Subtracts from entire data column average of subset of data column
     defined by start and end times.
 
     Parameters
     -----------
-    df: data as pandas dataframe
+    df: data as pandas dataframe or sweeparray.SweepArray
         should contain time and primary columns
     start_time: positive number (seconds)
         designates beginning of the region over which to average
     end_time: positive number (seconds)
         designates end of region over which to average
+    per_sweep: boolean, default = False
+        for multi-sweep dataframes, subtract from each sweep the average of
+        its own window instead of one average across all sweeps
 
     Return
     ------
-    df: dataframe with modified primary column
+    df: dataframe with modified primary column, or a new SweepArray for a
+        SweepArray
     """
-    avg = df.primary[(df.time >= start_time) & (df.time <= end_time)].mean()
+    if isinstance(df, sweeparray.SweepArray):
+        _, values, time = sweep_matrix(df)
+        window = values[:, _window_slices(time, [(start_time, end_time)])[0]]
+        if per_sweep:
+            bsl = np.nanmean(window, axis=1, keepdims=True)
+        else:
+            bsl = np.nanmean(window)
+        return df._replace('primary', values - bsl)
+
+    if per_sweep and isinstance(df.index, pd.MultiIndex):
+        _, rows = sweep_rows(df)
+        bsl = measure_windows(df, [(start_time, end_time)])['Mean'].values
+        df.primary -= np.repeat(bsl, rows[:, 1] - rows[:, 0])
+        return df
+
+    avg = df.primary.iloc[time_window(df, start_time, end_time)].mean()
     df.primary -= avg
 
     return df
 
 
-def find_peak(df, start_time, end_time, sign="min"):
+def _parabolic_peak(y0, y1, y2):
+    """
+    Offset (in samples, within +-0.5) and value of the vertex of the
+    parabola through three equally spaced samples around a local extremum
+    """
+    curvature = y0 - 2*y1 + y2
+    if curvature == 0:
+        return 0., y1
+    offset = 0.5 * (y0 - y2) / curvature
+
+    return offset, y1 - 0.25 * (y0 - y2) * offset
+
+
+def find_peak(df, start_time, end_time, sign="min", refine=False):
     """Returns min (or max) of data subset as a dataframe
 
     Parameters
     -----------
-    df: data as pandas dataframe
+    df: data as pandas dataframe or sweeparray.SweepArray
         should contain time and primary columns
     start_time: positive number (seconds)
         designates beginning of the epoch in which the event occurs
@@ -41,21 +448,43 @@ def find_peak(df, start_time, end_time, sign="min"):
         designates end of the epoch in which the event occurs
     sign: string (either 'min' or 'max')
         indicates direction of event (min = neg going, max = pos going)
+    refine: boolean, default = False
+        refine the peak amplitude and time between samples by fitting a
+        parabola through the peak sample and its two neighbors
+
+    Notes
+    -----
+    The first sample holding the extreme value is the peak; NaN values are
+    ignored. A refined peak time no longer falls on a sample, while the
+    returned index is still that of the peak sample.
 
     Return
     -------
     peak_df: dataframe of Peak Amp and Peak time
     """
-    df_sub = df[(df.time >= start_time) & (df.time <= end_time)]
+    df = sweeparray.as_frame(df)
+    window = time_window(df, start_time, end_time)
+    values = df.primary.values[window]
+    if not values.size or np.all(np.isnan(values)):
+        return pd.DataFrame({'Peak time': [], 'Peak Amp': []},
+                            index=df.index[:0])
+
     if sign == "min":
-        peak = df_sub.primary.min()
+        i = np.nanargmin(values)
     elif sign == "max":
-        peak = df_sub.primary.max()
+        i = np.nanargmax(values)
+    df_sub = df.iloc[window]
+    times = time_values(df_sub)
+    peak, peak_time = values[i], times[i]
 
-    peak_df = df_sub[df_sub.primary == peak][['time', 'primary']]
-    peak_df.columns = ['Peak time', 'Peak Amp']
+    if refine and 0 < i < values.size - 1:
+        offset, refined = _parabolic_peak(*values[i-1:i+2])
+        if not np.isnan(refined):
+            peak = refined
+            peak_time += offset * (times[i+1] - times[i-1]) / 2
 
-    return peak_df.head(1)
+    return pd.DataFrame({'Peak time': [peak_time], 'Peak Amp': [peak]},
+                        index=df_sub.index[i:i+1])
 
 
 def calc_decay(df, peak, peak_time, return_plot_vals=False):
@@ -63,7 +492,7 @@ def calc_decay(df, peak, peak_time, return_plot_vals=False):
 
     Parameters
     -----------
-    df: data as pandas dataframe
+    df: data as pandas dataframe or sweeparray.SweepArray
         should contain time and primary columns
     peak: scalar (pA or mV)
         amplitude of event
@@ -85,7 +514,9 @@ def calc_decay(df, peak, peak_time, return_plot_vals=False):
         y values (primary) and 3. the y-data for the fit. Useful for plotting
         the fit overlayed with the raw data.
     """
-    peak_sub = df[df.time >= peak_time]
+    df = sweeparray.as_frame(df)
+    peak_sub = df.iloc[time_window(df, peak_time, np.inf)]
+    peak_sub_time = pd.Series(time_values(peak_sub), index=peak_sub.index)
 
     if peak < 0:
         index1 = peak_sub[peak_sub.primary >= peak * 0.90].index[0]
@@ -98,7 +529,8 @@ def calc_decay(df, peak, peak_time, return_plot_vals=False):
         fit_sub = peak_sub.loc[index1:index2]
         guess = np.array([1, 1, 1, 1, 0])
 
-    x_zeroed = fit_sub.time - fit_sub.time.values[0]
+    fit_sub_time = peak_sub_time.loc[index1:index2]
+    x_zeroed = fit_sub_time - fit_sub_time.values[0]
 
     def exp_decay(x, a, b, c, d, e):
         return a*np.exp(-x/b) + c*np.exp(-x/d) + e
@@ -106,7 +538,7 @@ def calc_decay(df, peak, peak_time, return_plot_vals=False):
     popt, pcov = curve_fit(exp_decay, x_zeroed*1e3,
                            fit_sub.primary*1e12, guess)
 
-    x_full_zeroed = peak_sub.time - peak_sub.time.values[0]
+    x_full_zeroed = peak_sub_time - peak_sub_time.values[0]
     y_curve = exp_decay(x_full_zeroed*1e3, *popt) / 1e12
 
     amp1 = popt[0]
@@ -122,6 +554,225 @@ def calc_decay(df, peak, peak_time, return_plot_vals=False):
         return tau
 
 
+def _biexp(x, a, b, c, d, e):
+    return a*np.exp(-x/b) + c*np.exp(-x/d) + e
+
+
+def _biexp_jac(params, x, y):
+    """ Analytic Jacobian of the _biexp residuals """
+    a, b, c, d, _ = params
+    exp_b = np.exp(-x/b)
+    exp_d = np.exp(-x/d)
+
+    return np.column_stack([exp_b, a*x*exp_b/b**2, exp_d, c*x*exp_d/d**2,
+                            np.ones_like(x)])
+
+
+def _biexp_residuals(params, x, y):
+    return _biexp(x, *params) - y
+
+
+def _loglinear(x, y):
+    """
+    Amplitude and time constant of a single exponential through y, from a
+    straight line fit to log|y|. None if y does not decay.
+    """
+    keep = (np.sign(y) == np.sign(y[0])) & (y != 0)
+    if keep.sum() < 2:
+        return None
+    slope, intercept = np.polyfit(x[keep], np.log(np.abs(y[keep])), 1)
+    if slope >= 0:
+        return None
+
+    return np.sign(y[0]) * np.exp(intercept), -1/slope
+
+
+def decay_guess(x, y):
+    """Starting values for a biexponential decay fit by exponential peeling
+
+    A single exponential fitted (log-linearly) to the second half of the
+    decay gives the slow component; one fitted to what is left of the
+    first half once the slow component is removed gives the fast one.
+
+    Parameters
+    ----------
+    x: 1D array (time from the start of the decay)
+    y: 1D array (baselined values)
+
+    Return
+    ------
+    guess: array of a, b, c, d, e for a*exp(-x/b) + c*exp(-x/d) + e, with
+        b the fast and d the slow time constant
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    span = x[-1] - x[0] if x[-1] > x[0] else 1.
+    half = len(x) // 2
+
+    slow = _loglinear(x[half:], y[half:])
+    if slow is None:
+        slow = (y[0] / 2, span / 2)
+    fast = _loglinear(x[:half], (y - slow[0]*np.exp(-x/slow[1]))[:half])
+    if fast is None or fast[1] >= slow[1]:
+        fast = (y[0] - slow[0], slow[1] / 5)
+
+    return np.array([fast[0], fast[1], slow[0], slow[1], 0.])
+
+
+def _fit_decay_chunk(segments, guesses, warm_start, max_nfev):
+    """
+    Fits consecutive decays, optionally seeding each one from the previous
+    converged fit. Returns a list of (params, converged, nfev).
+    """
+    results = []
+    previous = None
+    for (x, y), guess in zip(segments, guesses):
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        if len(x) < 5:
+            results.append((np.full(5, np.nan), False, 0))
+            continue
+        x = x - x[0]
+
+        if guess is None:
+            guess = previous if warm_start and previous is not None \
+                else decay_guess(x, y)
+        # fit in units of the segment's duration and amplitude, so every
+        # event is equally well conditioned
+        x_scale = x[-1] if x[-1] > 0 else 1.
+        y_scale = np.max(np.abs(y)) or 1.
+        scale = np.array([y_scale, x_scale, y_scale, x_scale, y_scale])
+        start = np.asarray(guess, dtype=float) / scale
+        start[[1, 3]] = np.clip(start[[1, 3]], 1e-6, 1e6)
+        try:
+            with np.errstate(over='ignore', invalid='ignore'):
+                fit = least_squares(_biexp_residuals, start, jac=_biexp_jac,
+                                    args=(x / x_scale, y / y_scale),
+                                    method='lm', max_nfev=max_nfev)
+        except ValueError:
+            results.append((np.full(5, np.nan), False, 0))
+            continue
+
+        params = fit.x * scale
+        converged = bool(fit.success and np.all(np.isfinite(params)) and
+                         params[1] > 0 and params[3] > 0)
+        if converged:
+            previous = params
+        results.append((params, converged, fit.nfev))
+
+    return results
+
+
+def fit_decays(segments, guesses=None, warm_start=False, workers=None,
+               max_nfev=None):
+    """Biexponential fits of many decays at once
+
+    Every decay is fitted with scipy.optimize.least_squares using the
+    analytic Jacobian of a*exp(-x/b) + c*exp(-x/d) + e, starting from
+    decay_guess or from the previous event's solution.
+
+    Parameters
+    ----------
+    segments: list of (x, y) pairs of 1D arrays
+        time (seconds) and baselined values of each decay, e.g. from
+        decay_segments
+    guesses: list of 5 element arrays (or None) or None (default)
+        starting values per event; None entries are estimated
+    warm_start: boolean, default = False
+        seed each fit with the solution of the previous event (e.g. the
+        same event in the previous sweep) when that fit converged, instead
+        of estimating starting values
+    workers: int or None (default)
+        number of processes fitting at the same time; None or 1 fits in
+        this process. With warm_start every process works through a
+        contiguous run of events.
+    max_nfev: int or None (default)
+        maximum number of function evaluations per fit
+
+    Return
+    ------
+    fits: dataframe with one row per event: weighted tau, tau1 (fast) and
+        tau2 (slow) in seconds, amp1, amp2 and offset, converged (bool) and
+        nfev (number of function evaluations)
+    """
+    segments = list(segments)
+    if guesses is None:
+        guesses = [None] * len(segments)
+
+    if workers is not None and workers > 1 and len(segments) > 1:
+        bounds = np.linspace(0, len(segments), workers + 1).astype(int)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_fit_decay_chunk,
+                                       segments[first:stop],
+                                       guesses[first:stop], warm_start,
+                                       max_nfev)
+                       for first, stop in zip(bounds[:-1], bounds[1:])]
+            results = [result for future in futures
+                       for result in future.result()]
+    else:
+        results = _fit_decay_chunk(segments, guesses, warm_start, max_nfev)
+
+    params = np.array([result[0] for result in results]).reshape(-1, 5)
+    # report the faster component first
+    swap = params[:, 1] > params[:, 3]
+    params[swap] = params[swap][:, [2, 3, 0, 1, 4]]
+    amp1, tau1, amp2, tau2, offset = params.T
+    with np.errstate(invalid='ignore', divide='ignore'):
+        tau = (tau1*amp1 + tau2*amp2) / (amp1 + amp2)
+
+    return pd.DataFrame({'tau': tau, 'tau1': tau1, 'tau2': tau2,
+                         'amp1': amp1, 'amp2': amp2, 'offset': offset,
+                         'converged': np.array([result[1]
+                                                for result in results],
+                                               dtype=bool),
+                         'nfev': np.array([result[2] for result in results],
+                                          dtype=int)})
+
+
+def decay_segments(df, peaks, column='primary'):
+    """Decay phase of every event in a peak table
+
+    As in calc_decay, the decay runs from the first sample after the peak
+    back within 90% of the peak amplitude to the first sample within 5% of
+    baseline.
+
+    Parameters
+    ----------
+    df: data as pandas dataframe or sweeparray.SweepArray
+        baselined, multi-sweep or single sweep (see sweep_matrix)
+    peaks: dataframe
+        'sweep', 'Peak Amp' and 'Peak time' columns, e.g. from
+        measure_windows
+    column: str (default: 'primary')
+
+    Return
+    ------
+    segments: list of (x, y) pairs, x being the time (seconds) from the
+        start of the decay; empty arrays where no decay was found
+    """
+    names, values, time = sweep_matrix(df, column)
+    lookup = {name: i for i, name in enumerate(names)}
+    starts = np.searchsorted(time, peaks['Peak time'].values)
+
+    segments = []
+    for sweep, peak, start in zip(peaks['sweep'].values,
+                                  peaks['Peak Amp'].values, starts):
+        sub = values[lookup[sweep], start:]
+        if peak < 0:
+            above_90, above_5 = sub >= peak * 0.90, sub >= peak * 0.05
+        else:
+            above_90, above_5 = sub <= peak * 0.90, sub <= peak * 0.05
+        if not above_90.any() or not above_5.any():
+            segments.append((np.array([]), np.array([])))
+            continue
+        first, last = np.argmax(above_90), np.argmax(above_5)
+        x = time[start + first:start + last + 1]
+        segments.append((x - x[0] if x.size else x,
+                         sub[first:last + 1]))
+
+    return segments
+
+
 def simple_smoothing(data, n):
     """Calculates running average of n data points
 
@@ -133,31 +784,17 @@ def simple_smoothing(data, n):
     Notes
     -----
     to return array of same length as data array, n-1 nan values
-    are placed at the start of the return array
+    are placed at the start of the return array (after any leading nan
+    values). See smoothing.running_mean, which this wraps, for centered
+    and 2D smoothing.
 
     Return:
     1D array of same length as input array (data)
     """
-    data = np.atleast_1d(data).astype('float64')
-    if np.isnan(np.sum(data)):
-        starting_nans = data[np.isnan(data)]
-        data_no_nan = data[len(starting_nans):]
-
-        smoothed = simple_smoothing(data_no_nan, n)
-
-        return np.append(starting_nans, smoothed)
+    return smoothing.running_mean(np.atleast_1d(data), n)
 
-    else:
-        cum_sum = np.cumsum(data, dtype=float)
-        cum_sum[n:] = cum_sum[n:] - cum_sum[:-n]
-
-        nan_array = np.full(n-1, np.nan)
-        smoothed = cum_sum[n - 1:] / n
-
-        return np.append(nan_array, smoothed)
 
-
-def _mock_df(rows=20, num_channels=2):
+def _mock_df(rows=20, num_channels=2, time=True):
     """
     Make a mock DataFrame that mimics neurphys.read_abf
     dataframe for testing purposes. Assuming at 10kHz sampling rate.
@@ -166,6 +803,9 @@ def _mock_df(rows=20, num_channels=2):
     ----------
     rows: int (default: 20)
     num_channels: int (default: 2)
+    time: bool (default: True)
+        add a time column; the sampling rate is recorded in df.attrs
+        either way
 
     Return
     ------
@@ -180,12 +820,17 @@ def _mock_df(rows=20, num_channels=2):
     d = {'channel_{}'.format(channel): np.random.randn(rows)
          for channel in range(num_channels)}
     d['primary'] = np.random.randn(rows)
-    d['time'] = np.arange(0, (rows*0.0001), 0.0001)
+    if time:
+        d['time'] = np.arange(rows) * 0.0001
+
+    df = pd.DataFrame(d)
+    df.attrs['sampling_rate'] = 1e4
+    df.attrs['t0'] = 0.
 
-    return pd.DataFrame(d)
+    return df
 
 
-def mock_multidf(rows=20, num_channels=2, num_sweeps=10):
+def mock_multidf(rows=20, num_channels=2, num_sweeps=10, time=True):
     """
     Make a mock DataFrame that mimics neurphys.read_abf
     dataframe for testing purposes. Assuming at 10kHz sampling rate.
@@ -195,6 +840,9 @@ def mock_multidf(rows=20, num_channels=2, num_sweeps=10):
     rows: int (default: 20)
     num_channels: int (default: 2)
     sweeps: int (default: 10)
+    time: bool (default: True)
+        add a time column; the sampling rate is recorded in df.attrs
+        either way
 
     Note
     ----
@@ -206,6 +854,170 @@ def mock_multidf(rows=20, num_channels=2, num_sweeps=10):
                    for sweep in range(num_sweeps)]
 
     for sweep in sweep_names:
-        df_dict[sweep] = _mock_df(rows=rows, num_channels=num_channels)
+        df_dict[sweep] = _mock_df(rows=rows, num_channels=num_channels,
+                                  time=time)
 
-    return pd.concat(df_dict, names=['sweep'])
+    df = pd.concat(df_dict, names=['sweep', 'index'])
+    df.attrs['sampling_rate'] = 1e4
+    df.attrs['t0'] = 0.
+
+    return df
+
+
+def mock_abf(filepath, rows=20, num_channels=2, num_sweeps=10,
+             sampling_rate=10e3):
+    """
+    Write a small episodic ABF (v1.83) file of random int16 samples that
+    can be read back with neurphys.read_abf for testing purposes.
+
+    Parameters
+    ----------
+    filepath: str
+        Full filepath WITH '.abf' extension.
+    rows: int (default: 20)
+        Samples per channel in each sweep.
+    num_channels: int (default: 2)
+    num_sweeps: int (default: 10)
+    sampling_rate: float (default: 10 kHz)
+
+    Return
+    ------
+    data: 3D array
+        Values written to the file in physical units, shaped
+        (sweeps x samples x channels).
+    """
+
+    header = bytearray(11 * 512)
+    num_samples = rows * num_channels * num_sweeps
+    synch_ptr = 11 + (num_samples * 2 + 511) // 512
+    gains = 10 / (np.arange(1, num_channels + 1) * 1e-3 * 32768)
+    offsets = np.arange(num_channels) * 0.5
+
+    def put(fmt, offset, *vals):
+        struct.pack_into('<' + fmt, header, offset, *vals)
+
+    put('4s', 0, b'ABF ')
+    put('f', 4, 1.83)
+    put('h', 8, 5)                            # episodic stimulation
+    put('i', 10, num_samples)
+    put('i', 16, num_sweeps)
+    put('i', 40, 11)                          # data section block
+    put('i', 92, synch_ptr)
+    put('i', 96, num_sweeps)
+    put('h', 120, num_channels)
+    put('f', 122, 1e6 / (sampling_rate * num_channels))
+    put('i', 138, rows * num_channels)
+    put('f', 244, 10.)
+    put('i', 252, 32768)
+    for ch in range(num_channels):
+        put('h', 378 + 2*ch, ch)
+        put('10s', 442 + 10*ch, 'IN {0}'.format(ch).encode())
+        put('8s', 602 + 8*ch, b'pA' if ch == 0 else b'mV')
+        put('f', 730 + 4*ch, 1.)
+        put('f', 922 + 4*ch, (ch + 1) * 1e-3)
+        put('f', 986 + 4*ch, offsets[ch])
+        put('f', 1050 + 4*ch, 1.)
+        put('f', 4576 + 4*ch, 1.)
+    put('16h', 410, *(list(range(num_channels)) +
+                      [-1] * (16 - num_channels)))
+
+    raw = np.random.randint(-2**15, 2**15, dtype='<i2',
+                            size=(num_sweeps, rows, num_channels))
+    synch = np.zeros(num_sweeps, dtype=[('offset', '<i4'), ('len', '<i4')])
+    synch['offset'] = np.arange(num_sweeps) * rows
+    synch['len'] = rows * num_channels
+
+    with open(filepath, 'wb') as f:
+        f.write(header)
+        f.write(raw.tobytes())
+        f.seek(synch_ptr * 512)
+        f.write(synch.tobytes())
+
+    return raw * gains + offsets
+
+
+_PV_SIGNAL = """    <VRecSignal>
+      <Name>{name}</Name>
+      <Enabled>true</Enabled>
+      <Type>Physical</Type>
+      <PatchclampDevice>{device}</PatchclampDevice>
+      <PatchclampChannel>{channel}</PatchclampChannel>
+      <UnitName>{unit}</UnitName>
+      <Divisor>{divisor}</Divisor>
+    </VRecSignal>
+"""
+
+_PV_XML = """<?xml version="1.0" encoding="utf-8"?>
+<VRecSessionEntry>
+  <DataFile>{datafile}</DataFile>
+  <AssociatedLinescanProfileFile>{lsfile}</AssociatedLinescanProfileFile>
+  <Experiment>
+    <Rate>{rate}</Rate>
+    <AcquisitionTime>{duration}</AcquisitionTime>
+  </Experiment>
+  <SignalList>
+{signals}  </SignalList>
+</VRecSessionEntry>
+"""
+
+
+def mock_pv_folder(folder, rows=20, num_sweeps=3, linescan=False,
+                   num_profiles=2, sampling_rate=10e3, start=1):
+    """
+    Write a folder of PrairieView VoltageRecording xml/csv files (and
+    optionally linescan profile csv files) that can be read back with
+    neurphys.read_pv.import_folder for testing purposes.
+
+    Parameters
+    ----------
+    folder: str
+        Existing folder to write into.
+    rows: int (default: 20)
+    num_sweeps: int (default: 3)
+    linescan: bool (default: False)
+    num_profiles: int (default: 2)
+    sampling_rate: int (default: 10 kHz)
+    start: int (default: 1)
+        Number of the first sweep written, so more sweeps can be appended
+        to an existing folder.
+
+    Return
+    ------
+    data: 3D array
+        Voltage recording values in physical units (after the divisors),
+        shaped (sweeps x samples x channels) for 'primary' and 'secondary'.
+    """
+    divisors = (0.5, 0.02)
+    data = np.random.randn(num_sweeps, rows, 2)
+    time_ms = np.arange(rows) * 1e3 / sampling_rate
+
+    for i in range(num_sweeps):
+        base = 'TSeries-000_Cycle{0:05d}_VoltageRecording_001'.format(
+            start + i)
+        signals = ''.join(_PV_SIGNAL.format(name=name, device=0, channel=ch,
+                                            unit=unit, divisor=divisor)
+                          for ch, (name, unit, divisor) in enumerate(
+                              [('Primary', 'pA', divisors[0]),
+                               ('Secondary', 'mV', divisors[1])]))
+        lsfile = ''
+        if linescan:
+            lsfile = 'TSeries-000_Cycle{0:05d}_LineProfileData.csv'.format(
+                start + i)
+            profiles = {}
+            for prof in range(1, num_profiles + 1):
+                profiles['Prof {0} time(ms)'.format(prof)] = time_ms
+                profiles['Prof {0}'.format(prof)] = np.random.rand(rows)
+            pd.DataFrame(profiles).to_csv(os.path.join(folder, lsfile),
+                                          index=False)
+
+        with open(os.path.join(folder, base + '.xml'), 'w') as f:
+            f.write(_PV_XML.format(datafile=base, lsfile=lsfile,
+                                   rate=int(sampling_rate),
+                                   duration=int(rows / sampling_rate * 1e3),
+                                   signals=signals))
+        csv = pd.DataFrame({'Time(ms)': time_ms,
+                            'Input 0': data[i, :, 0] * divisors[0],
+                            'Input 1': data[i, :, 1] * divisors[1]})
+        csv.to_csv(os.path.join(folder, base + '.csv'), index=False)
+
+    return data
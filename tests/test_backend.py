@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+import neurphys.backend as backend
+import neurphys.oscillation as oscillation
+import neurphys.pacemaking as pace
+import neurphys.smoothing as smoothing
+import neurphys.utilities as util
+
+numba = pytest.importorskip('numba')
+pytestmark = pytest.mark.skipif(backend.numba is None,
+                                reason='numba backend disabled')
+
+
+@pytest.fixture(params=[False, True])
+def kpsh(request):
+    return request.param
+
+
+def _both(monkeypatch, func, *args, **kwargs):
+    """ func's results with the NumPy and with the numba backend """
+    results = []
+    for name in ['numpy', 'numba']:
+        monkeypatch.setattr(backend, 'BACKEND', name)
+        results.append(func(*args, **kwargs))
+    return results
+
+
+def test_detect_peaks(monkeypatch, kpsh):
+    rng = np.random.default_rng(4)
+    x = np.round(rng.normal(size=20000), 1)
+    x[[50, 5000]] = np.nan
+    numpy_peaks, numba_peaks = _both(monkeypatch, pace.detect_peaks, x,
+                                     mph=0.5, mpd=25, kpsh=kpsh)
+    assert numpy_peaks.size > 100
+    assert np.array_equal(numpy_peaks, numba_peaks)
+
+
+@pytest.mark.parametrize('centered', [False, True])
+def test_running_mean(monkeypatch, centered):
+    rng = np.random.default_rng(5)
+    x = rng.normal(size=(3, 5000))
+    x[1, 100] = np.nan
+    numpy_mean, numba_mean = _both(monkeypatch, smoothing.running_mean, x,
+                                   51, centered=centered)
+    assert np.allclose(numpy_mean, numba_mean, equal_nan=True)
+    assert np.isnan(numba_mean[1, 100]).all()
+
+
+def test_epoch_hist_kde(monkeypatch):
+    df = util.mock_multidf(rows=500, num_sweeps=3)
+    df['primary'] = np.random.default_rng(6).normal(size=len(df))
+
+    numpy_df, numba_df = _both(monkeypatch, oscillation.epoch_hist, df, 100,
+                               50, 'primary', -2, 2, 20)
+    pd.testing.assert_frame_equal(numpy_df, numba_df)
+
+    numpy_df, numba_df = _both(monkeypatch, oscillation.epoch_kde, df, 100,
+                               50, 'primary', -2, 2, resolution=50)
+    pd.testing.assert_frame_equal(numpy_df, numba_df)
@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+from scipy.special import gammainc
+import neurphys.bursts as bursts
+
+
+def _train(burst_starts, duration=10., period=0.5, burst_isi=0.02,
+           burst_spikes=5):
+    """ Regular spiking with bursts of burst_spikes spikes """
+    times = [np.arange(0, duration, period)]
+    for start in burst_starts:
+        times.append(start + burst_isi * np.arange(burst_spikes))
+    return np.sort(np.concatenate(times))
+
+
+def _isi_loop(times, onset, offset):
+    """ Reference state machine for isi_bursts """
+    found, start = [], None
+    for i, isi in enumerate(np.diff(times)):
+        if start is None and isi < onset:
+            start = i
+        elif start is not None and isi > offset:
+            found.append((start, i))
+            start = None
+    if start is not None:
+        found.append((start, times.size - 1))
+    return found
+
+
+def test_isi_bursts():
+    rng = np.random.default_rng(3)
+    times = np.cumsum(rng.exponential(0.1, 2000))
+    table = bursts.isi_bursts(times, min_spikes=2)
+    expected = _isi_loop(times, 0.08, 0.16)
+    assert np.allclose(table['onset'], [times[s] for s, _ in expected])
+    assert np.allclose(table['offset'], [times[e] for _, e in expected])
+    assert table['spikes'].tolist() == [e - s + 1 for s, e in expected]
+    assert np.allclose(table['freq'], (table['spikes'] - 1) /
+                       table['duration'])
+
+
+def test_bursts_batched():
+    trains = [_train([2.21, 6.21]), _train([4.21])]
+    spikes = pd.concat([pd.DataFrame({'cell': cell, 'sweep': 'sweep001',
+                                      'time': times})
+                        for cell, times in zip(['a', 'b'], trains)],
+                       ignore_index=True)
+
+    table = bursts.isi_bursts(spikes, onset=0.05, offset=0.1,
+                              by=['cell', 'sweep'])
+    assert table['cell'].tolist() == ['a', 'a', 'b']
+    assert np.allclose(table['onset'], [2.21, 6.21, 4.21])
+    assert table['spikes'].tolist() == [5, 5, 5]
+    assert np.allclose(table['freq'], 50)
+
+    table = bursts.poisson_bursts(spikes, by=['cell', 'sweep'])
+    assert table['cell'].tolist() == ['a', 'a', 'b']
+    assert np.allclose(table['onset'], [2.21, 6.21, 4.21])
+    assert table['spikes'].tolist() == [5, 5, 5]
+    assert (table['surprise'] >= 3).all()
+
+
+def test_poisson_overlap():
+    # candidate at 5.4 s (weak) extends into the one at 5.96 s (strong)
+    times = np.sort(np.concatenate((np.arange(0, 20, 1.),
+                                    5.4 + 0.1 * np.arange(3),
+                                    5.96 + 0.005 * np.arange(6))))
+    table = bursts.poisson_bursts(times, extend=2, by=None)
+    assert np.allclose(table['onset'], [5.96])
+    assert table['spikes'].tolist() == [7]
+    assert (table['surprise'] >= 3).all()
+
+
+def test_poisson_unbounded():
+    # a short run followed by 40 spikes of alternating 1.6 s and 0.2 s
+    # intervals, none of them a candidate on its own
+    tail = 200.35 + np.cumsum(np.tile([1.6, 0.2], 20))
+    times = np.sort(np.concatenate((np.arange(0, 200, 4.),
+                                   200.2 + 0.05 * np.arange(4), tail,
+                                   250 + np.arange(0, 200, 4.))))
+    rate = (times.size - 1) / (times[-1] - times[0])
+    first = np.searchsorted(times, 200.2)
+    # surprise of every burst from the run's first spike to a later spike
+    n = np.arange(2, times.size - first + 1)
+    surprise = -np.log10(gammainc(n, rate * (times[first + n - 1] -
+                                             times[first])))
+
+    table = bursts.poisson_bursts(times, by=None)
+    assert np.allclose(table['onset'], [200.2])
+    assert table['spikes'].tolist() == [n[surprise.argmax()]] == [44]
+    assert np.allclose(table['surprise'], surprise.max())
+
+    # a lookahead shorter than the burst stops at the run
+    table = bursts.poisson_bursts(times, extend=10, by=None)
+    assert table['spikes'].tolist() == [4]
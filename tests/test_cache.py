@@ -0,0 +1,71 @@
+import os
+import numpy as np
+import pandas as pd
+import neurphys.cache as cache
+import neurphys.read_abf as read_abf
+import neurphys.utilities as util
+
+
+def test_save_load_frame(tmp_path):
+    df = util.mock_multidf(rows=30, num_channels=2, num_sweeps=3)
+    cache.save_frame(str(tmp_path), df)
+    loaded = cache.load_frame(str(tmp_path))
+
+    base = loaded.primary.values
+    while base is not None and not isinstance(base, np.memmap):
+        base = base.base
+    assert isinstance(base, np.memmap)
+    pd.testing.assert_frame_equal(loaded, df, check_index_type=False)
+
+
+def test_read_abf_cache(tmp_path):
+    filepath = str(tmp_path / 'mock.abf')
+    cache_dir = str(tmp_path / 'cache')
+    util.mock_abf(filepath, rows=50, num_channels=2, num_sweeps=4)
+
+    cold = read_abf.read_abf(filepath, engine='mmap', cache=cache_dir)
+    warm = read_abf.read_abf(filepath, engine='mmap', cache=cache_dir)
+    pd.testing.assert_frame_equal(warm, cold, check_index_type=False)
+    # entries are kept per engine
+    assert cache.lookup('read_abf:mmap', [filepath], cache_dir) is not None
+    assert cache.lookup('read_abf:neo', [filepath], cache_dir) is None
+
+    # rewriting the file invalidates the entry
+    data = util.mock_abf(filepath, rows=50, num_channels=2, num_sweeps=4)
+    os.utime(filepath, (0, 0))
+    fresh = read_abf.read_abf(filepath, engine='mmap', cache=cache_dir)
+    assert np.allclose(fresh.primary.values, data[:, :, 0].ravel())
+
+
+def test_evict(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    sources = []
+    for i in range(3):
+        filepath = str(tmp_path / 'mock{0}.abf'.format(i))
+        util.mock_abf(filepath)
+        read_abf.read_abf(filepath, engine='mmap', cache=cache_dir)
+        sources.append(filepath)
+
+    cache.evict(cache_dir, max_size=1)
+    assert all(cache.lookup('read_abf:mmap', [source], cache_dir) is None
+               for source in sources)
+
+
+def test_source_sets(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    sources = []
+    for i in range(3):
+        filepath = str(tmp_path / 'mock{0}.csv'.format(i))
+        with open(filepath, 'w') as f:
+            f.write(str(i))
+        sources.append(filepath)
+    df = util.mock_multidf(rows=10, num_sweeps=2)
+
+    # different files of one folder get entries of their own
+    cache.store('test', sources[:2], {'frame': df}, cache_dir=cache_dir)
+    cache.store('test', sources[::2], {'frame': df.iloc[:10]},
+                cache_dir=cache_dir)
+    assert len(cache.lookup('test', sources[:2], cache_dir)['frame']) == 20
+    assert len(cache.lookup('test', sources[::2], cache_dir)['frame']) == 10
+    # in any order
+    assert cache.lookup('test', sources[1::-1], cache_dir) is not None
@@ -1,5 +1,30 @@
+import numpy as np
+import pytest
 import neurphys.oscillation as oscillation
+import neurphys.utilities as util
 
 
 def test_create_epoch():
-    pass
+    df = util.mock_multidf(rows=100, num_sweeps=3)
+    epochs = list(oscillation._create_epoch(df, 20, 10))
+    assert len(epochs) == 3 * 9
+    assert np.array_equal(epochs[10].primary.values,
+                          df.loc['sweep002'].primary.values[10:30])
+
+    # a single, flat sweep
+    epochs = list(oscillation._create_epoch(df.loc['sweep003'], 20, 10))
+    assert len(epochs) == 9
+
+
+def test_epoch_array():
+    df = util.mock_multidf(rows=100, num_sweeps=3)
+    epochs = oscillation._epoch_array(df, 20, 10, 'primary')
+    assert epochs.shape == (3, 9, 20)
+    assert epochs.dtype == np.float64
+    assert np.array_equal(epochs[1, 1],
+                          df.loc['sweep002'].primary.values[10:30])
+
+    # a sweep dropped from the rows but not from the index levels
+    with pytest.raises(KeyError):
+        oscillation._epoch_array(df.drop('sweep002', level=0), 20, 10,
+                                 'primary')
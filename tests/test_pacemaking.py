@@ -0,0 +1,124 @@
+import numpy as np
+import pytest
+import neurphys.pacemaking as pace
+import neurphys.read_abf as read_abf
+import neurphys.utilities as util
+
+
+@pytest.mark.parametrize('kpsh', [False, True])
+def test_mpd_keep_matches_quadratic(kpsh):
+    rng = np.random.default_rng(0)
+    for trial in range(100):
+        n = rng.integers(3, 300)
+        # integer heights give many ties
+        x = rng.integers(0, 5, n).astype(float) if trial % 2 else \
+            rng.normal(size=n)
+        ind = np.sort(rng.choice(n, rng.integers(1, n), replace=False))
+        mpd = int(rng.integers(2, 30))
+        assert np.array_equal(pace._mpd_keep(ind, x[ind], mpd, kpsh),
+                              pace._mpd_keep_quadratic(ind, x[ind], mpd,
+                                                       kpsh))
+
+
+def test_detect_peaks_mpd():
+    x = np.zeros(100)
+    x[[10, 14, 30, 33, 60]] = [2, 3, 1, 1, 5]
+    # equal heights: one of the two survives, both with kpsh
+    assert len(pace.detect_peaks(x, mpd=5)) == 3
+    assert pace.detect_peaks(x, mpd=5, kpsh=True).tolist() == [14, 30, 33,
+                                                                60]
+    x[31] = np.nan
+    assert pace.detect_peaks(x, mpd=5).tolist() == [14, 33, 60]
+
+
+@pytest.mark.parametrize('kwargs', [
+    dict(mpd=1), dict(mpd=20), dict(mpd=20, kpsh=True),
+    dict(mph=0.5, mpd=7, threshold=0.1, edge='both'),
+    dict(mph=0.5, mpd=7, valley=True)])
+def test_peak_detector_matches_detect_peaks(kwargs):
+    rng = np.random.default_rng(1)
+    x = np.round(rng.normal(size=2000), 1)
+    x[[100, 101, 555, 1999]] = np.nan
+    expected = pace.detect_peaks(x, **kwargs)
+    for trial in range(10):
+        detector = pace.PeakDetector(**kwargs)
+        cuts = np.sort(rng.integers(0, x.size, 30))
+        peaks = [detector.update(chunk) for chunk in np.split(x, cuts)]
+        peaks.append(detector.flush())
+        assert np.array_equal(np.concatenate(peaks), expected)
+
+
+def test_iter_freq(tmp_path):
+    filepath = str(tmp_path / 'mock.abf')
+    util.mock_abf(filepath, rows=500, num_sweeps=2)
+    df = read_abf.read_abf(filepath, engine='mmap')
+    frames = read_abf.iter_chunks(filepath, 0.013, 0.002)
+    parts = list(pace.iter_freq(frames, mph=5, mpd=10))
+
+    for k, sweep in enumerate(['sweep001', 'sweep002']):
+        freq, indices, times = pace.calc_freq(
+            df.xs(sweep).reset_index(drop=True), mph=5, mpd=10,
+            ret_indices=True, ret_times=True)
+        sweep_parts = [part for part in parts if part[0] == sweep]
+        assert np.allclose(np.concatenate([p[1] for p in sweep_parts]), freq)
+        assert np.array_equal(np.concatenate([p[2] for p in sweep_parts]),
+                              indices)
+        # iter_chunks times run from the start of the recording
+        assert np.allclose(np.concatenate([p[3] for p in sweep_parts])[1:],
+                           times + 0.05 * k)
+        assert len(indices) > 10
+
+
+@pytest.mark.parametrize('workers', [None, 2])
+def test_spike_table(workers):
+    rng = np.random.default_rng(2)
+    df = util.mock_multidf(rows=300, num_sweeps=6)
+    df['primary'] = np.round(rng.normal(size=len(df)), 1)
+    table = pace.spike_table(df, mph=1, mpd=8, workers=workers)
+
+    assert list(table.columns) == ['sweep', 'index', 'time', 'ISI', 'freq']
+    for sweep, group in table.groupby('sweep'):
+        sub = df.xs(sweep).reset_index(drop=True)
+        freq, indices = pace.calc_freq(sub, mph=1, mpd=8, ret_indices=True)
+        assert np.array_equal(group['index'].values, indices)
+        assert np.allclose(group['time'].values, sub.time.values[indices])
+        assert np.isnan(group['freq'].values[0])
+        assert np.allclose(group['freq'].values[1:], freq)
+
+
+def test_event_waveforms():
+    x = np.arange(50.)
+    waves = pace.event_waveforms(x, [1, 20, 27, 48], 3, 2)
+    assert waves.shape == (4, 6)
+    assert np.array_equal(waves[1], x[17:23])
+    assert np.isnan(waves[0, :2]).all() and waves[0, 2] == 0
+    assert np.isnan(waves[3, -1]) and waves[3, -2] == 49
+
+    # evenly spaced events are a view onto the trace
+    waves = pace.event_waveforms(x, [10, 20, 30], 3, 2)
+    assert np.shares_memory(waves, x)
+    assert np.array_equal(waves[:, 3], [10, 20, 30])
+
+    stats = pace.waveform_stats(waves, pre=3)
+    assert list(stats.index) == [-3, -2, -1, 0, 1, 2]
+    assert np.allclose(stats['mean'], [17, 18, 19, 20, 21, 22])
+    assert np.allclose(stats['var'], 100)
+    assert (stats['n'] == 3).all()
+
+
+def test_iei_waveforms():
+    x = np.arange(100.)
+    x[44] = np.nan
+    peaks = np.array([10, 20, 40, 50])
+    waves = pace.iei_waveforms(x, peaks, 0.5, 1.)
+    assert waves.shape == (3, 10)
+    assert waves[0].compressed().tolist() == list(range(15, 20))
+    assert waves[1].compressed().tolist() == [30, 31, 32, 33, 34, 35, 36, 37,
+                                              38, 39]
+    assert waves[2].compressed().tolist() == [45, 46, 47, 48, 49]
+    assert np.array_equal(waves[:, 0].data,
+                          pace._percent_shift(peaks, [0.5])[0])
+
+    stats = pace.waveform_stats(waves, axis=1)
+    assert stats['n'].tolist() == [5, 10, 5]
+    assert np.allclose(stats['mean'], [17, 34.5, 47])
@@ -1,4 +1,8 @@
+import numpy as np
+import pandas as pd
+import pytest
 import neurphys.read_abf as read_abf
+import neurphys.utilities as util
 
 
 def test_all_strs():
@@ -19,3 +23,181 @@ def test_all_ints():
     assert read_abf._all_ints(('test', 12345)) == False
     assert read_abf._all_ints((54321, 12345))
     assert read_abf._all_ints((43.21, 12.34)) == False
+
+
+def test_read_abf_mmap(tmp_path):
+    filepath = str(tmp_path / 'mock.abf')
+    data = util.mock_abf(filepath, rows=50, num_channels=2, num_sweeps=4)
+    df = read_abf.read_abf(filepath, engine='mmap')
+
+    assert list(df.columns) == ['primary', 'channel_1', 'time']
+    assert list(df.index.levels[0]) == ['sweep001', 'sweep002',
+                                        'sweep003', 'sweep004']
+    assert np.allclose(df.primary.values, data[:, :, 0].ravel())
+    assert np.allclose(df.channel_1.values, data[:, :, 1].ravel())
+    assert np.allclose(df.loc['sweep002'].time.values, np.arange(50) / 10e3)
+
+
+def test_abf_map_views(tmp_path):
+    filepath = str(tmp_path / 'mock.abf')
+    data = util.mock_abf(filepath, rows=50, num_channels=2, num_sweeps=4)
+    abf = read_abf.AbfMap(filepath)
+
+    assert abf.num_sweeps == 4
+    assert abf.sampling_rate == 10e3
+    assert abf.units == ['pA', 'mV']
+    assert isinstance(abf.raw(1), np.memmap)
+    assert np.allclose(abf.sweep(2), data[2])
+    assert np.allclose(abf.sweep(3, channel=1), data[3, :, 1])
+
+
+def test_read_abf_lazy(tmp_path):
+    filepath = str(tmp_path / 'mock.abf')
+    data = util.mock_abf(filepath, rows=50, num_channels=2, num_sweeps=6)
+    sweeps = read_abf.read_abf(filepath, lazy=True)
+
+    assert isinstance(sweeps, read_abf.SweepCollection)
+    assert len(sweeps) == 6
+    assert sweeps.num_channels == 2
+    assert sweeps.sampling_rate == 10e3
+
+    kept = read_abf.keep_sweeps(sweeps, [5, 2])
+    assert kept.sweeps == ['sweep005', 'sweep002']
+    assert np.allclose(kept['sweep005'].primary.values, data[4, :, 0])
+
+    dropped = read_abf.drop_sweeps(sweeps, ['sweep001', 'sweep003'])
+    assert dropped.sweeps == ['sweep002', 'sweep004', 'sweep005', 'sweep006']
+    df = dropped.to_frame()
+    assert list(df.index.levels[0]) == dropped.sweeps
+    assert np.allclose(df.loc['sweep006'].channel_1.values, data[5, :, 1])
+
+
+def test_read_many(tmp_path):
+    paths = [str(tmp_path / 'mock{0}.abf'.format(i)) for i in range(3)]
+    data = [util.mock_abf(path, num_sweeps=2) for path in paths]
+    paths.insert(1, str(tmp_path / 'missing.abf'))
+
+    with pytest.warns(UserWarning):
+        df, failures = read_abf.read_many(paths, workers=2, engine='mmap',
+                                          ret_failures=True)
+
+    assert list(failures) == [paths[1]]
+    assert list(df.index.get_level_values('file').unique()) == \
+        [paths[0], paths[2], paths[3]]
+    assert np.allclose(df.loc[paths[3]].primary.values,
+                       data[2][:, :, 0].ravel())
+
+
+def test_read_abf_raw(tmp_path):
+    filepath = str(tmp_path / 'mock.abf')
+    data = util.mock_abf(filepath, rows=50, num_channels=2, num_sweeps=4)
+    sweeps = read_abf.read_abf(filepath, raw=True)
+
+    assert sweeps.raw(1).dtype == np.int16
+    assert sweeps.abf.nbytes == 4 * 50 * 2 * 2
+    assert np.allclose(sweeps.raw(3) * sweeps.gains + sweeps.offsets,
+                       data[2])
+    assert np.allclose(sweeps['sweep004'].channel_1.values, data[3, :, 1])
+
+    kept = read_abf.keep_sweeps(read_abf.read_abf(filepath, lazy=True),
+                                [2, 3]).load()
+    assert kept.abf.nbytes == 2 * 50 * 2 * 2
+    assert np.allclose(kept.to_frame().primary.values,
+                       data[1:3, :, 0].ravel())
+
+
+def test_iter_chunks(tmp_path):
+    filepath = str(tmp_path / 'mock.abf')
+    data = util.mock_abf(filepath, rows=50, num_channels=2, num_sweeps=2)
+    chunks = list(read_abf.iter_chunks(filepath, 0.002, 0.0005))
+
+    assert [len(chunk) for chunk in chunks] == [20, 25, 15] * 2
+    assert [chunk.attrs['overlap'] for chunk in chunks] == [0, 5, 5] * 2
+    assert chunks[4].attrs['sweep'] == 'sweep002'
+    assert np.isclose(chunks[4].attrs['t0'], 0.005)
+
+    primary = np.concatenate([chunk.primary.values[chunk.attrs['overlap']:]
+                              for chunk in chunks])
+    assert np.allclose(primary, data[:, :, 0].ravel())
+
+
+def test_follow(tmp_path):
+    src = str(tmp_path / 'full.abf')
+    data = util.mock_abf(src, rows=40, num_sweeps=3)
+    with open(src, 'rb') as f:
+        content = f.read()
+    # header plus two and a half sweeps, as during acquisition
+    split = 11 * 512 + 100 * 2 * 2
+    filepath = str(tmp_path / 'live.abf')
+    with open(filepath, 'wb') as f:
+        f.write(content[:split])
+
+    follow = read_abf.follow(filepath, poll_seconds=0.01, timeout=0.1)
+    frames = [next(follow) for _ in range(3)]
+    assert [len(df) for df in frames] == [40, 40, 20]
+    with open(filepath, 'ab') as f:
+        f.write(content[split:])
+    frames += list(follow)
+
+    assert len(frames) == 4
+    last = frames[-1]
+    assert last.attrs['sweep'] == 'sweep003'
+    assert last.index[0] == 20
+    assert np.allclose(last.time.values, np.arange(20, 40) / 10e3)
+    sweep3 = np.vstack([df[['primary', 'channel_1']].values
+                        for df in frames[2:]])
+    assert np.allclose(sweep3, data[2])
+
+
+def test_sweeps_to_array(tmp_path):
+    filepath = str(tmp_path / 'mock.abf')
+    data = util.mock_abf(filepath, rows=30, num_sweeps=4)
+    sweeps = read_abf.keep_sweeps(read_abf.read_abf(filepath, lazy=True),
+                                  ['sweep003', 'sweep001'])
+    arr = sweeps.to_array()
+
+    assert arr.sweeps == ['sweep003', 'sweep001']
+    assert np.allclose(arr.values, data[[2, 0]].transpose(0, 2, 1))
+    assert arr.units == ['pA', 'mV']
+
+
+def test_keep_drop_sweeps_order():
+    df = util.mock_multidf(rows=10, num_sweeps=5)
+
+    kept = read_abf.keep_sweeps(df, [4, 2])
+    assert list(kept.index.get_level_values('sweep').unique()) == \
+        ['sweep004', 'sweep002']
+    assert np.array_equal(kept.primary.values[:10],
+                          df.loc['sweep004'].primary.values)
+
+    dropped = read_abf.drop_sweeps(kept, ['sweep004'])
+    assert np.array_equal(dropped.primary.values,
+                          df.loc['sweep002'].primary.values)
+
+    dropped = read_abf.drop_sweeps(df, [1, 3])
+    assert list(dropped.index.get_level_values('sweep').unique()) == \
+        ['sweep002', 'sweep004', 'sweep005']
+    with pytest.raises(KeyError):
+        read_abf.drop_sweeps(df, [6])
+
+
+def test_keep_drop_sweeps_reordered():
+    df = util.mock_multidf(rows=50, num_sweeps=3)
+    interleaved = df.sort_index(level='index')
+    shuffled = df.sample(frac=1, random_state=0)
+    for frame in [interleaved, shuffled]:
+        kept = read_abf.keep_sweeps(frame, ['sweep001'])
+        pd.testing.assert_frame_equal(kept, frame.loc[['sweep001']])
+        # the remaining sweeps in the order they first appear
+        order = [name for name in frame.index.unique(level='sweep')
+                 if name != 'sweep002']
+        dropped = read_abf.drop_sweeps(frame, ['sweep002'])
+        pd.testing.assert_frame_equal(dropped, frame.loc[order])
+
+    # stale sweep rows whose end points still match the shuffled codes
+    df = util.mock_multidf(rows=4, num_sweeps=2)
+    df.attrs['sweep_rows'] = (0, 4, 8)
+    shuffled = df.iloc[[0, 4, 5, 1, 6, 2, 3, 7]]
+    shuffled.attrs['sweep_rows'] = (0, 4, 8)
+    kept = read_abf.keep_sweeps(shuffled, ['sweep002'])
+    pd.testing.assert_frame_equal(kept, shuffled.loc[['sweep002']])
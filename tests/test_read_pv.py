@@ -0,0 +1,163 @@
+import os
+import numpy as np
+import pandas as pd
+import neurphys.read_pv as read_pv
+import neurphys.utilities as util
+
+
+def test_import_folder(tmp_path):
+    folder = str(tmp_path)
+    data = util.mock_pv_folder(folder, rows=50, num_sweeps=3, linescan=True)
+    output = read_pv.import_folder(folder)
+
+    df = output['voltage recording']
+    assert list(df.columns) == ['time', 'primary', 'secondary']
+    assert np.allclose(df.primary.values, data[:, :, 0].ravel())
+    assert output['linescan'].shape == (150, 4)
+    assert output['file attributes']['File2']['sampling'] == 10000
+
+
+def test_import_folder_typed(tmp_path):
+    folder = str(tmp_path)
+    data = util.mock_pv_folder(folder, rows=50, num_sweeps=2)
+    df = read_pv.import_folder(folder, dtype='float32', usecols=['primary'],
+                               time=False)['voltage recording']
+
+    assert list(df.columns) == ['primary']
+    assert df.primary.dtype == np.float32
+    assert np.allclose(util.time_values(df.loc['sweep002']),
+                       np.arange(50) / 10e3)
+
+
+def test_convert_folder(tmp_path):
+    folder = str(tmp_path)
+    data = util.mock_pv_folder(folder, rows=50, num_sweeps=3, linescan=True)
+    parsed = read_pv.import_folder(folder)
+    read_pv.convert_folder(folder)
+    assert os.path.isdir(os.path.join(folder, read_pv.BINARY_DIR))
+
+    converted = read_pv.import_folder(folder)
+    df = converted['voltage recording']
+    assert df.primary.dtype == np.float32
+    assert np.allclose(df.values, parsed['voltage recording'].values,
+                       atol=1e-6)
+    pd.testing.assert_frame_equal(converted['linescan'], parsed['linescan'],
+                                  check_index_type=False)
+    assert converted['file attributes'] == parsed['file attributes']
+
+    # a conversion of some channels doesn't serve requests for all of them
+    read_pv.convert_folder(folder, usecols=['primary'])
+    df = read_pv.import_folder(folder)['voltage recording']
+    assert list(df.columns) == list(parsed['voltage recording'].columns)
+    assert df.primary.dtype == np.float64
+    df = read_pv.import_folder(folder, usecols=['primary'])[
+        'voltage recording']
+    assert list(df.columns) == ['time', 'primary']
+    assert df.primary.dtype == np.float32
+
+    # new files make the conversion stale, so the csv files are parsed
+    util.mock_pv_folder(folder, rows=50, num_sweeps=1, start=4)
+    df = read_pv.import_folder(folder)['voltage recording']
+    assert df.primary.dtype == np.float64
+    assert len(df) == 200
+
+
+def test_import_folder_incremental(tmp_path):
+    folder = str(tmp_path)
+    first = util.mock_pv_folder(folder, rows=50, num_sweeps=3, linescan=True)
+    output = read_pv.import_folder(folder, workers=2)
+
+    second = util.mock_pv_folder(folder, rows=50, num_sweeps=2,
+                                 linescan=True, start=4)
+    output = read_pv.import_folder(folder, previous=output)
+    df = output['voltage recording']
+    assert list(df.index.get_level_values('sweep').unique()) == \
+        ['sweep{0:03d}'.format(i) for i in range(1, 6)]
+    assert np.allclose(df.primary.values,
+                       np.concatenate([first, second])[:, :, 0].ravel())
+    assert len(output['linescan']) == 250
+    assert output['file attributes']['File5']['xml file'].endswith(
+        'Cycle00005_VoltageRecording_001.xml')
+    assert util.sweep_rows(df)[1][-1].tolist() == [200, 250]
+
+    assert read_pv.import_folder(folder, previous=output) is output
+
+
+def test_parse_xml_cache(tmp_path, monkeypatch):
+    calls = []
+    stream_xml = read_pv._stream_xml
+    monkeypatch.setattr(read_pv, '_stream_xml',
+                        lambda filename: calls.append(filename) or
+                        stream_xml(filename))
+    folder = str(tmp_path)
+    util.mock_pv_folder(folder, num_sweeps=1, linescan=True)
+    xml = os.path.join(folder,
+                       'TSeries-000_Cycle00001_VoltageRecording_001.xml')
+
+    attr = read_pv.parse_xml(xml, use_cache=False)
+    assert attr['channels'] == ['primary', 'secondary']
+    assert attr['divisors'] == {'primary': 0.5, 'secondary': 0.02}
+    assert attr['sampling'] == 10000
+    assert attr['linescan file'] == 'TSeries-000_Cycle00001_LineProfileData.csv'
+
+    cached = read_pv.parse_xml(xml)
+    cached['channels'].append('changed')
+    assert read_pv.parse_xml(xml) == attr
+    # the warm lookup doesn't read the file again
+    assert len(calls) == 2
+
+    with open(xml) as f:
+        text = f.read()
+    with open(xml, 'w') as f:
+        f.write(text.replace('<Rate>10000</Rate>', '<Rate>20000</Rate>'))
+    assert read_pv.parse_xml(xml)['sampling'] == 20000
+
+
+def test_linescan_compact(tmp_path):
+    folder = str(tmp_path)
+    util.mock_pv_folder(folder, rows=50, num_sweeps=3, linescan=True)
+    df = read_pv.import_folder(folder)['linescan']
+    ls = read_pv.import_folder(folder, compact=True)['linescan']
+
+    assert ls.values.shape == (3, 2, 50)
+    assert ls.values.flags['C_CONTIGUOUS']
+    # all profiles share the mock time vector, so it is stored once
+    assert ls.time.shape == (50,)
+    assert np.allclose(ls.profile(2, 'sweep002'),
+                       df.loc['sweep002', 'Prof 2'].values)
+    assert np.shares_memory(ls.profile(1), ls.values)
+    pd.testing.assert_frame_equal(ls.to_frame(), df)
+
+    from_frame = read_pv.Linescan.from_frame(df)
+    assert np.array_equal(from_frame.values, ls.values)
+
+    second = read_pv.Linescan.concat([ls, ls], ls.sweeps * 2)
+    assert second.values.shape == (6, 2, 50)
+    assert second.time.shape == (50,)
+
+
+def test_follow(tmp_path):
+    folder = str(tmp_path)
+    data = util.mock_pv_folder(folder, rows=50, num_sweeps=1)
+    csv = os.path.join(folder,
+                       'TSeries-000_Cycle00001_VoltageRecording_001.csv')
+    with open(csv) as f:
+        lines = f.readlines()
+    # header, 30 rows and part of the next one
+    with open(csv, 'w') as f:
+        f.writelines(lines[:31] + [lines[31][:5]])
+
+    follow = read_pv.follow(folder, poll_seconds=0.01, timeout=0.1,
+                            time=False)
+    first = next(follow)
+    assert len(first) == 30
+    with open(csv, 'w') as f:
+        f.writelines(lines)
+    rest = list(follow)
+
+    assert len(rest) == 1
+    assert rest[0].index[0] == 30
+    assert rest[0].attrs['sweep'] == 'sweep001'
+    df = pd.concat([first] + rest)
+    assert np.allclose(df.primary.values, data[0, :, 0])
+    assert np.allclose(util.time_values(rest[0]), np.arange(30, 50) / 10e3)
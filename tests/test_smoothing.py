@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+import neurphys.smoothing as smoothing
+import neurphys.utilities as util
+
+
+def test_running_filters():
+    data = np.random.randn(500)
+    rolling = pd.Series(data).rolling(11)
+    assert np.allclose(smoothing.running_mean(data, 11), rolling.mean(),
+                       equal_nan=True)
+    assert np.allclose(smoothing.running_median(data, 11), rolling.median(),
+                       equal_nan=True)
+    centered = pd.Series(data).rolling(11, center=True).median()
+    assert np.allclose(smoothing.running_median(data, 11, centered=True),
+                       centered, equal_nan=True)
+
+    # leading nans stay nan, as in simple_smoothing
+    data[:5] = np.nan
+    assert np.isnan(util.simple_smoothing(data, 11)[:15]).all()
+    assert not np.isnan(util.simple_smoothing(data, 11)[15:]).any()
+
+
+def test_savgol_2d_out():
+    from scipy.signal import savgol_filter
+    data = np.random.randn(3, 200)
+    out = np.empty((200, 3))
+    result = smoothing.savgol(data.T, 11, 3, axis=0, out=out)
+    assert result is out
+    assert np.allclose(out[5:-5].T, savgol_filter(data, 11, 3)[:, 5:-5])
+    assert np.isnan(out[:5]).all() and np.isnan(out[-5:]).all()
+
+
+@pytest.mark.parametrize('method', ['mean', 'median', 'savgol'])
+@pytest.mark.parametrize('centered', [False, True])
+def test_smoother_chunks(method, centered):
+    data = np.random.randn(2, 1000)
+    data[1, 300] = np.nan
+    smoother = smoothing.Smoother(method, 11, centered=centered)
+    parts = [smoother.update(data[:, first:first + size]) for first, size in
+             [(0, 4), (4, 1), (5, 300), (305, 695)]]
+    parts.append(smoother.flush())
+
+    full = smoothing._FILTERS[method](data, 11, centered=centered)
+    assert np.allclose(np.concatenate(parts, axis=-1), full, equal_nan=True)
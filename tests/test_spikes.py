@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import neurphys.spikes as spikes
+
+
+def _ap_trace(troughs, period=200):
+    """ Triangular spikes on a -50 mV baseline, 10 kHz """
+    trace = np.full(len(troughs) * period, -50.)
+    for i, trough in enumerate(troughs):
+        # 80 mV/ms rise, -50 mV/ms decay to -70 mV
+        shape = np.hstack((np.linspace(-50, 30, 11),
+                           np.linspace(30, -70, 21)[1:],
+                           np.linspace(-70, trough, 11)[1:],
+                           np.linspace(trough, -50, 41)[1:]))
+        trace[i*period + 10:i*period + 10 + shape.size] = shape
+    return trace
+
+
+def test_ap_features():
+    trace = _ap_trace([-70] * 5)
+    df = pd.DataFrame({'primary': trace,
+                       'time': np.arange(trace.size) / 10e3})
+    features = spikes.ap_features(df, mph=0, mpd=10, block=2)
+
+    assert features['index'].tolist() == [20, 220, 420, 620, 820]
+    assert np.allclose(features['threshold'], -50)
+    assert np.allclose(features['threshold_time'], -0.001)
+    assert np.allclose(features['amplitude'], 80)
+    assert np.allclose(features['half_width'], 0.0013)
+    assert np.allclose(features['max_rise'], 80)
+    assert np.allclose(features['max_decay'], -50)
+    assert np.allclose(features['ahp'], 20)
+    assert np.allclose(features['ahp_latency'], 0.002)
+
+
+def test_ap_features_sweeps():
+    trace = _ap_trace([-70, -90], period=150)
+    df = pd.DataFrame({'primary': np.tile(trace, 3),
+                       'time': np.tile(np.arange(trace.size) / 10e3, 3)},
+                      index=pd.MultiIndex.from_product(
+                          [['sweep001', 'sweep002', 'sweep003'],
+                           range(trace.size)], names=['sweep', 'index']))
+    features = spikes.ap_features(df, mph=0, mpd=10, post=0.02)
+
+    assert features['sweep'].tolist() == ['sweep001', 'sweep001',
+                                          'sweep002', 'sweep002',
+                                          'sweep003', 'sweep003']
+    assert np.allclose(features['amplitude'], 80)
+    # the AHP search stops before the next spike
+    assert np.allclose(features['ahp'], [20, 40] * 3)
+    assert np.allclose(features['ahp_latency'], [0.002, 0.003] * 3)
+
+
+def test_ap_features_smooth():
+    # Gaussian spikes at 20 kHz: dV/dt drops below dvdt just before the peak
+    time = np.arange(4000) / 20e3
+    trace = np.full(time.size, -60.)
+    for peak in [0.02, 0.07, 0.12, 0.17]:
+        trace += 100 * np.exp(-0.5 * ((time - peak) / 0.0005)**2)
+    df = pd.DataFrame({'primary': trace, 'time': time})
+    features = spikes.ap_features(df, mph=0, mpd=10)
+
+    slope = np.diff(trace[340:401]) * 20
+    assert slope[-1] < 20
+    slow = np.flatnonzero(slope < 20)
+    # first sample of the last run of slopes above 20 mV/ms
+    threshold = trace[340 + slow[-2] + 1]
+    assert np.allclose(features['threshold'], threshold)
+    assert np.allclose(features['amplitude'], 40 - threshold)
+    half = (threshold + (40 - threshold) / 2 + 60) / 100
+    assert np.allclose(features['half_width'],
+                       2 * 0.0005 * np.sqrt(-2 * np.log(half)), atol=1e-5)
+    assert features[['max_rise', 'ahp']].notna().all().all()
@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+import neurphys.pacemaking as pace
+import neurphys.utilities as util
+from neurphys.sweeparray import SweepArray
+
+
+def test_frame_round_trip():
+    data = np.random.randn(4, 2, 100)
+    arr = SweepArray(data, 10e3, units=['pA', 'mV'])
+    assert np.array_equal(arr.values, data)
+    assert arr.channel('channel_1').flags['C_CONTIGUOUS']
+
+    df = arr.to_frame()
+    assert list(df.columns) == ['primary', 'channel_1']
+    assert np.shares_memory(df.primary.values, arr.values)
+    assert np.allclose(df.loc['sweep002'].primary, data[1, 0])
+    assert np.allclose(util.time_values(df.loc['sweep002']),
+                       np.arange(100) / 10e3)
+
+    back = SweepArray.from_frame(df)
+    assert np.shares_memory(back.values, arr.values)
+    assert back.sweeps == arr.sweeps
+
+    # unequal sweeps are padded
+    short = util.take_sweeps(util.mock_multidf(rows=100, num_sweeps=2),
+                             ['sweep001', 'sweep002']).iloc[:150]
+    padded = SweepArray.from_frame(short)
+    assert list(padded.lengths) == [100, 50]
+    assert np.isnan(padded.channel()[1, 50:]).all()
+    assert padded.sweep('sweep002').shape == (padded.num_channels, 50)
+
+
+def test_analysis_accepts_sweep_array():
+    df = util.mock_multidf(rows=100, num_sweeps=3)
+    arr = SweepArray.from_frame(df, channels=['primary', 'channel_1'])
+    windows = [(0.001, 0.005)]
+    pd.testing.assert_frame_equal(util.measure_windows(arr, windows),
+                                  util.measure_windows(df, windows))
+
+    sweep = arr.select(['sweep002'])
+    peak = util.find_peak(sweep, 0.001, 0.005, 'max')
+    assert np.isclose(peak['Peak Amp'].values[0],
+                      df.loc['sweep002'].primary.values[10:51].max())
+    assert np.allclose(pace.calc_freq(sweep, 0, 2),
+                       pace.calc_freq(df.loc['sweep002'], 0, 2))
+
+
+def test_baseline_sweep_array():
+    df = util.mock_multidf(rows=100, num_sweeps=3)
+    arr = SweepArray.from_frame(df, channels=['primary', 'channel_1'])
+
+    for per_sweep in [False, True]:
+        based = util.baseline(arr, 0.001, 0.005, per_sweep=per_sweep)
+        assert isinstance(based, SweepArray)
+        expected = util.baseline(df.copy(), 0.001, 0.005,
+                                 per_sweep=per_sweep)
+        assert np.allclose(based.channel().ravel(), expected.primary)
+        assert np.array_equal(based.channel('channel_1'),
+                              arr.channel('channel_1'))
+
+    # smoothed sweep by sweep, as a single sweep frame is
+    based = pace.baseline_pacemaking(arr, n=10)
+    assert isinstance(based, SweepArray)
+    sweep = pace.baseline_pacemaking(df.loc['sweep002'].copy(), n=10)
+    assert np.allclose(based.channel()[1], sweep.primary)
@@ -0,0 +1,105 @@
+import numpy as np
+import neurphys.utilities as util
+
+
+def test_time_window():
+    df = util.mock_multidf(rows=100, num_sweeps=2)
+    sweep = df.loc['sweep002']
+    implicit = util.mock_multidf(rows=100, num_sweeps=2,
+                                 time=False).loc['sweep002']
+
+    for start, end in [(0.001, 0.0025), (-1, 0.0005), (0.0099, 1)]:
+        mask = (sweep.time >= start) & (sweep.time <= end)
+        expected = np.flatnonzero(mask.values)
+        assert np.array_equal(
+            np.arange(100)[util.time_window(sweep, start, end)], expected)
+        assert np.array_equal(
+            np.arange(100)[util.time_window(implicit, start, end)], expected)
+
+    assert np.allclose(util.time_values(implicit), sweep.time.values)
+    # slicing keeps the time axis of the remaining rows
+    assert np.allclose(util.time_values(implicit.iloc[40:]),
+                       sweep.time.values[40:])
+
+
+def test_find_peak_implicit_time():
+    df = util.mock_multidf(rows=100, num_sweeps=1).loc['sweep001']
+    implicit = df.drop(columns='time')
+
+    peak = util.find_peak(df, 0.002, 0.006, 'max')
+    peak_implicit = util.find_peak(implicit, 0.002, 0.006, 'max')
+    assert np.allclose(peak.values, peak_implicit.values)
+    assert peak['Peak Amp'].values[0] == df.primary.values[20:61].max()
+
+
+def test_measure_windows():
+    df = util.mock_multidf(rows=100, num_sweeps=3)
+    windows = {'early': (0.001, 0.003), 'late': (0.005, 0.009)}
+    table = util.measure_windows(df, windows, 'max', bsl_window=(0, 0.001))
+
+    assert len(table) == 6
+    assert list(table.window[:3]) == ['early'] * 3
+    for row in table.itertuples():
+        sweep = df.loc[row.sweep]
+        bsl = sweep.primary.values[:11].mean()
+        peak = util.find_peak(sweep, *windows[row.window], sign='max')
+        assert np.isclose(row.Baseline, bsl)
+        assert np.isclose(row._5, peak['Peak Amp'].values[0] - bsl)
+        assert np.isclose(row._6, peak['Peak time'].values[0])
+
+    # unequal sweeps are padded and measured over their own samples
+    short = util.take_sweeps(df, ['sweep001', 'sweep002']).iloc[:150]
+    names, values, time = util.sweep_matrix(short)
+    assert values.shape == (2, 100) and np.isnan(values[1, 50:]).all()
+    table = util.measure_windows(short, [(0.004, 0.009)])
+    assert np.isclose(table.Mean[1], short.primary.values[140:150].mean())
+
+    util.baseline(df, 0, 0.001, per_sweep=True)
+    assert np.allclose(df.primary.values.reshape(3, 100)[:, :11].mean(1), 0)
+
+
+def test_find_peak_refine():
+    time = np.arange(200) / 10e3
+    df = util.mock_multidf(rows=200, num_sweeps=1).loc['sweep001']
+    # parabola peaking between samples
+    df['primary'] = 5 - 1e6 * (time - 0.01013)**2
+
+    peak = util.find_peak(df, 0, 0.02, 'max')
+    assert peak.index[0] == 101
+    assert peak['Peak Amp'].values[0] == df.primary.values[101]
+
+    refined = util.find_peak(df, 0, 0.02, 'max', refine=True)
+    assert np.isclose(refined['Peak time'].values[0], 0.01013)
+    assert np.isclose(refined['Peak Amp'].values[0], 5)
+
+
+def test_fit_decays():
+    time = np.arange(1000) / 10e3
+    df = util.mock_multidf(rows=1000, num_sweeps=3)
+    taus = [(0.002, 0.01), (0.003, 0.012), (0.002, 0.015)]
+    for i, (fast, slow) in enumerate(taus):
+        decay = -20*np.exp(-time/fast) - 10*np.exp(-time/slow)
+        df.loc['sweep00{0}'.format(i + 1), 'primary'] = \
+            np.hstack([np.zeros(100), decay[:900]])
+
+    peaks = util.measure_windows(df, [(0.005, 0.02)])
+    segments = util.decay_segments(df, peaks)
+    fits = util.fit_decays(segments, warm_start=True)
+
+    assert fits.converged.all()
+    assert np.allclose(fits.tau1, [fast for fast, _ in taus], rtol=1e-3)
+    assert np.allclose(fits.tau2, [slow for _, slow in taus], rtol=1e-3)
+    assert (fits.nfev > 0).all()
+    assert np.allclose(fits.tau, util.fit_decays(segments, workers=2).tau)
+
+
+def test_time_window_sweeps():
+    df = util.mock_multidf(rows=100, num_sweeps=3)
+    implicit = util.mock_multidf(rows=100, num_sweeps=3, time=False)
+
+    for start, end in [(0.001, 0.0025), (-1, 0.0005), (0.0099, np.inf)]:
+        expected = np.flatnonzero(((df.time >= start) &
+                                   (df.time <= end)).values)
+        assert np.array_equal(util.time_window(df, start, end), expected)
+        assert np.array_equal(util.time_window(implicit, start, end),
+                              expected)